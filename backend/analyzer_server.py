@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# backend/analyzer_server.py
+
+import asyncio
+import logging
+
+from services.analyzers import serve_analyzer, ANALYZER_SOCKET
+
+# Сервер анализа изображений для бэкенда ANALYZER_BACKEND=socket
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    print(f"🧠 Сервер анализа изображений: {ANALYZER_SOCKET}")
+    try:
+        asyncio.run(serve_analyzer(ANALYZER_SOCKET))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
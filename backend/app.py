@@ -1,14 +1,26 @@
 # backend/app.py
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-import os
 
-from database import engine, Base
+from database import SessionLocal, engine, sync_schema
 from routers import auth_router, scan_router, subscription_router, literature_router, history_router
+from services.scan_queue import worker_pool, SCAN_WORKERS
+from services.counters import reconcile_counters
+from services.events import scan_event_poller
+from services.conditions import condition_catalog, sync_conditions
+from services.history_buffer import history_buffer
+from services.literature_search import ensure_search_index
+from services.literature_storage import compress_existing
+from services.literature_tags import sync_literature_tags
+from services.literature_recommendations import related_literature
+from services.suggest_index import suggest_index
+from services.subscriptions import subscription_scheduler
+from services.entitlements import REFRESHED_TOKEN_HEADER
 
-# Создание таблиц в базе данных
-Base.metadata.create_all(bind=engine)
+# Создание таблиц и индексов в базе данных
+sync_schema()
+# Полнотекстовый индекс литературы (SQLite FTS5)
+ensure_search_index(engine)
 
 # Создание приложения FastAPI
 app = FastAPI(
@@ -31,6 +43,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Обновленный токен с claim о подписке (services/entitlements.py)
+    expose_headers=[REFRESHED_TOKEN_HEADER],
 )
 
 # Подключение роутеров
@@ -40,12 +54,87 @@ app.include_router(subscription_router.router)
 app.include_router(literature_router.router)
 app.include_router(history_router.router)
 
-# Статические файлы для загруженных изображений
-upload_dir = "uploads"
-if not os.path.exists(upload_dir):
-    os.makedirs(upload_dir)
+# Загруженные изображения не раздаются как статические файлы: имена файлов -
+# хэши содержимого, и по известному снимку можно было бы проверить, загружал
+# ли его кто-то. Изображение скана отдается владельцу через GET /api/scan/{id}/image
 
-app.mount("/uploads", StaticFiles(directory=upload_dir), name="uploads")
+# Исправление расхождений счетчиков пользователей после сбоев
+@app.on_event("startup")
+def reconcile_user_counters():
+    db = SessionLocal()
+    try:
+        reconcile_counters(db)
+        db.commit()
+    finally:
+        db.close()
+
+# Заполнение каталога состояний и его загрузка в память
+@app.on_event("startup")
+def load_condition_catalog():
+    db = SessionLocal()
+    try:
+        sync_conditions(db)
+    finally:
+        db.close()
+
+# Сжатие больших текстов статей и перенос тегов статей, сохраненных раньше
+@app.on_event("startup")
+def migrate_literature():
+    db = SessionLocal()
+    try:
+        compress_existing(db)
+        sync_literature_tags(db)
+    finally:
+        db.close()
+
+# Индекс подсказок по литературе и состояниям
+@app.on_event("startup")
+def build_suggest_index():
+    db = SessionLocal()
+    try:
+        suggest_index.build(db)
+    finally:
+        db.close()
+
+# Рекомендации литературы к состояниям (пересчитываются при изменении литературы)
+@app.on_event("startup")
+def build_related_literature():
+    db = SessionLocal()
+    try:
+        related_literature.refresh(db, condition_catalog.names(db))
+    finally:
+        db.close()
+
+# Пул воркеров обработки сканирований
+# При запуске нескольких процессов uvicorn установите SCAN_WORKERS=0
+# и запускайте воркеры отдельно: python scan_worker.py
+@app.on_event("startup")
+async def start_scan_workers():
+    if SCAN_WORKERS > 0:
+        worker_pool.start()
+    else:
+        # Воркеры отдельно: завершения сканов для подписчиков читаются из базы данных
+        scan_event_poller.start()
+
+@app.on_event("shutdown")
+async def stop_scan_workers():
+    await scan_event_poller.stop()
+    worker_pool.stop()
+
+# Окончание и автопродление подписок
+# (SUBSCRIPTION_SCHEDULER_INTERVAL=0 - не запускать в этом процессе)
+@app.on_event("startup")
+def start_subscription_scheduler():
+    subscription_scheduler.start()
+
+@app.on_event("shutdown")
+def stop_subscription_scheduler():
+    subscription_scheduler.stop()
+
+# Запись накопленной истории запросов перед остановкой
+@app.on_event("shutdown")
+def flush_query_history():
+    history_buffer.close()
 
 # Корневой маршрут
 @app.get("/")
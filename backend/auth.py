@@ -1,18 +1,16 @@
 # backend/auth.py
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
-import json
-import hashlib
-import hmac
-from urllib.parse import parse_qsl
 import os
 
-from models import User
 from database import get_db
+from services.user_cache import UserSnapshot, user_cache
+from services.entitlements import REFRESHED_TOKEN_HEADER, Entitlement, entitlement_claim, resolve_entitlement
+from services.telegram_init_data import telegram_verifier
 
 # JWT конфигурация
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-in-production")
@@ -21,13 +19,19 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 дней
 
 security = HTTPBearer()
 
-def create_access_token(data: Dict[str, Any]) -> str:
-    """Создание JWT токена"""
+def create_access_token(data: Dict[str, Any], entitlement: Optional[Entitlement] = None) -> str:
+    """Создание JWT токена (с claim о подписке, если передан entitlement)"""
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    if entitlement is not None:
+        to_encode["ent"] = entitlement_claim(entitlement)
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def reissue_token(claims: Dict[str, Any], entitlement: Entitlement) -> str:
+    """Тот же токен (и срок действия) с новым claim о подписке"""
+    return jwt.encode({**claims, "ent": entitlement_claim(entitlement)}, SECRET_KEY, algorithm=ALGORITHM)
+
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
     """Проверка JWT токена"""
     try:
@@ -38,95 +42,97 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
 
 def validate_telegram_data(init_data: str, bot_token: str) -> Optional[Dict[str, Any]]:
     """
-    Проверяет подпись initData от Telegram Web App.
+    Проверяет подпись и срок initData от Telegram Web App.
     Возвращает данные пользователя или None.
     """
-    try:
-        params = dict(parse_qsl(init_data))
-    except Exception:
-        return None
+    return telegram_verifier(bot_token).verify(init_data)
 
-    hash_val = params.pop('hash', None)
-    if not hash_val:
-        return None
-
-    # Сортируем параметры по ключу
-    sorted_params = sorted(params.items())
-    data_check_string = '\n'.join([f"{k}={v}" for k, v in sorted_params])
-
-    # Создаём secret_key = HMAC-SHA256("WebAppBotToken", bot_token)
-    secret_key = hmac.new(b"WebAppBotToken", bot_token.encode(), hashlib.sha256).digest()
-
-    # Вычисляем хэш
-    calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+def _user_from_token(token: str, db: Session, request: Optional[Request] = None) -> Optional[UserSnapshot]:
+    """
+    Пользователь по JWT токену из кэша пользователей.
+    С request результат запоминается на время запроса: повторные зависимости
+    с тем же токеном не декодируют его заново.
+    """
+    memo = getattr(request.state, "auth_user", None) if request is not None else None
+    if memo is not None and memo[0] == token:
+        return memo[1]
 
-    if calculated_hash != hash_val:
-        return None
+    payload = verify_token(token)
+    user_id = payload.get("user_id") if payload is not None else None
+    user = user_cache.get(db, user_id) if user_id is not None else None
+    if request is not None:
+        request.state.auth_user = (token, user, payload)
+    return user
 
-    # Парсим данные пользователя
-    user_str = params.get("user")
-    if not user_str:
-        return None
+def token_claims(request: Request) -> Optional[Dict[str, Any]]:
+    """Claims токена, по которому в этом запросе определен пользователь"""
+    memo = getattr(request.state, "auth_user", None)
+    return memo[2] if memo is not None else None
 
-    try:
-        user_data = json.loads(user_str)
-        return {
-            "user": user_data,
-            "auth_date": params.get("auth_date"),
-            "hash": hash_val
-        }
-    except json.JSONDecodeError:
-        return None
+def current_entitlement(request: Request, response: Response, user: UserSnapshot, db: Session) -> Entitlement:
+    """
+    Подписка пользователя по claim токена запроса. База данных читается,
+    только если claim устарел; тогда обновленный токен возвращается в заголовке ответа.
+    """
+    claims = token_claims(request)
+    entitlement, stale = resolve_entitlement(db, user, claims)
+    if stale and claims is not None:
+        response.headers[REFRESHED_TOKEN_HEADER] = reissue_token(claims, entitlement)
+    return entitlement
 
 def get_current_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
-) -> User:
+) -> UserSnapshot:
     """Получение текущего пользователя из JWT токена"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    token = credentials.credentials
-    payload = verify_token(token)
-    
-    if payload is None:
-        raise credentials_exception
-    
-    user_id: int = payload.get("user_id")
-    if user_id is None:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.id == user_id).first()
+    user = _user_from_token(credentials.credentials, db, request)
     if user is None:
-        raise credentials_exception
-    
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 security_optional = HTTPBearer(auto_error=False)
 
 def get_current_user_optional(
+    request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_optional),
     db: Session = Depends(get_db)
-) -> Optional[User]:
+) -> Optional[UserSnapshot]:
     """Получение текущего пользователя (опционально)"""
     if credentials is None:
         return None
     
     try:
-        token = credentials.credentials
-        payload = verify_token(token)
-        
-        if payload is None:
-            return None
-        
-        user_id: int = payload.get("user_id")
-        if user_id is None:
-            return None
-        
-        user = db.query(User).filter(User.id == user_id).first()
-        return user
+        return _user_from_token(credentials.credentials, db, request)
     except Exception:
-        return None
\ No newline at end of file
+        return None
+
+def get_user_by_token(token: str, db: Session) -> Optional[UserSnapshot]:
+    """Получение пользователя по JWT токену"""
+    return _user_from_token(token, db)
+
+def get_current_user_stream(
+    request: Request,
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_optional),
+    db: Session = Depends(get_db)
+) -> UserSnapshot:
+    """
+    Получение текущего пользователя для потоковых эндпоинтов.
+    EventSource в браузере не умеет передавать заголовки,
+    поэтому токен можно передать и параметром ?token=
+    """
+    if credentials is not None:
+        token = credentials.credentials
+    user = _user_from_token(token, db, request) if token else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
@@ -0,0 +1,132 @@
+# backend/benchmarks/bench_literature_storage.py
+# Список статей и открытие статьи на синтетическом корпусе: прежний
+# вариант (content загружается вместе со списком и хранится как есть)
+# против отложенного и сжатого content (services/literature_storage.py).
+# Для каждого варианта создается отдельная база SQLite во временном каталоге;
+# память - пик выделений Python (tracemalloc) во время запроса,
+# измеряется отдельным запуском, чтобы не искажать время.
+#
+# Запуск из каталога backend:
+#     python benchmarks/bench_literature_storage.py [--articles 10000] [--size 8000]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, undefer_group
+
+from models import Base, Literature
+from services import literature_storage
+from services.literature_storage import literature_content
+
+WORDS = (
+    "пациент диагностика лечение симптомы аллергия реакция кожа глаз воспаление "
+    "препарат дозировка врач обследование анализ инфекция отек зуд покраснение "
+    "рекомендации профилактика осложнения терапия хронический острый укус насекомое"
+).split()
+
+def make_article(rng: random.Random, size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+def make_database(path: str, articles: int, size: int, compress: bool):
+    # Без сжатия - как до появления content_zlib
+    literature_storage.LITERATURE_COMPRESS_MIN_BYTES = 2048 if compress else 2 ** 62
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    rng = random.Random(0)
+    for start in range(0, articles, 1000):
+        session.add_all([
+            Literature(
+                title=f"Статья {i}",
+                description=make_article(rng, 200),
+                content=make_article(rng, size),
+                category=f"Категория {i % 10}",
+                author="Автор",
+                is_active=True
+            )
+            for i in range(start, min(start + 1000, articles))
+        ])
+        session.commit()
+    session.close()
+    return engine
+
+def measure(func, repeat: int):
+    """Медиана времени (мс) и пик памяти (МБ)"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sorted(timings)[len(timings) // 2], peak / 1024 / 1024
+
+def run_case(engine, eager_content: bool, repeat: int, articles: int):
+    Session = sessionmaker(bind=engine)
+
+    def list_query(limit):
+        def run():
+            session = Session()
+            query = session.query(Literature).filter(Literature.is_active == True)
+            if eager_content:
+                # Прежний вариант: content в каждой строке списка
+                query = query.options(undefer_group("content"))
+            [item.title for item in query.order_by(Literature.title).limit(limit).all()]
+            session.close()
+        return run
+
+    def detail():
+        session = Session()
+        for literature_id in range(1, articles + 1, max(articles // 100, 1)):
+            item = session.get(Literature, literature_id, options=[undefer_group("content")])
+            literature_content(item)
+        session.close()
+
+    return [
+        measure(list_query(100), repeat),
+        measure(list_query(articles), repeat),
+        measure(detail, repeat),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=10000, help="Количество статей")
+    parser.add_argument("--size", type=int, default=8000, help="Длина текста статьи (символы)")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов каждого замера")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cases = [("before", False, True), ("deferred+zlib", True, False)]
+        print(f"{args.articles} articles x {args.size} chars, median of {args.repeat}")
+        print(f"{'variant':<15}{'db MB':>8}{'page100 ms':>12}{'MB':>7}{'all rows ms':>13}{'MB':>8}{'100 details ms':>16}{'MB':>7}")
+        for name, compress, eager_content in cases:
+            path = os.path.join(directory, f"{name}.db")
+            engine = make_database(path, args.articles, args.size, compress)
+            (page_ms, page_mb), (all_ms, all_mb), (detail_ms, detail_mb) = run_case(
+                engine, eager_content, args.repeat, args.articles
+            )
+            engine.dispose()
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            print(
+                f"{name:<15}{size_mb:>8.1f}{page_ms:>12.1f}{page_mb:>7.1f}"
+                f"{all_ms:>13.1f}{all_mb:>8.1f}{detail_ms:>16.1f}{detail_mb:>7.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
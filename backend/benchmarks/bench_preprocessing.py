@@ -0,0 +1,109 @@
+# backend/benchmarks/bench_preprocessing.py
+# Сравнение полного декодирования изображения и декодирования
+# в размере входа модели (services/preprocessing.py): время и пиковая
+# память на одно изображение. Каждый замер выполняется в отдельном
+# процессе, чтобы пиковый RSS не накапливался между замерами
+# (тестовые изображения тоже генерируются в отдельном процессе: пиковый
+# RSS наследуется дочерним процессом от родителя).
+#
+# Запуск из каталога backend:
+#     python benchmarks/bench_preprocessing.py [--repeat 5]
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from services.image_analyzer import MODEL_INPUT_SIZE, stack_images
+from services.preprocessing import decode_for_model
+
+# (формат, ширина, высота)
+CASES = [
+    ("JPEG", 4000, 4000),
+    ("JPEG", 4000, 3000),
+    ("JPEG", 1600, 1200),
+    ("PNG", 4000, 3000),
+]
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss в Linux в килобайтах, в macOS в байтах
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+def full_decode(path: str) -> np.ndarray:
+    """Прежний путь: полноразмерное декодирование, затем ресайз"""
+    with Image.open(path) as img:
+        image = img.convert("RGB")
+    return stack_images([image])
+
+def reduced_decode(path: str) -> np.ndarray:
+    """Декодирование сразу в размере входа модели"""
+    return stack_images([decode_for_model(path)])
+
+def _measure(func_name: str, path: str, repeat: int, results):
+    func = globals()[func_name]
+    baseline = _peak_rss_mb()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(path)
+        timings.append((time.perf_counter() - started) * 1000)
+    results.put((min(timings), sorted(timings)[len(timings) // 2], _peak_rss_mb() - baseline))
+
+def _run_isolated(target, *args):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=target, args=(*args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+def measure(func_name: str, path: str, repeat: int):
+    return _run_isolated(_measure, func_name, path, repeat)
+
+def _make_image(directory: str, image_format: str, width: int, height: int, results):
+    results.put(make_image(directory, image_format, width, height))
+
+def make_image(directory: str, image_format: str, width: int, height: int) -> str:
+    """Синтетический снимок: плавный градиент с шумом, похожий по сжатию на фото"""
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([(x + y) / 2, np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width))], axis=-1)
+    noise = rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+
+    path = os.path.join(directory, f"{width}x{height}.{image_format.lower()}")
+    Image.fromarray(pixels).save(path, image_format, quality=90)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5, help="Запусков на изображение")
+    args = parser.parse_args()
+
+    print(f"Model input: {MODEL_INPUT_SIZE}x{MODEL_INPUT_SIZE}, repeat={args.repeat}")
+    print(f"{'image':<18}{'size MB':>9}{'mode':>10}{'min ms':>10}{'p50 ms':>10}{'peak RSS MB':>13}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for image_format, width, height in CASES:
+            path = _run_isolated(_make_image, directory, image_format, width, height)
+            label = f"{image_format} {width}x{height}"
+            file_mb = os.path.getsize(path) / 1024 / 1024
+            for func_name in ("full_decode", "reduced_decode"):
+                best, median, rss = measure(func_name, path, args.repeat)
+                mode = func_name.split("_")[0]
+                print(f"{label:<18}{file_mb:>9.1f}{mode:>10}{best:>10.1f}{median:>10.1f}{rss:>13.1f}")
+
+if __name__ == "__main__":
+    main()
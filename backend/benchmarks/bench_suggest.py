@@ -0,0 +1,70 @@
+# backend/benchmarks/bench_suggest.py
+# Время построения триграммного индекса подсказок (services/suggest_index.py)
+# и задержка запроса на синтетическом корпусе названий: слова запроса
+# с опечатками и незаконченные слова (автодополнение).
+#
+# Запуск из каталога backend:
+#     python benchmarks/bench_suggest.py [--entries 10000] [--queries 2000]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.suggest_index import SuggestEntry, TrigramIndex
+
+ROOTS = [
+    "аллерг", "офтальмолог", "дерматолог", "конъюнктив", "иммунолог", "кардиолог",
+    "гастроэнтеролог", "неврол", "эндокринолог", "педиатр", "терапевт", "инфекци",
+    "диагност", "лечени", "профилактик", "реабилитаци", "фармаколог", "хирург",
+    "травматолог", "пульмонолог", "ревматолог", "уролог", "гинеколог", "онколог",
+]
+SUFFIXES = ["ия", "ии", "ический", "ическая", "ит", "ов", "а", "е", "ам", "ами"]
+
+def make_titles(count: int, rng: random.Random):
+    vocabulary = [root + suffix for root in ROOTS for suffix in SUFFIXES]
+    return [" ".join(rng.sample(vocabulary, rng.randint(2, 6))) for _ in range(count)]
+
+def make_queries(titles, count: int, rng: random.Random):
+    """Слово из названия с опечаткой или его начало"""
+    queries = []
+    for _ in range(count):
+        word = rng.choice(rng.choice(titles).split())
+        if rng.random() < 0.5:
+            position = rng.randrange(1, len(word))
+            word = word[:position] + rng.choice("аеиоу") + word[position + 1:]
+        else:
+            word = word[:rng.randint(3, len(word))]
+        queries.append(word)
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=10000, help="Количество названий")
+    parser.add_argument("--queries", type=int, default=2000, help="Количество запросов")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    titles = make_titles(args.entries, rng)
+    queries = make_queries(titles, args.queries, rng)
+
+    index = TrigramIndex()
+    started = time.perf_counter()
+    index.build((SuggestEntry("literature", i, title), "") for i, title in enumerate(titles))
+    print(f"build: {len(index)} entries in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    timings = []
+    found = 0
+    for query in queries:
+        started = time.perf_counter()
+        found += bool(index.search(query))
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p50 = timings[len(timings) // 2]
+    p99 = timings[int(len(timings) * 0.99)]
+    print(f"search: p50 {p50:.3f} ms, p99 {p99:.3f} ms, with results {found}/{len(queries)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# backend/benchmarks/bench_telegram_auth.py
+# Проверок initData в секунду на одном ядре: прежняя проверка (ключ бота
+# вычисляется при каждом входе) против TelegramInitDataVerifier
+# (services/telegram_init_data.py) для новых initData и для повторной
+# отправки уже проверенных.
+#
+# Запуск из каталога backend:
+#     python benchmarks/bench_telegram_auth.py [--logins 50000] [--users 5000]
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qsl, urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.telegram_init_data import TelegramInitDataVerifier
+
+BOT_TOKEN = "123456789:AAbenchmark-bot-token-for-initdata-check"
+
+def legacy_validate(init_data: str, bot_token: str):
+    """Прежняя проверка из auth.py"""
+    params = dict(parse_qsl(init_data))
+    hash_val = params.pop("hash", None)
+    if not hash_val:
+        return None
+    data_check_string = "\n".join([f"{k}={v}" for k, v in sorted(params.items())])
+    secret_key = hmac.new(b"WebAppBotToken", bot_token.encode(), hashlib.sha256).digest()
+    calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if calculated_hash != hash_val:
+        return None
+    return {"user": json.loads(params["user"]), "auth_date": params.get("auth_date"), "hash": hash_val}
+
+def make_init_data(telegram_id: int, auth_date: int) -> str:
+    user = {
+        "id": telegram_id, "first_name": "Иван", "last_name": "Иванов",
+        "username": f"user{telegram_id}", "language_code": "ru", "allows_write_to_pm": True
+    }
+    params = {
+        "query_id": f"AAE{telegram_id:012d}",
+        "user": json.dumps(user, ensure_ascii=False),
+        "auth_date": str(auth_date)
+    }
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(params.items()))
+    secret_key = hmac.new(b"WebAppBotToken", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    params["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(params)
+
+def measure(name: str, check, samples):
+    started = time.perf_counter()
+    valid = sum(check(init_data) is not None for init_data in samples)
+    elapsed = time.perf_counter() - started
+    print(f"{name}: {len(samples) / elapsed:,.0f} logins/s ({elapsed / len(samples) * 1e6:.1f} us), valid {valid}/{len(samples)}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=50000, help="Количество проверок")
+    parser.add_argument("--users", type=int, default=5000, help="Разных initData при повторных входах")
+    args = parser.parse_args()
+
+    now = int(time.time())
+    unique = [make_init_data(1000000 + i, now) for i in range(args.logins)]
+    repeated = [unique[i % args.users] for i in range(args.logins)]
+
+    measure("legacy, new initData", lambda init_data: legacy_validate(init_data, BOT_TOKEN), unique)
+    measure("verifier, new initData", TelegramInitDataVerifier(BOT_TOKEN, cache_size=0).verify, unique)
+    verifier = TelegramInitDataVerifier(BOT_TOKEN)
+    measure("verifier, repeated initData", verifier.verify, repeated)
+    print(f"verifier cache: {verifier.stats()}")
+
+if __name__ == "__main__":
+    main()
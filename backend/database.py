@@ -1,8 +1,12 @@
 # backend/database.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from typing import Optional
 import os
+import sqlite3
+import zlib
 
 # Настройка базы данных
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
@@ -16,12 +20,48 @@ if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
 else:
     engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
+def inflate_content(data: Optional[bytes]) -> Optional[str]:
+    """Текст статьи из content_zlib (services/literature_storage.py)"""
+    if data is None:
+        return None
+    return zlib.decompress(data).decode("utf-8")
+
+# Функция hs_inflate вызывается триггерами полнотекстового индекса литературы
+# (services/literature_search.py), поэтому регистрируется в каждом соединении
+# SQLite, кто бы его ни открыл: приложение, воркеры или скрипты инициализации
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function("hs_inflate", 1, inflate_content, deterministic=True)
+
 # Создание фабрики сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Базовый класс для моделей
 Base = declarative_base()
 
+def sync_schema():
+    """
+    Создание недостающих таблиц, колонок и индексов.
+    create_all не меняет уже существующие таблицы, поэтому новые
+    nullable-колонки и индексы добавляются отдельно с проверкой наличия.
+    """
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 # Зависимость для получения сессии базы данных
 def get_db():
     db = SessionLocal()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# backend/import_literature.py
+
+import argparse
+import logging
+
+from database import SessionLocal, engine, sync_schema
+from services.literature_import import LITERATURE_IMPORT_BATCH, import_directory
+from services.literature_search import ensure_search_index
+
+# Импорт справочной литературы из каталога с файлами Markdown/JSONL.
+# Повторный запуск обновляет только измененные статьи:
+#     python import_literature.py /path/to/articles [--batch-size 2000]
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт статей из файлов *.md и *.jsonl")
+    parser.add_argument("path", help="Каталог или файл со статьями")
+    parser.add_argument("--batch-size", type=int, default=LITERATURE_IMPORT_BATCH, help="Статей в одной транзакции")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sync_schema()
+    ensure_search_index(engine)
+
+    db = SessionLocal()
+    try:
+        stats = import_directory(db, args.path, args.batch_size)
+    finally:
+        db.close()
+
+    for error in stats.errors:
+        print(f"⚠️  Пропущено: {error}")
+    print(
+        f"📚 Прочитано статей: {stats.read} за {stats.elapsed:.1f} с ({stats.rows_per_second:.0f} строк/с): "
+        f"добавлено {stats.inserted}, обновлено {stats.updated}, без изменений {stats.unchanged}"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
 from models import Base, Literature
+from services.literature_search import ensure_search_index
 import json
 
 def init_database():
@@ -9,6 +10,7 @@ def init_database():
     
     # Создание всех таблиц
     Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
     
     db = SessionLocal()
     
@@ -1,7 +1,7 @@
 # backend/models.py
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, Enum
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, Enum, Index, UniqueConstraint, LargeBinary
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.sql import func, text
 from database import Base
 import enum
 
@@ -21,6 +21,12 @@ class ScanStatus(enum.Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+class ScanJobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -31,6 +37,9 @@ class User(Base):
     username = Column(String(100), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Увеличивается при каждом изменении подписок пользователя: claim о подписке
+    # в JWT с другой эпохой устарел (services/entitlements.py)
+    entitlement_epoch = Column(Integer, nullable=True, default=0)
     
     # Связи
     subscriptions = relationship("Subscription", back_populates="user")
@@ -38,6 +47,19 @@ class User(Base):
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        # Действующие подписки: истекшие переводятся в expired (services/subscriptions.py),
+        # поэтому индексы остаются маленькими, а поиск подписки пользователя - точечным
+        Index(
+            "ix_subscriptions_active_user_end", "user_id", "end_date",
+            sqlite_where=text("status = 'ACTIVE'"), postgresql_where=text("status = 'ACTIVE'")
+        ),
+        # Поиск истекших подписок планировщиком
+        Index(
+            "ix_subscriptions_active_end", "end_date",
+            sqlite_where=text("status = 'ACTIVE'"), postgresql_where=text("status = 'ACTIVE'")
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -54,37 +76,133 @@ class Subscription(Base):
 
 class Scan(Base):
     __tablename__ = "scans"
+    __table_args__ = (
+        # Постраничная история сканирований пользователя
+        Index("ix_scans_user_created_id", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     image_path = Column(String(500))  # Путь к загруженному изображению
     status = Column(Enum(ScanStatus), default=ScanStatus.PROCESSING)
     condition_detected = Column(String(200), nullable=True)  # Обнаруженное состояние
-    description = Column(Text, nullable=True)  # Описание
+    condition_id = Column(Integer, ForeignKey("conditions.id"), nullable=True)  # Версия состояния в каталоге
+    description = Column(Text, nullable=True)  # Описание (только если состояния нет в каталоге)
     confidence = Column(Float, nullable=True)  # Уверенность в диагнозе (0-1)
-    recommendations = Column(Text, nullable=True)  # JSON с рекомендациями
+    recommendations = Column(Text, nullable=True)  # JSON с рекомендациями (только если состояния нет в каталоге)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     processed_at = Column(DateTime(timezone=True), nullable=True)
     
     # Связи
     user = relationship("User", back_populates="scans")
+    condition = relationship("Condition")
+
+# Каталог состояний: каждая правка описания или рекомендаций - новая версия,
+# сканы ссылаются на версию, показанную пользователю
+class Condition(Base):
+    __tablename__ = "conditions"
+    __table_args__ = (
+        UniqueConstraint("name", "version", name="uq_conditions_name_version"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(200), index=True)  # Название состояния
+    version = Column(Integer, nullable=False, default=1)
+    description = Column(Text)
+    recommendations = Column(Text)  # JSON со списком рекомендаций
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ScanJob(Base):
+    __tablename__ = "scan_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    scan_id = Column(Integer, ForeignKey("scans.id"), index=True)
+    image_path = Column(String(500))
+    image_sha256 = Column(String(64), nullable=True)  # Хэш содержимого для кэша результатов
+    status = Column(Enum(ScanJobStatus), default=ScanJobStatus.QUEUED, index=True)
+    attempts = Column(Integer, default=0)  # Количество запусков обработки
+    available_at = Column(DateTime(timezone=True), server_default=func.now())  # Не раньше этого времени
+    locked_at = Column(DateTime(timezone=True), nullable=True)  # Когда задачу взял воркер
+    locked_by = Column(String(100), nullable=True)  # Идентификатор воркера
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Связи
+    scan = relationship("Scan")
+
+class ScanResultCache(Base):
+    __tablename__ = "scan_result_cache"
+    __table_args__ = (
+        UniqueConstraint("sha256", "analyzer_version", name="uq_scan_result_cache_hash_version"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), index=True)  # SHA-256 содержимого файла
+    phash = Column(String(16), nullable=True, index=True)  # Перцептивный хэш (dHash)
+    analyzer_version = Column(String(100))
+    image_path = Column(String(500))
+    condition_detected = Column(String(200))
+    description = Column(Text, nullable=True)
+    confidence = Column(Float)
+    recommendations = Column(Text, nullable=True)  # JSON с рекомендациями
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
 
 class Literature(Base):
     __tablename__ = "literature"
+    __table_args__ = (
+        # Фильтр и счетчики по категории
+        Index("ix_literature_category", "category"),
+        # Повторный импорт находит статью по ее источнику
+        Index("ix_literature_source_key", "source_key", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(300))
     description = Column(Text, nullable=True)
-    content = Column(Text)  # Текст статьи или ссылка на файл
+    # Текст статьи или ссылка на файл. Не загружается со списком статей;
+    # большие тексты в SQLite хранятся сжатыми в content_zlib (content = NULL),
+    # читать текст нужно через services.literature_storage.literature_content
+    content = deferred(Column(Text), group="content")
+    content_zlib = deferred(Column(LargeBinary, nullable=True), group="content")
     category = Column(String(100))  # Категория (офтальмология, аллергология и т.д.)
-    tags = Column(Text, nullable=True)  # JSON с тегами
+    # JSON с тегами; при записи статьи теги переносятся в таблицы tags и
+    # literature_tags (services/literature_tags.py), читать их нужно оттуда
+    tags = Column(Text, nullable=True)
     author = Column(String(200), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_active = Column(Boolean, default=True)
+    # Источник импортированной статьи (путь к файлу или ключ из JSONL) и хэш ее полей
+    source_key = Column(String(300), nullable=True)
+    content_hash = Column(String(64), nullable=True)
+
+# Теги литературы
+class Tag(Base):
+    __tablename__ = "tags"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False, unique=True)  # Ключ поиска (нижний регистр)
+    display_name = Column(String(100), nullable=True)  # Написание для ответов API
+
+class LiteratureTag(Base):
+    __tablename__ = "literature_tags"
+    __table_args__ = (
+        # Статьи с тегом (фильтр tag= и счетчики по тегам)
+        Index("ix_literature_tags_tag_literature", "tag_id", "literature_id"),
+    )
+    
+    literature_id = Column(Integer, ForeignKey("literature.id"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id"), primary_key=True)
+    position = Column(Integer, nullable=False, default=0)  # Порядок тега в статье
 
 class QueryHistory(Base):
     __tablename__ = "query_history"
+    __table_args__ = (
+        # Постраничная история запросов пользователя
+        Index("ix_query_history_user_created_id", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -95,3 +213,22 @@ class QueryHistory(Base):
     # Связи
     user = relationship("User")
     scan = relationship("Scan")
+
+# Счетчики пользователя, обновляются в тех же транзакциях, что и сами записи
+class UserCounters(Base):
+    __tablename__ = "user_counters"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    scans = Column(Integer, nullable=False, default=0)  # Все сканирования
+    completed_scans = Column(Integer, nullable=False, default=0)  # Завершенные сканирования
+    history_entries = Column(Integer, nullable=False, default=0)  # Записи истории запросов
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# Номера версий данных для кэшей: увеличиваются в той же транзакции,
+# что и изменение данных (например, literature - при любой записи статей)
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# backend/reconcile_counters.py
+
+import logging
+
+from database import SessionLocal, sync_schema
+from services.counters import reconcile_counters
+
+# Сверка денормализованных счетчиков пользователей с таблицами
+# (запускается по расписанию, например раз в сутки из cron)
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    sync_schema()
+
+    db = SessionLocal()
+    try:
+        fixed = reconcile_counters(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"🔢 Исправлено счетчиков пользователей: {fixed}")
+
+if __name__ == "__main__":
+    main()
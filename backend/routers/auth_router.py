@@ -1,12 +1,17 @@
 # backend/routers/auth_router.py
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from sqlalchemy import case, func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from typing import Dict, Optional
 import os
 
 from models import User
 from database import get_db
 from auth import validate_telegram_data, create_access_token, get_current_user
+from services.user_cache import UserSnapshot, user_cache
+from services.entitlements import load_entitlement
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
@@ -17,14 +22,55 @@ class UserResponse(BaseModel):
     id: int
     telegram_id: int
     first_name: str
-    last_name: str = None
-    username: str = None
+    last_name: Optional[str] = None
+    username: Optional[str] = None
 
 class AuthResponse(BaseModel):
     access_token: str
     token_type: str
     user: UserResponse
 
+_USER_COLUMNS = (User.id, User.telegram_id, User.first_name, User.last_name, User.username, User.entitlement_epoch)
+
+def upsert_user(db: Session, telegram_id: int, profile: Dict[str, Optional[str]]):
+    """
+    Создание пользователя или обновление его имени одним запросом
+    INSERT ... ON CONFLICT(telegram_id) DO UPDATE ... RETURNING: одновременные
+    первые входы одного пользователя не падают на уникальности telegram_id.
+    Возвращает строку с колонками _USER_COLUMNS. Коммит выполняет вызывающий код.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return _insert_or_select_user(db, telegram_id, profile)
+
+    statement = insert(User).values(telegram_id=telegram_id, entitlement_epoch=0, **profile)
+    changed = or_(*[
+        getattr(User, field).is_distinct_from(getattr(statement.excluded, field))
+        for field in profile
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={
+            **{field: getattr(statement.excluded, field) for field in profile},
+            # Время изменения - только если имя действительно изменилось
+            "updated_at": case((changed, func.now()), else_=User.updated_at)
+        }
+    ).returning(*_USER_COLUMNS)
+    return db.execute(statement).one()
+
+def _insert_or_select_user(db: Session, telegram_id: int, profile: Dict[str, Optional[str]]):
+    # Базы данных без ON CONFLICT: вставка, при конфликте - обновление существующей строки
+    try:
+        with db.begin_nested():
+            db.add(User(telegram_id=telegram_id, entitlement_epoch=0, **profile))
+    except IntegrityError:
+        db.query(User).filter(User.telegram_id == telegram_id).update(profile)
+    return db.query(*_USER_COLUMNS).filter(User.telegram_id == telegram_id).one()
+
 @router.post("/", response_model=AuthResponse)
 async def auth_user(auth_request: AuthRequest, db: Session = Depends(get_db)):
     """Аутентификация пользователя через Telegram Web App"""
@@ -56,22 +102,19 @@ async def auth_user(auth_request: AuthRequest, db: Session = Depends(get_db)):
         user_data = result["user"]
     
     telegram_id = user_data["id"]
-    
-    # Проверяем, есть ли пользователь
-    db_user = db.query(User).filter(User.telegram_id == telegram_id).first()
-    if not db_user:
-        db_user = User(
-            telegram_id=telegram_id,
-            first_name=user_data.get("first_name"),
-            last_name=user_data.get("last_name"),
-            username=user_data.get("username")
-        )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-    
-    # Генерируем JWT
-    token = create_access_token({"user_id": db_user.id, "telegram_id": telegram_id})
+    profile = {
+        "first_name": user_data.get("first_name"),
+        "last_name": user_data.get("last_name"),
+        "username": user_data.get("username")
+    }
+    db_user = upsert_user(db, telegram_id, profile)
+    entitlement = load_entitlement(db, db_user.id, db_user.entitlement_epoch or 0)
+    db.commit()
+    # Имя и username в Telegram могли измениться
+    user_cache.invalidate(db_user.id)
+
+    # Генерируем JWT с claim о текущей подписке
+    token = create_access_token({"user_id": db_user.id, "telegram_id": telegram_id}, entitlement)
     
     return AuthResponse(
         access_token=token,
@@ -87,7 +130,7 @@ async def auth_user(auth_request: AuthRequest, db: Session = Depends(get_db)):
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
-    current_user: User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Получение информации о текущем пользователе"""
@@ -1,42 +1,61 @@
 # backend/routers/history_router.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
-from models import User, QueryHistory
+from models import QueryHistory
 from database import get_db
 from auth import get_current_user
+from services.user_cache import UserSnapshot
+from services.pagination import keyset_page
+from services.counters import bump_counters, get_counters
+from services.history_buffer import history_buffer
 
 router = APIRouter(prefix="/api/history", tags=["history"])
 
 class QueryHistoryResponse(BaseModel):
     id: int
     query_text: str
-    scan_id: int = None
+    scan_id: Optional[int] = None
     created_at: datetime
 
 class HistoryListResponse(BaseModel):
     history: List[QueryHistoryResponse]
     total: int
+    next_cursor: Optional[str] = None
 
 @router.get("/", response_model=HistoryListResponse)
 async def get_query_history(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=100),
     offset: int = 0,
-    current_user: User = Depends(get_current_user),
+    cursor: Optional[str] = None,
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Получение истории запросов пользователя"""
+    """
+    Получение истории запросов пользователя.
+    Следующая страница запрашивается с cursor=next_cursor из предыдущего ответа.
+    """
     
-    total = db.query(QueryHistory).filter(
-        QueryHistory.user_id == current_user.id
-    ).count()
+    # Недавние просмотры пользователя еще могут быть в буфере (запись - вне цикла событий)
+    if history_buffer.has_pending(current_user.id):
+        await run_in_threadpool(history_buffer.flush)
     
-    history_items = db.query(QueryHistory).filter(
-        QueryHistory.user_id == current_user.id
-    ).order_by(QueryHistory.created_at.desc()).offset(offset).limit(limit).all()
+    query = db.query(QueryHistory).filter(QueryHistory.user_id == current_user.id)
+    total = get_counters(db, current_user.id)["history_entries"]
+    
+    try:
+        history_items, next_cursor = keyset_page(
+            query, QueryHistory.created_at, QueryHistory.id, limit, cursor, offset
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
     
     history_responses = []
     for item in history_items:
@@ -49,13 +68,14 @@ async def get_query_history(
     
     return HistoryListResponse(
         history=history_responses,
-        total=total
+        total=total,
+        next_cursor=next_cursor
     )
 
 @router.delete("/{history_id}")
 async def delete_history_item(
     history_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Удаление элемента из истории"""
@@ -67,6 +87,7 @@ async def delete_history_item(
     
     if history_item:
         db.delete(history_item)
+        bump_counters(db, current_user.id, history_entries=-1)
         db.commit()
         return {"message": "History item deleted"}
     else:
@@ -74,14 +95,19 @@ async def delete_history_item(
 
 @router.delete("/")
 async def clear_history(
-    current_user: User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Очистка всей истории пользователя"""
     
-    db.query(QueryHistory).filter(
+    # Иначе записи из буфера появятся в истории уже после очистки
+    if history_buffer.has_pending(current_user.id):
+        await run_in_threadpool(history_buffer.flush)
+    
+    deleted = db.query(QueryHistory).filter(
         QueryHistory.user_id == current_user.id
     ).delete()
+    bump_counters(db, current_user.id, history_entries=-deleted)
     db.commit()
     
     return {"message": "History cleared"}
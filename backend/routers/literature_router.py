@@ -1,13 +1,21 @@
 # backend/routers/literature_router.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, undefer_group
 from pydantic import BaseModel
 from typing import List, Optional
 import json
 
-from models import Literature, QueryHistory
+from models import Literature
 from database import get_db
 from auth import get_current_user, get_current_user_optional
+from services.history_buffer import history_buffer
+from services.literature_storage import literature_content
+from services.literature_search import apply_text_search, search_with_snippets
+from services.suggest_index import suggest_index
+from services.data_versions import LITERATURE, data_versions
+from services.response_cache import cached_json_response, response_cache
+from services.literature_tags import facet_counts, load_tag_lists, normalize_tag, tag_filter
 
 router = APIRouter(prefix="/api/literature", tags=["literature"])
 
@@ -33,80 +41,135 @@ class LiteratureListResponse(BaseModel):
     total: int
     categories: List[str]
 
-def parse_tags(tags_json: str) -> List[str]:
-    """Парсинг тегов из JSON"""
-    if not tags_json:
-        return []
-    try:
-        return json.loads(tags_json)
-    except json.JSONDecodeError:
-        return []
+class FacetValue(BaseModel):
+    name: Optional[str] = None
+    count: int
+
+class LiteratureFacetsResponse(BaseModel):
+    tags: List[FacetValue]
+    categories: List[FacetValue]
+
+def _normalize_filters(search: Optional[str], tag: Optional[List[str]]):
+    """Параметры фильтра в каноническом виде (для ключа кэша)"""
+    search = " ".join(search.split()).lower() if search else None
+    tags = tuple(sorted({normalize_tag(value) for value in tag or [] if value.strip()}))
+    return search, tags
+
+def _filter_literature(db: Session, query, category: Optional[str], tags, search: Optional[str]):
+    """Активная литература с фильтрами по категории, тегам (все сразу) и тексту"""
+    query = query.filter(Literature.is_active == True)
+    
+    # Фильтрация по категории
+    if category:
+        query = query.filter(Literature.category == category)
+    
+    # Фильтрация по тегам
+    for value in tags:
+        query = query.filter(tag_filter(value))
+    
+    # Поиск по тексту (с FTS5 результаты упорядочены по релевантности)
+    if search:
+        query = apply_text_search(db, query, search, columns=("title", "description"))
+    return query
+
+def _build_categories(db: Session):
+    """Список категорий активной литературы: тело ответа и сам список"""
+    categories = db.query(Literature.category).filter(
+        Literature.is_active == True
+    ).distinct().all()
+    categories_list = [cat[0] for cat in categories]
+    body = json.dumps({"categories": categories_list}, ensure_ascii=False, separators=(",", ":"))
+    return body.encode(), categories_list
 
 @router.get("/", response_model=LiteratureListResponse)
 async def get_literature_list(
+    request: Request,
     category: Optional[str] = Query(None, description="Фильтр по категории"),
     search: Optional[str] = Query(None, description="Поиск по названию или описанию"),
+    tag: Optional[List[str]] = Query(None, description="Фильтр по тегу (можно указать несколько)"),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
     db: Session = Depends(get_db)
 ):
-    """Получение списка справочной литературы"""
+    """
+    Получение списка справочной литературы.
+    Ответ кэшируется до следующего изменения литературы (ETag, If-None-Match).
+    """
     
-    query = db.query(Literature).filter(Literature.is_active == True)
+    version = data_versions.current(db, LITERATURE)
     
-    # Фильтрация по категории
-    if category:
-        query = query.filter(Literature.category == category)
-    
-    # Поиск по тексту
-    if search:
-        search_filter = f"%{search}%"
-        query = query.filter(
-            (Literature.title.ilike(search_filter)) |
-            (Literature.description.ilike(search_filter))
-        )
-    
-    total = query.count()
+    # Список всех доступных категорий (тоже из кэша)
+    categories = await response_cache.get_or_build(("categories",), version, _build_categories)
+    categories_list = categories.extra
     
-    literature_items = query.order_by(Literature.title).offset(offset).limit(limit).all()
+    search, tags = _normalize_filters(search, tag)
     
-    # Получаем список всех доступных категорий
-    categories = db.query(Literature.category).filter(
-        Literature.is_active == True
-    ).distinct().all()
-    categories_list = [cat[0] for cat in categories]
+    def build(db: Session):
+        query = _filter_literature(db, db.query(Literature), category, tags, search)
+        
+        total = query.count()
+        
+        literature_items = query.order_by(Literature.title).offset(offset).limit(limit).all()
+        
+        # Теги всей страницы одним запросом
+        tag_lists = load_tag_lists(db, [item.id for item in literature_items])
+        
+        literature_responses = []
+        for item in literature_items:
+            literature_responses.append(LiteratureResponse(
+                id=item.id,
+                title=item.title,
+                description=item.description,
+                category=item.category,
+                author=item.author,
+                tags=tag_lists.get(item.id, [])
+            ))
+        
+        response = LiteratureListResponse(
+            literature=literature_responses,
+            total=total,
+            categories=categories_list
+        )
+        return response.model_dump_json().encode(), None
     
-    literature_responses = []
-    for item in literature_items:
-        literature_responses.append(LiteratureResponse(
-            id=item.id,
-            title=item.title,
-            description=item.description,
-            category=item.category,
-            author=item.author,
-            tags=parse_tags(item.tags)
-        ))
-    
-    return LiteratureListResponse(
-        literature=literature_responses,
-        total=total,
-        categories=categories_list
+    cached = await response_cache.get_or_build(
+        ("list", category or None, tags, search, limit, offset), version, build
     )
+    return cached_json_response(request, cached)
 
 @router.get("/{literature_id}", response_model=LiteratureDetailResponse)
 async def get_literature_detail(
     literature_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user_optional)
 ):
     """Получение подробной информации о справочной литературе"""
     
-    literature = db.query(Literature).filter(
-        Literature.id == literature_id,
-        Literature.is_active == True
-    ).first()
+    def build(db: Session):
+        literature = db.query(Literature).options(undefer_group("content")).filter(
+            Literature.id == literature_id,
+            Literature.is_active == True
+        ).first()
+        if not literature:
+            return None, None
+        
+        response = LiteratureDetailResponse(
+            id=literature.id,
+            title=literature.title,
+            description=literature.description,
+            content=literature_content(literature),
+            category=literature.category,
+            author=literature.author,
+            tags=load_tag_lists(db, [literature.id]).get(literature.id, [])
+        )
+        return response.model_dump_json().encode(), literature.title
     
-    if not literature:
+    cached = await response_cache.get_or_build(
+        ("detail", literature_id), data_versions.current(db, LITERATURE), build
+    )
+    
+    if cached.body is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Literature not found"
@@ -114,34 +177,68 @@ async def get_literature_detail(
     
     # Если пользователь авторизован, добавляем в историю
     if current_user:
-        query_history = QueryHistory(
-            user_id=current_user.id,
-            query_text=f"Литература: {literature.title}",
-            scan_id=None
-        )
-        db.add(query_history)
-        db.commit()
-    
-    return LiteratureDetailResponse(
-        id=literature.id,
-        title=literature.title,
-        description=literature.description,
-        content=literature.content,
-        category=literature.category,
-        author=literature.author,
-        tags=parse_tags(literature.tags)
-    )
+        # Запись попадет в базу пакетом вместе с другими просмотрами;
+        # ожидание места в буфере (HISTORY_BUFFER_OVERFLOW=block) - вне цикла событий
+        if history_buffer.overflow == "block":
+            await run_in_threadpool(history_buffer.add, current_user.id, f"Литература: {cached.extra}")
+        else:
+            history_buffer.add(current_user.id, f"Литература: {cached.extra}")
+    
+    return cached_json_response(request, cached)
 
 @router.get("/categories/")
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(request: Request, db: Session = Depends(get_db)):
     """Получение списка категорий литературы"""
     
-    categories = db.query(Literature.category).filter(
-        Literature.is_active == True
-    ).distinct().all()
+    cached = await response_cache.get_or_build(
+        ("categories",), data_versions.current(db, LITERATURE), _build_categories
+    )
+    return cached_json_response(request, cached)
+
+@router.get("/facets/", response_model=LiteratureFacetsResponse)
+async def get_facets(
+    request: Request,
+    category: Optional[str] = Query(None, description="Фильтр по категории"),
+    search: Optional[str] = Query(None, description="Поиск по названию или описанию"),
+    tag: Optional[List[str]] = Query(None, description="Фильтр по тегу (можно указать несколько)"),
+    db: Session = Depends(get_db)
+):
+    """Количество статей по тегам и категориям с учетом фильтров списка"""
+    
+    search, tags = _normalize_filters(search, tag)
+    
+    def build(db: Session):
+        literature_ids = _filter_literature(
+            db, db.query(Literature.id), category, tags, search
+        ).order_by(None).subquery()
+        response = LiteratureFacetsResponse(**facet_counts(db, literature_ids))
+        return response.model_dump_json().encode(), None
+    
+    cached = await response_cache.get_or_build(
+        ("facets", category or None, tags, search), data_versions.current(db, LITERATURE), build
+    )
+    return cached_json_response(request, cached)
+
+@router.get("/suggest/")
+async def suggest(
+    q: str = Query(..., min_length=1, description="Начало или слово с опечаткой"),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """Подсказки по названиям литературы и состояний с учетом опечаток"""
+    
+    suggestions = []
+    for entry, score in suggest_index.search(db, q, limit):
+        suggestions.append({
+            "text": entry.text,
+            "kind": entry.kind,
+            "id": entry.id,
+            "score": score
+        })
     
     return {
-        "categories": [cat[0] for cat in categories]
+        "suggestions": suggestions,
+        "query": q
     }
 
 @router.get("/search/")
@@ -152,27 +249,26 @@ async def search_literature(
 ):
     """Поиск в справочной литературе"""
     
-    search_filter = f"%{q}%"
-    
-    literature_items = db.query(Literature).filter(
-        Literature.is_active == True,
-        (Literature.title.ilike(search_filter)) |
-        (Literature.description.ilike(search_filter)) |
-        (Literature.content.ilike(search_filter))
-    ).limit(limit).all()
+    found = search_with_snippets(db, q, limit)
     
     results = []
-    for item in literature_items:
+    for item, snippet in found:
         results.append({
             "id": item.id,
             "title": item.title,
             "description": item.description,
             "category": item.category,
-            "relevance_snippet": item.description[:200] + "..." if item.description and len(item.description) > 200 else item.description
+            "relevance_snippet": snippet
         })
     
+    # Ничего не найдено (часто из-за опечатки) - предлагаем похожие названия
+    suggestions = []
+    if not results:
+        suggestions = [entry.text for entry, _ in suggest_index.search(db, q, 5)]
+    
     return {
         "results": results,
         "total": len(results),
-        "query": q
+        "query": q,
+        "suggestions": suggestions
     }
@@ -1,150 +1,350 @@
 # backend/routers/scan_router.py
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
 import json
 import os
-import uuid
 from datetime import datetime
-import shutil
 
-from models import User, Scan, QueryHistory, ScanStatus, Subscription, SubscriptionStatus
-from database import get_db
-from auth import get_current_user
-from services.image_analyzer import analyze_medical_image, validate_medical_image
+from models import Scan, ScanStatus
+from database import get_db, SessionLocal
+from auth import get_current_user, get_current_user_stream, get_user_by_token, current_entitlement
+from services.user_cache import UserSnapshot
+from services.upload_ingest import UPLOAD_DIR, UploadRejected, ingest_images
+from services.scan_queue import QueueFullError, check_queue_capacity, enqueue_scan, enqueue_scans, queue_depth, save_scan_result, worker_pool
+from services.scan_cache import lookup_by_hash, lookup_many_by_hash, cache_stats
+from services.pagination import keyset_page
+from services.counters import bump_counters, get_counters
+from services.conditions import scan_condition_fields, scan_condition_fragment
+from services.events import event_hub, format_sse, scan_event, watch_scan, watch_user
+from services.literature_recommendations import related_literature
 
 router = APIRouter(prefix="/api/scan", tags=["scanning"])
 
+class RelatedLiteratureResponse(BaseModel):
+    id: int
+    title: str
+    category: Optional[str] = None
+
 class ScanResponse(BaseModel):
     id: int
     status: str
-    condition_detected: str = None
-    description: str = None
-    confidence: float = None
+    condition_detected: Optional[str] = None
+    description: Optional[str] = None
+    confidence: Optional[float] = None
     recommendations: List[str] = []
     created_at: datetime
-    processed_at: datetime = None
+    processed_at: Optional[datetime] = None
+    # Статьи по найденному состоянию (только в ответах по одному скану)
+    related_literature: List[RelatedLiteratureResponse] = []
 
 class ScanHistoryResponse(BaseModel):
     scans: List[ScanResponse]
     total: int
+    next_cursor: Optional[str] = None
+
+class ScanBatchResponse(BaseModel):
+    scans: List[ScanResponse]
 
 # Создание директории для загруженных изображений
-UPLOAD_DIR = "uploads/images"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def process_scan_background(scan_id: int, image_path: str):
-    """Фоновая обработка сканирования изображения"""
-    from database import SessionLocal
+# Максимальное количество файлов в одной пакетной загрузке
+SCAN_BATCH_MAX_FILES = int(os.getenv("SCAN_BATCH_MAX_FILES", "10"))
+
+def build_scan_response(db: Session, scan: Scan) -> ScanResponse:
+    """Формирование ответа по записи сканирования"""
+    condition, description, recommendations = scan_condition_fields(db, scan)
     
-    # Создаем новую сессию для фоновой задачи
-    db = SessionLocal()
-    try:
-        # Симуляция анализа изображения
-        analysis_result = analyze_medical_image(image_path)
-        
-        # Обновляем результаты в базе данных
-        scan = db.query(Scan).filter(Scan.id == scan_id).first()
-        if scan:
-            scan.status = ScanStatus.COMPLETED
-            scan.condition_detected = analysis_result["condition"]
-            scan.description = analysis_result["description"]
-            scan.confidence = analysis_result["confidence"]
-            scan.recommendations = json.dumps(analysis_result["recommendations"], ensure_ascii=False)
-            scan.processed_at = datetime.utcnow()
-            
-            # Добавляем в историю запросов
-            query_history = QueryHistory(
-                user_id=scan.user_id,
-                query_text=analysis_result["condition"],
-                scan_id=scan.id
-            )
-            db.add(query_history)
-            
-            db.commit()
-    except Exception as e:
-        # В случае ошибки помечаем скан как неудачный
-        scan = db.query(Scan).filter(Scan.id == scan_id).first()
-        if scan:
-            scan.status = ScanStatus.FAILED
-            scan.processed_at = datetime.utcnow()
-            db.commit()
-    finally:
-        db.close()
+    return ScanResponse(
+        id=scan.id,
+        status=scan.status.value,
+        condition_detected=condition,
+        description=description,
+        confidence=scan.confidence,
+        recommendations=recommendations,
+        created_at=scan.created_at,
+        processed_at=scan.processed_at,
+        related_literature=related_literature.related(db, condition) if scan.status == ScanStatus.COMPLETED else []
+    )
 
-def check_user_subscription(user: User, db: Session) -> bool:
-    """Проверка активной подписки пользователя"""
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE,
-        Subscription.end_date > datetime.utcnow()
-    ).first()
-    return subscription is not None
+def check_user_subscription(request: Request, response: Response, user: UserSnapshot, db: Session) -> bool:
+    """Проверка активной подписки пользователя (по claim токена, см. services/entitlements.py)"""
+    return current_entitlement(request, response, user, db).is_active()
 
-@router.post("/upload", response_model=ScanResponse)
+# Описание тела запроса для документации: файл читается из потока вручную
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}}
+                }
+            }
+        }
+    }
+}
+
+@router.post("/upload", response_model=ScanResponse, openapi_extra=UPLOAD_OPENAPI)
 async def upload_and_scan_image(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Загрузка изображения и запуск анализа"""
     
     # Проверяем подписку пользователя
-    if not check_user_subscription(current_user, db):
+    if not check_user_subscription(request, response, current_user, db):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Active subscription required to use scan functionality"
         )
     
-    # Проверяем тип файла
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File must be an image"
-        )
-    
-    # Генерируем уникальное имя файла
-    file_extension = file.filename.split(".")[-1]
-    filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    # Сохраняем файл
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Проверяем валидность изображения
-    if not validate_medical_image(file_path):
-        os.remove(file_path)  # Удаляем невалидный файл
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid image format or resolution. Please upload a valid medical image."
-        )
+    # Принимаем файл потоком, проверяя формат и размеры по заголовку изображения
+    try:
+        images = await ingest_images(request, UPLOAD_DIR)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    image = images[0]
     
     # Создаем запись в базе данных
     scan = Scan(
         user_id=current_user.id,
-        image_path=file_path,
+        image_path=image.path,
         status=ScanStatus.PROCESSING
     )
+    
+    # Это изображение уже анализировалось - результат берем из кэша без очереди
+    cached_result = lookup_by_hash(db, image.sha256)
+    if cached_result is not None:
+        db.add(scan)
+        db.flush()
+        bump_counters(db, current_user.id, scans=1)
+        save_scan_result(db, scan.id, cached_result)
+        db.commit()
+        db.refresh(scan)
+        event_hub.publish(scan_event(db, scan))
+        return build_scan_response(db, scan)
+    
+    # Проверяем, что очередь обработки не переполнена
+    try:
+        check_queue_capacity(db)
+    except QueueFullError as e:
+        # Файл не удаляется: по тому же хэшу его мог принять другой запрос,
+        # а повторная загрузка после Retry-After использует его снова
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Scan queue is full, please retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
     db.add(scan)
+    db.flush()
+    bump_counters(db, current_user.id, scans=1)
+    
+    # Ставим скан в очередь обработки в той же транзакции
+    enqueue_scan(db, scan.id, image.path, image.sha256)
     db.commit()
     db.refresh(scan)
     
-    # Запускаем фоновую обработку
-    background_tasks.add_task(process_scan_background, scan.id, file_path)
-    
     return ScanResponse(
         id=scan.id,
         status=scan.status.value,
         created_at=scan.created_at
     )
 
+BATCH_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+}
+
+@router.post("/batch", response_model=ScanBatchResponse, openapi_extra=BATCH_UPLOAD_OPENAPI)
+async def upload_scan_batch(
+    request: Request,
+    response: Response,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Загрузка нескольких изображений одним запросом (поле files)"""
+    
+    # Подписка проверяется один раз на весь пакет
+    if not check_user_subscription(request, response, current_user, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Active subscription required to use scan functionality"
+        )
+    
+    # Каждый файл потоком пишется на диск с проверкой по заголовку
+    try:
+        images = await ingest_images(request, UPLOAD_DIR, field_name="files", max_files=SCAN_BATCH_MAX_FILES)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    # Результаты для уже анализировавшихся изображений - одним запросом
+    cached_results = lookup_many_by_hash(db, [image.sha256 for image in images])
+    queued_count = sum(1 for image in images if image.sha256 not in cached_results)
+    
+    try:
+        check_queue_capacity(db, incoming=queued_count)
+    except QueueFullError as e:
+        # Файлы без сканов удаляет remove_orphan_uploads
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Scan queue is full, please retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    # Все сканы одним INSERT, идентификаторы в порядке файлов
+    scan_ids = db.scalars(
+        insert(Scan).returning(Scan.id, sort_by_parameter_order=True),
+        [
+            {"user_id": current_user.id, "image_path": image.path, "status": ScanStatus.PROCESSING}
+            for image in images
+        ]
+    ).all()
+    bump_counters(db, current_user.id, scans=len(scan_ids))
+    
+    queued = []
+    for scan_id, image in zip(scan_ids, images):
+        cached_result = cached_results.get(image.sha256)
+        if cached_result is not None:
+            save_scan_result(db, scan_id, cached_result)
+        else:
+            queued.append((scan_id, image.path, image.sha256))
+    enqueue_scans(db, queued)
+    db.commit()
+    
+    scans = {scan.id: scan for scan in db.query(Scan).filter(Scan.id.in_(scan_ids)).all()}
+    for scan in scans.values():
+        if scan.status != ScanStatus.PROCESSING:
+            event_hub.publish(scan_event(db, scan))
+    
+    return ScanBatchResponse(scans=[build_scan_response(db, scans[scan_id]) for scan_id in scan_ids])
+
+@router.get("/stats")
+async def get_scan_stats(
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Состояние очереди сканирований, кэша результатов и батчинга в воркерах (только с токеном)"""
+    return {
+        "queue_depth": queue_depth(db),
+        "cache": cache_stats(db),
+        "workers": worker_pool.stats()
+    }
+
+def _authenticate_websocket(token: str) -> Optional[int]:
+    db = SessionLocal()
+    try:
+        user = get_user_by_token(token, db)
+        return user.id if user else None
+    finally:
+        db.close()
+
+@router.websocket("/ws")
+async def scan_events_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Уведомления о завершении сканирований пользователя.
+    Токен передается параметром ?token=, каждое сообщение - JSON со сканом.
+    """
+    user_id = await asyncio.to_thread(_authenticate_websocket, token) if token else None
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    async def push_events():
+        async for event in watch_user(user_id):
+            if event is not None:
+                await websocket.send_json(event["scan"])
+
+    sender = asyncio.create_task(push_events())
+    try:
+        # Сообщения клиента не ожидаются, чтение нужно, чтобы заметить отключение
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+
+@router.get("/{scan_id}/events")
+async def stream_scan_events(
+    scan_id: int,
+    current_user: UserSnapshot = Depends(get_current_user_stream),
+    db: Session = Depends(get_db)
+):
+    """Поток Server-Sent Events с изменениями статуса сканирования вместо опроса"""
+    
+    scan_exists = db.query(Scan.id).filter(
+        Scan.id == scan_id,
+        Scan.user_id == current_user.id
+    ).first()
+    
+    if not scan_exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Scan not found"
+        )
+    
+    user_id = current_user.id
+    
+    async def event_stream():
+        async for event in watch_scan(scan_id, user_id):
+            # Комментарий раз в интервал сверки не дает прокси закрыть соединение
+            yield format_sse(event) if event is not None else ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/{scan_id}/image")
+async def get_scan_image(
+    scan_id: int,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Загруженное изображение сканирования (только владельцу)"""
+    
+    image_path = db.query(Scan.image_path).filter(
+        Scan.id == scan_id,
+        Scan.user_id == current_user.id
+    ).scalar()
+    
+    if not image_path or not os.path.isfile(image_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Scan image not found"
+        )
+    
+    return FileResponse(image_path, headers={"Cache-Control": "private, max-age=3600"})
+
 @router.get("/{scan_id}", response_model=ScanResponse)
 async def get_scan_result(
     scan_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Получение результата сканирования"""
@@ -160,60 +360,50 @@ async def get_scan_result(
             detail="Scan not found"
         )
     
-    recommendations = []
-    if scan.recommendations:
-        try:
-            recommendations = json.loads(scan.recommendations)
-        except json.JSONDecodeError:
-            recommendations = []
-    
-    return ScanResponse(
-        id=scan.id,
-        status=scan.status.value,
-        condition_detected=scan.condition_detected,
-        description=scan.description,
-        confidence=scan.confidence,
-        recommendations=recommendations,
-        created_at=scan.created_at,
-        processed_at=scan.processed_at
-    )
+    return build_scan_response(db, scan)
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+def serialize_scan(db: Session, scan: Scan) -> str:
+    """JSON скана для списков: поля состояния подставляются готовым фрагментом из каталога"""
+    head = json.dumps({
+        "id": scan.id,
+        "status": scan.status.value,
+        "confidence": scan.confidence,
+        "created_at": _isoformat(scan.created_at),
+        "processed_at": _isoformat(scan.processed_at)
+    })
+    return f"{head[:-1]}, {scan_condition_fragment(db, scan)}}}"
 
 @router.get("/", response_model=ScanHistoryResponse)
 async def get_scan_history(
-    limit: int = 10,
+    limit: int = Query(10, ge=1, le=100),
     offset: int = 0,
-    current_user: User = Depends(get_current_user),
+    cursor: Optional[str] = None,
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Получение истории сканирований пользователя"""
+    """
+    Получение истории сканирований пользователя.
+    Следующая страница запрашивается с cursor=next_cursor из предыдущего ответа.
+    """
     
-    total = db.query(Scan).filter(Scan.user_id == current_user.id).count()
+    query = db.query(Scan).filter(Scan.user_id == current_user.id)
+    total = get_counters(db, current_user.id)["scans"]
     
-    scans = db.query(Scan).filter(
-        Scan.user_id == current_user.id
-    ).order_by(Scan.created_at.desc()).offset(offset).limit(limit).all()
-    
-    scan_responses = []
-    for scan in scans:
-        recommendations = []
-        if scan.recommendations:
-            try:
-                recommendations = json.loads(scan.recommendations)
-            except json.JSONDecodeError:
-                recommendations = []
-        
-        scan_responses.append(ScanResponse(
-            id=scan.id,
-            status=scan.status.value,
-            condition_detected=scan.condition_detected,
-            description=scan.description,
-            confidence=scan.confidence,
-            recommendations=recommendations,
-            created_at=scan.created_at,
-            processed_at=scan.processed_at
-        ))
-    
-    return ScanHistoryResponse(
-        scans=scan_responses,
-        total=total
+    try:
+        scans, next_cursor = keyset_page(query, Scan.created_at, Scan.id, limit, cursor, offset)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    
+    # Ответ собирается из готовых фрагментов без построения моделей pydantic
+    content = '{"scans": [%s], "total": %d, "next_cursor": %s}' % (
+        ", ".join(serialize_scan(db, scan) for scan in scans),
+        total,
+        json.dumps(next_cursor)
     )
+    return Response(content=content, media_type="application/json")
@@ -1,13 +1,16 @@
 # backend/routers/subscription_router.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from models import User, Subscription, SubscriptionType, SubscriptionStatus
+from models import Subscription, SubscriptionType, SubscriptionStatus
 from database import get_db
-from auth import get_current_user
+from auth import current_entitlement, get_current_user
+from services.user_cache import UserSnapshot
+from services.entitlements import active_subscription
+from services.subscriptions import calculate_end_date
 
 router = APIRouter(prefix="/api/subscription", tags=["subscription"])
 
@@ -28,32 +31,21 @@ class SubscriptionStatusResponse(BaseModel):
     has_active_subscription: bool
     subscription: Optional[SubscriptionResponse] = None
 
-def calculate_end_date(subscription_type: SubscriptionType, start_date: datetime) -> datetime:
-    """Вычисление даты окончания подписки"""
-    if subscription_type == SubscriptionType.TRIAL:
-        return start_date + timedelta(days=7)
-    elif subscription_type == SubscriptionType.EXPRESS:
-        return start_date + timedelta(days=30)
-    elif subscription_type == SubscriptionType.QUARTER:
-        return start_date + timedelta(days=90)
-    elif subscription_type == SubscriptionType.ANNUAL:
-        return start_date + timedelta(days=365)
-    else:
-        raise ValueError("Invalid subscription type")
-
 @router.get("/status", response_model=SubscriptionStatusResponse)
 async def get_subscription_status(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Получение статуса подписки пользователя"""
     
+    # Свежий claim токена без подписки отвечает без запроса к базе данных
+    if not current_entitlement(request, response, current_user, db).is_active():
+        return SubscriptionStatusResponse(has_active_subscription=False)
+    
     # Ищем активную подписку
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE,
-        Subscription.end_date > datetime.utcnow()
-    ).order_by(Subscription.end_date.desc()).first()
+    subscription = active_subscription(db, current_user.id)
     
     if not subscription:
         return SubscriptionStatusResponse(has_active_subscription=False)
@@ -77,7 +69,7 @@ async def get_subscription_status(
 @router.post("/create", response_model=SubscriptionResponse)
 async def create_subscription(
     request: CreateSubscriptionRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Создание новой подписки"""
@@ -92,11 +84,7 @@ async def create_subscription(
         )
     
     # Проверяем, есть ли уже активная подписка
-    existing_subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE,
-        Subscription.end_date > datetime.utcnow()
-    ).first()
+    existing_subscription = active_subscription(db, current_user.id)
     
     if existing_subscription:
         raise HTTPException(
@@ -151,7 +139,7 @@ async def create_subscription(
 @router.post("/{subscription_id}/cancel")
 async def cancel_subscription(
     subscription_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Отмена подписки"""
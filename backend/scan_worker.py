@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# backend/scan_worker.py
+
+import os
+import signal
+import time
+import logging
+
+from database import SessionLocal, sync_schema
+from services.conditions import sync_conditions
+from services.scan_queue import ScanWorkerPool
+
+# Отдельный запуск пула воркеров обработки сканирований
+# (используется вместе с SCAN_WORKERS=0 у веб-приложения)
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    sync_schema()
+    db = SessionLocal()
+    try:
+        sync_conditions(db)
+    finally:
+        db.close()
+
+    size = int(os.getenv("SCAN_WORKERS", "2")) or 1
+    pool = ScanWorkerPool(size)
+    pool.start()
+    print(f"🔧 Запущено воркеров сканирования: {size}")
+
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("⏹ Остановка воркеров...")
+        pool.stop()
+
+if __name__ == "__main__":
+    main()
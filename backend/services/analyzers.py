@@ -0,0 +1,230 @@
+# backend/services/analyzers.py
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Protocol, Tuple, Union
+
+import anyio
+from PIL import Image
+
+from services.inference import load_model, predict_image
+
+# Асинхронный интерфейс анализатора изображений.
+# Модель (что анализирует) задается в services/inference.py,
+# бэкенд определяет, где выполняется синхронная функция анализа:
+# в текущем потоке, в пуле потоков, в пуле процессов или в отдельном
+# процессе-сервере за локальным сокетом. У каждого бэкенда свой лимит
+# параллельности, поэтому медленная модель не занимает общий пул потоков,
+# которым пользуются остальные эндпоинты.
+
+logger = logging.getLogger(__name__)
+
+# Бэкенд выполнения: inline, thread, process, socket, batch
+ANALYZER_BACKEND = os.getenv("ANALYZER_BACKEND", "thread")
+# Максимальное количество одновременных анализов в бэкенде
+ANALYZER_CONCURRENCY = int(os.getenv("ANALYZER_CONCURRENCY", "2"))
+# Адрес сервера анализа: путь к unix-сокету или host:port
+ANALYZER_SOCKET = os.getenv("ANALYZER_SOCKET", "analyzer.sock")
+
+AnalyzerInput = Union[str, Image.Image]
+AnalyzeFunc = Callable[[AnalyzerInput], Dict]
+
+class ImageAnalyzer(Protocol):
+    """Протокол асинхронного анализатора изображений"""
+
+    name: str
+
+    async def analyze(self, image: AnalyzerInput) -> Dict:
+        ...
+
+    async def warmup(self) -> None:
+        ...
+
+    async def aclose(self) -> None:
+        ...
+
+class InlineAnalyzer:
+    """
+    Анализ прямо в потоке событийного цикла.
+    Подходит только для быстрых моделей и тестов.
+    """
+
+    name = "inline"
+
+    def __init__(self, func: AnalyzeFunc = predict_image, concurrency: int = 1):
+        self.func = func
+        self._limiter = asyncio.Semaphore(concurrency)
+
+    async def analyze(self, image: AnalyzerInput) -> Dict:
+        async with self._limiter:
+            return self.func(image)
+
+    async def warmup(self) -> None:
+        load_model()
+
+    async def aclose(self) -> None:
+        pass
+
+class ThreadPoolAnalyzer:
+    """Анализ в пуле потоков с собственным лимитом"""
+
+    name = "thread"
+
+    def __init__(self, func: AnalyzeFunc = predict_image, concurrency: int = ANALYZER_CONCURRENCY):
+        self.func = func
+        self._limiter = anyio.CapacityLimiter(concurrency)
+
+    async def analyze(self, image: AnalyzerInput) -> Dict:
+        return await anyio.to_thread.run_sync(self.func, image, limiter=self._limiter)
+
+    async def warmup(self) -> None:
+        await anyio.to_thread.run_sync(load_model, limiter=self._limiter)
+
+    async def aclose(self) -> None:
+        pass
+
+class ProcessPoolAnalyzer:
+    """Анализ в пуле процессов (обходит GIL для тяжелых моделей на Python)"""
+
+    name = "process"
+
+    def __init__(self, func: AnalyzeFunc = predict_image, concurrency: int = ANALYZER_CONCURRENCY):
+        self.func = func
+        self._limiter = asyncio.Semaphore(concurrency)
+        self._executor = ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def analyze(self, image: AnalyzerInput) -> Dict:
+        async with self._limiter:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self.func, image)
+
+    async def warmup(self) -> None:
+        # Модель загружается в каждом процессе пула при первом обращении
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(self._executor, load_model)
+            for _ in range(self._executor._max_workers)
+        ])
+
+    async def aclose(self) -> None:
+        self._executor.shutdown(wait=True)
+
+# Протокол обмена с сервером анализа:
+# 4 байта длины заголовка, JSON-заголовок, затем payload_size байт данных.
+
+def _encode_frame(header: Dict[str, Any], payload: bytes = b"") -> bytes:
+    header = dict(header, payload_size=len(payload))
+    raw_header = json.dumps(header, ensure_ascii=False).encode()
+    return struct.pack(">I", len(raw_header)) + raw_header + payload
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], bytes]:
+    (header_size,) = struct.unpack(">I", await reader.readexactly(4))
+    header = json.loads(await reader.readexactly(header_size))
+    payload = await reader.readexactly(header.get("payload_size", 0))
+    return header, payload
+
+def _encode_image_request(image: AnalyzerInput) -> bytes:
+    if isinstance(image, str):
+        return _encode_frame({"path": os.path.abspath(image)})
+    return _encode_frame({"mode": image.mode, "size": list(image.size)}, image.tobytes())
+
+def _decode_image_request(header: Dict[str, Any], payload: bytes) -> AnalyzerInput:
+    if "path" in header:
+        return header["path"]
+    return Image.frombytes(header["mode"], tuple(header["size"]), payload)
+
+async def _open_connection(address: str):
+    if ":" in address and not os.path.exists(address):
+        host, port = address.rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(address)
+
+class SocketAnalyzer:
+    """Анализ в отдельном процессе-сервере через локальный сокет"""
+
+    name = "socket"
+
+    def __init__(self, address: str = ANALYZER_SOCKET, concurrency: int = ANALYZER_CONCURRENCY):
+        self.address = address
+        self._limiter = asyncio.Semaphore(concurrency)
+
+    async def analyze(self, image: AnalyzerInput) -> Dict:
+        async with self._limiter:
+            reader, writer = await _open_connection(self.address)
+            try:
+                writer.write(_encode_image_request(image))
+                await writer.drain()
+                header, _ = await _read_frame(reader)
+            finally:
+                writer.close()
+                await writer.wait_closed()
+
+        if "error" in header:
+            raise RuntimeError(f"Analyzer server error: {header['error']}")
+        return header["result"]
+
+    async def warmup(self) -> None:
+        # Модель загружает сам сервер анализа
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+async def serve_analyzer(
+    address: str = ANALYZER_SOCKET,
+    func: AnalyzeFunc = predict_image,
+    concurrency: int = ANALYZER_CONCURRENCY
+):
+    """Запуск сервера анализа на локальном сокете"""
+    backend = ThreadPoolAnalyzer(func, concurrency)
+    await backend.warmup()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            header, payload = await _read_frame(reader)
+            try:
+                result = await backend.analyze(_decode_image_request(header, payload))
+                response = {"result": result}
+            except Exception as e:
+                logger.exception("Analyzer request failed")
+                response = {"error": str(e)}
+            writer.write(_encode_frame(response))
+            await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    if ":" in address and not os.path.exists(address):
+        host, port = address.rsplit(":", 1)
+        server = await asyncio.start_server(handle, host, int(port))
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = await asyncio.start_unix_server(handle, address)
+
+    async with server:
+        await server.serve_forever()
+
+def create_analyzer(backend: str = ANALYZER_BACKEND, func: Optional[AnalyzeFunc] = None) -> ImageAnalyzer:
+    """Создание анализатора по имени бэкенда"""
+    func = func or predict_image
+    if backend == "inline":
+        return InlineAnalyzer(func)
+    if backend == "thread":
+        return ThreadPoolAnalyzer(func)
+    if backend == "process":
+        return ProcessPoolAnalyzer(func)
+    if backend == "socket":
+        return SocketAnalyzer()
+    if backend == "batch":
+        from services.batching import BatchingAnalyzer
+        return BatchingAnalyzer()
+    raise ValueError(f"Unknown analyzer backend: {backend}")
@@ -0,0 +1,170 @@
+# backend/services/batching.py
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import anyio
+from PIL import Image
+
+from services.inference import load_model, predict_images
+from services.preprocessing import decode_for_model
+
+# Микробатчинг инференса: запросы на анализ копятся до max_batch_size
+# изображений или max_wait_ms миллисекунд, затем обрабатываются одним
+# векторизованным проходом модели, и результаты раздаются ожидающим.
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер батча
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+# Максимальное ожидание добора батча в миллисекундах
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "20"))
+
+BatchFunc = Callable[[List[Image.Image]], List[Dict]]
+
+# Сколько последних замеров задержки хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 2)
+
+class MicroBatcher:
+    """Сборщик запросов в батчи с ограничением размера и времени ожидания"""
+
+    def __init__(
+        self,
+        batch_fn: BatchFunc = predict_images,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        concurrency: int = 1
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._limiter = anyio.CapacityLimiter(concurrency)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Статистика
+        self._batches = 0
+        self._images = 0
+        self._errors = 0
+        self._size_histogram: Dict[int, int] = {}
+        self._latencies_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._inference_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    async def submit(self, image: Image.Image) -> Dict:
+        """Добавление изображения в очередной батч и ожидание результата"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Image.Image, asyncio.Future, float]]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            images = [item[0] for item in batch]
+
+            started = time.perf_counter()
+            try:
+                results = await anyio.to_thread.run_sync(self.batch_fn, images, limiter=self._limiter)
+                if len(results) != len(batch):
+                    raise RuntimeError("Batch function returned wrong number of results")
+            except Exception as e:
+                logger.exception("Batch inference failed")
+                self._errors += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            self._batches += 1
+            self._images += len(batch)
+            self._size_histogram[len(batch)] = self._size_histogram.get(len(batch), 0) + 1
+            self._inference_ms.append((finished - started) * 1000)
+            for (_, future, enqueued_at), result in zip(batch, results):
+                self._latencies_ms.append((finished - enqueued_at) * 1000)
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict:
+        """Статистика размеров батчей и задержек"""
+        latencies = list(self._latencies_ms)
+        inference = list(self._inference_ms)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self._batches,
+            "images": self._images,
+            "errors": self._errors,
+            "avg_batch_size": round(self._images / self._batches, 2) if self._batches else None,
+            "batch_size_histogram": dict(sorted(self._size_histogram.items())),
+            "latency_ms": {
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "p99": _percentile(latencies, 99)
+            },
+            "inference_ms": {
+                "p50": _percentile(inference, 50),
+                "p95": _percentile(inference, 95)
+            }
+        }
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class BatchingAnalyzer:
+    """Анализатор, объединяющий одновременные запросы в батчи"""
+
+    name = "batch"
+
+    def __init__(self, batch_fn: BatchFunc = predict_images):
+        self.batcher = MicroBatcher(batch_fn)
+
+    @property
+    def max_batch_size(self) -> int:
+        return self.batcher.max_batch_size
+
+    async def analyze(self, image) -> Dict:
+        if isinstance(image, str):
+            image = await anyio.to_thread.run_sync(decode_for_model, image)
+        return await self.batcher.submit(image)
+
+    def stats(self) -> Dict:
+        return self.batcher.stats()
+
+    async def warmup(self) -> None:
+        await anyio.to_thread.run_sync(load_model)
+
+    async def aclose(self) -> None:
+        await self.batcher.aclose()
@@ -0,0 +1,159 @@
+# backend/services/conditions.py
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from models import Condition, Scan
+from services.image_analyzer import MEDICAL_CONDITIONS
+
+# Каталог медицинских состояний. Описание и рекомендации хранятся один раз
+# на версию состояния, а сканы ссылаются на версию по condition_id.
+# Каталог небольшой и почти не меняется, поэтому держится в памяти процесса
+# вместе с заранее сериализованными JSON-фрагментами для ответов API.
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    id: int
+    name: str
+    version: int
+    description: str
+    recommendations: Tuple[str, ...]
+    # Готовый фрагмент JSON: "condition_detected": ..., "description": ..., "recommendations": [...]
+    fragment: str
+
+def _fragment(name: Optional[str], description: Optional[str], recommendations: List[str]) -> str:
+    return json.dumps({
+        "condition_detected": name,
+        "description": description,
+        "recommendations": recommendations
+    }, ensure_ascii=False)[1:-1]
+
+def _parse_recommendations(raw: Optional[str]) -> List[str]:
+    if not raw:
+        return []
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return []
+
+class ConditionCatalog:
+    """Кэш каталога состояний в памяти процесса"""
+
+    def __init__(self):
+        self._by_id: Dict[int, CatalogEntry] = {}
+        self._latest: Dict[str, CatalogEntry] = {}
+        self._lock = threading.Lock()
+
+    def reload(self, db: Session):
+        """Загрузка всего каталога из базы данных"""
+        by_id = {}
+        latest = {}
+        for row in db.query(Condition).order_by(Condition.name, Condition.version).all():
+            recommendations = _parse_recommendations(row.recommendations)
+            entry = CatalogEntry(
+                id=row.id,
+                name=row.name,
+                version=row.version,
+                description=row.description,
+                recommendations=tuple(recommendations),
+                fragment=_fragment(row.name, row.description, recommendations)
+            )
+            by_id[entry.id] = entry
+            latest[entry.name] = entry
+        with self._lock:
+            self._by_id = by_id
+            self._latest = latest
+
+    def get(self, db: Session, condition_id: int) -> Optional[CatalogEntry]:
+        """Версия состояния по id (каталог перечитывается, если ее нет в памяти)"""
+        entry = self._by_id.get(condition_id)
+        if entry is None:
+            self.reload(db)
+            entry = self._by_id.get(condition_id)
+        return entry
+
+    def latest(self, db: Session, name: str) -> Optional[CatalogEntry]:
+        """Текущая версия состояния по названию"""
+        if not self._latest:
+            self.reload(db)
+        return self._latest.get(name)
+
+    def names(self, db: Session) -> List[str]:
+        """Названия состояний каталога"""
+        if not self._latest:
+            self.reload(db)
+        return list(self._latest)
+
+def sync_conditions(db: Session) -> int:
+    """
+    Заполнение каталога из MEDICAL_CONDITIONS: новое состояние или
+    измененный текст добавляются новой версией. Возвращает количество новых версий.
+    Заодно переносит в каталог текст старых сканов, записанных до его появления.
+    """
+    latest = {}
+    for row in db.query(Condition).order_by(Condition.version).all():
+        latest[row.name] = row
+
+    added = 0
+    for condition in MEDICAL_CONDITIONS:
+        recommendations = json.dumps(condition["recommendations"], ensure_ascii=False)
+        current = latest.get(condition["condition"])
+        if current is not None and current.description == condition["description"] \
+                and current.recommendations == recommendations:
+            continue
+        row = Condition(
+            name=condition["condition"],
+            version=current.version + 1 if current is not None else 1,
+            description=condition["description"],
+            recommendations=recommendations
+        )
+        db.add(row)
+        latest[row.name] = row
+        added += 1
+    db.flush()
+
+    # Сканы с тем же текстом, что и в каталоге, ссылаются на каталог вместо копии текста
+    migrated = 0
+    for row in db.query(Condition).all():
+        migrated += db.execute(
+            update(Scan)
+            .where(
+                Scan.condition_id.is_(None),
+                Scan.condition_detected == row.name,
+                Scan.description == row.description,
+                Scan.recommendations == row.recommendations
+            )
+            .values(condition_id=row.id, description=None, recommendations=None)
+        ).rowcount
+    db.commit()
+
+    if added or migrated:
+        logger.info("Condition catalog: %s new versions, %s scans migrated", added, migrated)
+    condition_catalog.reload(db)
+    return added
+
+def scan_condition_fields(db: Session, scan: Scan) -> Tuple[Optional[str], Optional[str], List[str]]:
+    """Название, описание и рекомендации скана из каталога или из самого скана"""
+    if scan.condition_id is not None:
+        entry = condition_catalog.get(db, scan.condition_id)
+        if entry is not None:
+            return entry.name, entry.description, list(entry.recommendations)
+    return scan.condition_detected, scan.description, _parse_recommendations(scan.recommendations)
+
+def scan_condition_fragment(db: Session, scan: Scan) -> str:
+    """JSON-фрагмент с полями состояния скана"""
+    if scan.condition_id is not None:
+        entry = condition_catalog.get(db, scan.condition_id)
+        if entry is not None:
+            return entry.fragment
+    return _fragment(scan.condition_detected, scan.description, _parse_recommendations(scan.recommendations))
+
+# Каталог состояний процесса
+condition_catalog = ConditionCatalog()
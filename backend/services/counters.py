@@ -0,0 +1,128 @@
+# backend/services/counters.py
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from models import QueryHistory, Scan, ScanStatus, UserCounters
+
+# Денормализованные счетчики пользователя вместо COUNT(*) на каждой странице.
+# Изменение счетчика выполняется в той же транзакции, что и вставка или
+# удаление записей. Если счетчика еще нет, он создается сразу с точными
+# значениями, поэтому пользователи, появившиеся до счетчиков, не требуют миграции.
+# Расхождения (ручные правки базы, сбои) исправляет reconcile_counters.
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ("scans", "completed_scans", "history_entries")
+
+def _actual_counts(user_id):
+    """Точные значения счетчиков (подзапросы, можно использовать внутри INSERT)"""
+    return {
+        "scans": select(func.count(Scan.id)).where(Scan.user_id == user_id).scalar_subquery(),
+        "completed_scans": select(func.count(Scan.id)).where(
+            Scan.user_id == user_id,
+            Scan.status == ScanStatus.COMPLETED
+        ).scalar_subquery(),
+        "history_entries": select(func.count(QueryHistory.id)).where(
+            QueryHistory.user_id == user_id
+        ).scalar_subquery(),
+    }
+
+def _insert_missing(db: Session, user_id: int) -> bool:
+    """Создание счетчика с точными значениями, False если он уже существует"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy import insert
+
+    statement = insert(UserCounters).values(user_id=user_id, **_actual_counts(user_id))
+    if hasattr(statement, "on_conflict_do_nothing"):
+        # Параллельный запрос мог уже создать счетчик
+        statement = statement.on_conflict_do_nothing(index_elements=[UserCounters.user_id])
+    return db.execute(statement).rowcount == 1
+
+def bump_counters(db: Session, user_id: int, **deltas: int):
+    """
+    Изменение счетчиков пользователя на deltas (scans=1, history_entries=-3, ...).
+    Коммит выполняет вызывающий код вместе с изменением самих записей.
+    """
+    unknown = set(deltas) - set(COUNTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown counters: {', '.join(sorted(unknown))}")
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    # Записи должны попасть в базу до изменения счетчика: новый счетчик
+    # считается по таблицам и уже включает их
+    db.flush()
+    statement = (
+        update(UserCounters)
+        .where(UserCounters.user_id == user_id)
+        .values({name: getattr(UserCounters, name) + delta for name, delta in deltas.items()})
+    )
+    if db.execute(statement).rowcount == 0 and not _insert_missing(db, user_id):
+        # Счетчик создан параллельной транзакцией, которая не видела наши записи
+        db.execute(statement)
+
+def get_counters(db: Session, user_id: int) -> Dict[str, int]:
+    """Счетчики пользователя (создаются при первом обращении)"""
+    row = db.query(*[getattr(UserCounters, name) for name in COUNTER_FIELDS]).filter(
+        UserCounters.user_id == user_id
+    ).first()
+    if row is None:
+        _insert_missing(db, user_id)
+        db.commit()
+        return get_counters(db, user_id)
+    return dict(zip(COUNTER_FIELDS, row))
+
+def reconcile_counters(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    Сверка счетчиков с таблицами и исправление расхождений.
+    Возвращает количество исправленных пользователей. Коммит выполняет вызывающий код.
+    """
+    scans = select(
+        Scan.user_id,
+        func.count(Scan.id).label("scans"),
+        func.count(Scan.id).filter(Scan.status == ScanStatus.COMPLETED).label("completed_scans")
+    ).group_by(Scan.user_id)
+    history = select(
+        QueryHistory.user_id,
+        func.count(QueryHistory.id).label("history_entries")
+    ).group_by(QueryHistory.user_id)
+    if user_id is not None:
+        scans = scans.where(Scan.user_id == user_id)
+        history = history.where(QueryHistory.user_id == user_id)
+
+    actual: Dict[int, Dict[str, int]] = {}
+    for row in db.execute(scans):
+        actual.setdefault(row.user_id, dict.fromkeys(COUNTER_FIELDS, 0)).update(
+            scans=row.scans, completed_scans=row.completed_scans
+        )
+    for row in db.execute(history):
+        actual.setdefault(row.user_id, dict.fromkeys(COUNTER_FIELDS, 0))["history_entries"] = row.history_entries
+
+    stored = db.query(UserCounters)
+    if user_id is not None:
+        stored = stored.filter(UserCounters.user_id == user_id)
+
+    # Отсутствующие счетчики не создаем: они появятся при первом изменении или чтении
+    fixed = 0
+    for counters in stored.all():
+        values = actual.get(counters.user_id, dict.fromkeys(COUNTER_FIELDS, 0))
+        if any(getattr(counters, name) != values[name] for name in COUNTER_FIELDS):
+            logger.warning(
+                "Counters drift for user %s: %s -> %s",
+                counters.user_id,
+                {name: getattr(counters, name) for name in COUNTER_FIELDS},
+                values
+            )
+            for name in COUNTER_FIELDS:
+                setattr(counters, name, values[name])
+            fixed += 1
+    return fixed
@@ -0,0 +1,102 @@
+# backend/services/data_versions.py
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from models import DataVersion, Literature
+
+# Версии данных для инвалидации кэшей ответов.
+# Номер версии хранится в таблице data_versions и увеличивается в той же
+# транзакции, что и изменение данных, поэтому изменения из других процессов
+# (другие воркеры uvicorn, импорт) тоже меняют версию. Процесс читает версию
+# не чаще раза в DATA_VERSION_CHECK_INTERVAL секунд, а после собственного
+# коммита - сразу.
+
+# Интервал перечитывания версии из базы данных (секунды)
+DATA_VERSION_CHECK_INTERVAL = float(os.getenv("DATA_VERSION_CHECK_INTERVAL", "1"))
+
+LITERATURE = "literature"
+
+# Модели, изменение которых меняет версию
+_TRACKED_MODELS = {Literature: LITERATURE}
+
+def _insert_missing(connection, name: str):
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy import insert
+
+    statement = insert(DataVersion).values(name=name, version=0)
+    if hasattr(statement, "on_conflict_do_nothing"):
+        # Строку версии могла создать параллельная транзакция
+        statement = statement.on_conflict_do_nothing(index_elements=[DataVersion.name])
+    connection.execute(statement)
+
+def bump_version(db: Session, name: str):
+    """
+    Увеличение версии name в текущей транзакции.
+    Вызывается автоматически при записи отслеживаемых моделей через ORM;
+    массовые UPDATE/INSERT без объектов должны вызывать ее сами.
+    """
+    connection = db.connection()
+    statement = update(DataVersion).where(DataVersion.name == name).values(version=DataVersion.version + 1)
+    if connection.execute(statement).rowcount == 0:
+        _insert_missing(connection, name)
+        connection.execute(statement)
+    db.info.setdefault("bumped_versions", set()).add(name)
+
+class VersionTracker:
+    """Текущие версии данных в памяти процесса"""
+
+    def __init__(self):
+        self._values: Dict[str, int] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def current(self, db: Session, name: str) -> int:
+        now = time.monotonic()
+        with self._lock:
+            if name in self._values and now - self._checked_at[name] < DATA_VERSION_CHECK_INTERVAL:
+                return self._values[name]
+
+        version = db.scalar(select(DataVersion.version).where(DataVersion.name == name)) or 0
+        with self._lock:
+            self._values[name] = version
+            self._checked_at[name] = now
+        return version
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            if name is None:
+                self._values.clear()
+            else:
+                self._values.pop(name, None)
+
+# Версии данных процесса
+data_versions = VersionTracker()
+
+@event.listens_for(Session, "after_flush")
+def _bump_changed_versions(session, flush_context):
+    names = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        name = _TRACKED_MODELS.get(type(obj))
+        if name is not None and (obj not in session.dirty or session.is_modified(obj)):
+            names.add(name)
+    for name in names:
+        bump_version(session, name)
+
+@event.listens_for(Session, "after_commit")
+def _refresh_bumped_versions(session):
+    for name in session.info.pop("bumped_versions", ()):
+        data_versions.invalidate(name)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_bumped_versions(session):
+    session.info.pop("bumped_versions", None)
@@ -0,0 +1,123 @@
+# backend/services/entitlements.py
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+
+from models import Subscription, SubscriptionStatus, User
+from services.user_cache import UserSnapshot, user_cache
+
+# Право на платные функции (активная подписка) в JWT.
+# Токен содержит claim "ent": план, дату окончания подписки, эпоху прав
+# пользователя и срок свежести claim. Пока claim свежий и его эпоха совпадает
+# с User.entitlement_epoch (из кэша пользователей), проверка подписки не
+# обращается к базе данных. Любое изменение подписок пользователя через ORM
+# увеличивает эпоху в той же транзакции; массовые UPDATE подписок должны
+# вызывать bump_entitlement_epoch сами. Иначе подписка читается из базы,
+# а клиент получает обновленный токен в заголовке ответа.
+
+# Срок свежести claim о подписке (секунды)
+ENTITLEMENT_REFRESH_SECONDS = int(os.getenv("ENTITLEMENT_REFRESH_SECONDS", "300"))
+
+# Заголовок ответа с обновленным токеном
+REFRESHED_TOKEN_HEADER = "X-Access-Token"
+
+@dataclass(frozen=True)
+class Entitlement:
+    # Тип подписки (None - подписки нет)
+    plan: Optional[str]
+    # Окончание подписки (unix time)
+    end: Optional[float]
+    epoch: int
+
+    def is_active(self, now: Optional[float] = None) -> bool:
+        return self.plan is not None and self.end is not None and self.end > (now or time.time())
+
+def _timestamp(value: datetime) -> float:
+    # Даты подписок записываются как datetime.utcnow() без часового пояса
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def active_subscription(db: Session, user_id: int) -> Optional[Subscription]:
+    """Действующая подписка пользователя с самой поздней датой окончания"""
+    return db.query(Subscription).filter(
+        Subscription.user_id == user_id,
+        Subscription.status == SubscriptionStatus.ACTIVE,
+        Subscription.end_date > datetime.utcnow()
+    ).order_by(Subscription.end_date.desc()).first()
+
+def load_entitlement(db: Session, user_id: int, epoch: int) -> Entitlement:
+    """Право пользователя из базы данных (epoch - текущая эпоха прав пользователя)"""
+    subscription = active_subscription(db, user_id)
+    if subscription is None:
+        return Entitlement(plan=None, end=None, epoch=epoch)
+    return Entitlement(
+        plan=subscription.subscription_type.value,
+        end=_timestamp(subscription.end_date),
+        epoch=epoch
+    )
+
+def entitlement_claim(entitlement: Entitlement) -> Dict:
+    """Claim "ent" для JWT"""
+    return {
+        "plan": entitlement.plan,
+        "end": entitlement.end,
+        "epoch": entitlement.epoch,
+        "fresh_until": int(time.time()) + ENTITLEMENT_REFRESH_SECONDS
+    }
+
+def _from_claim(claim) -> Optional[Tuple[Entitlement, float]]:
+    if not isinstance(claim, dict):
+        return None
+    try:
+        return Entitlement(plan=claim["plan"], end=claim["end"], epoch=int(claim["epoch"])), float(claim["fresh_until"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def resolve_entitlement(db: Session, user: UserSnapshot, claims: Optional[Dict]) -> Tuple[Entitlement, bool]:
+    """
+    Право пользователя по claim токена или из базы данных.
+    Второе значение - True, если claim устарел и токен нужно выпустить заново.
+    """
+    parsed = _from_claim((claims or {}).get("ent"))
+    if parsed is not None:
+        entitlement, fresh_until = parsed
+        if entitlement.epoch == user.entitlement_epoch and time.time() < fresh_until:
+            return entitlement, False
+    return load_entitlement(db, user.id, user.entitlement_epoch), True
+
+def bump_entitlement_epoch(db: Session, user_ids: Iterable[int]):
+    """Увеличение эпохи прав пользователей в текущей транзакции"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    db.connection().execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(entitlement_epoch=func.coalesce(User.entitlement_epoch, 0) + 1)
+    )
+    db.info.setdefault("entitlement_user_ids", set()).update(user_ids)
+
+@event.listens_for(Session, "after_flush")
+def _bump_changed_subscriptions(session, flush_context):
+    user_ids = {
+        obj.user_id
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, Subscription) and (obj not in session.dirty or session.is_modified(obj))
+    }
+    bump_entitlement_epoch(session, user_ids)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_entitled_users(session):
+    # Снимок пользователя в кэше содержит эпоху прав
+    for user_id in session.info.pop("entitlement_user_ids", ()):
+        user_cache.invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_entitled_users(session):
+    session.info.pop("entitlement_user_ids", None)
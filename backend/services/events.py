@@ -0,0 +1,247 @@
+# backend/services/events.py
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Scan, ScanStatus
+from services.conditions import scan_condition_fields
+
+# Оповещения об изменении статуса сканирований.
+# Хаб живет в веб-процессе и раздает события подписчикам (SSE и WebSocket)
+# по user_id. Воркеры пула присылают события через очередь multiprocessing,
+# ScanWorkerPool пересылает их в хаб. Для воркеров, запущенных отдельно
+# (scan_worker.py, SCAN_WORKERS=0 у приложения), один ScanEventPoller на
+# процесс раз в SCAN_EVENTS_FALLBACK_INTERVAL секунд читает из базы данных
+# завершения сканов всех подписанных пользователей одним запросом и
+# публикует их в хаб; сами подписчики базу данных не опрашивают.
+
+logger = logging.getLogger(__name__)
+
+# Интервал сверки с базой данных (воркеры вне процесса) и keep-alive подписчиков (секунды)
+SCAN_EVENTS_FALLBACK_INTERVAL = float(os.getenv("SCAN_EVENTS_FALLBACK_INTERVAL", "5"))
+# Максимальное количество недоставленных событий у одного подписчика
+SCAN_EVENTS_QUEUE_SIZE = int(os.getenv("SCAN_EVENTS_QUEUE_SIZE", "100"))
+
+FINAL_STATUSES = (ScanStatus.COMPLETED.value, ScanStatus.FAILED.value)
+
+def scan_event(db: Session, scan: Scan) -> Dict:
+    """Событие о текущем состоянии скана (JSON-сериализуемое)"""
+    condition, description, recommendations = scan_condition_fields(db, scan)
+    return {
+        "user_id": scan.user_id,
+        "scan": {
+            "id": scan.id,
+            "status": scan.status.value,
+            "condition_detected": condition,
+            "description": description,
+            "confidence": scan.confidence,
+            "recommendations": recommendations,
+            "created_at": scan.created_at.isoformat() if scan.created_at else None,
+            "processed_at": scan.processed_at.isoformat() if scan.processed_at else None
+        }
+    }
+
+def is_final(event: Dict) -> bool:
+    return event["scan"]["status"] in FINAL_STATUSES
+
+Subscriber = Tuple[asyncio.AbstractEventLoop, asyncio.Queue]
+
+class ScanEventHub:
+    """Раздача событий сканирований подписчикам внутри процесса"""
+
+    def __init__(self, queue_size: int = SCAN_EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Subscriber]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, user_id: int) -> AsyncIterator[asyncio.Queue]:
+        """Подписка на события пользователя на время блока with"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(subscriber)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+    def publish(self, event: Dict):
+        """Отправка события подписчикам (можно вызывать из любого потока)"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(event["user_id"], ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_deliver, queue, event)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                pass
+
+    def user_ids(self) -> List[int]:
+        """Пользователи, у которых есть подписчики"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+def _deliver(queue: asyncio.Queue, event: Dict):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # Медленный клиент: событие пропускаем, состояние он получит при сверке с базой
+        logger.warning("Dropping scan event for slow subscriber")
+
+def load_scan_event(db: Session, scan_id: int) -> Optional[Dict]:
+    """Текущее состояние скана из базы данных"""
+    scan = db.query(Scan).filter(Scan.id == scan_id).first()
+    return scan_event(db, scan) if scan else None
+
+def load_events_since(db: Session, user_ids: List[int], since: datetime) -> List[Dict]:
+    """События по сканам пользователей user_ids, завершенным после since"""
+    events = []
+    for start in range(0, len(user_ids), 500):
+        scans = db.query(Scan).filter(
+            Scan.user_id.in_(user_ids[start:start + 500]),
+            Scan.processed_at > since
+        ).order_by(Scan.processed_at).all()
+        events.extend(scan_event(db, scan) for scan in scans)
+    return events
+
+def _with_session(func, *args):
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return func(db, *args)
+    finally:
+        db.close()
+
+class ScanEventPoller:
+    """
+    Общая сверка с базой данных для воркеров вне процесса: завершенные
+    сканы подписанных пользователей публикуются в хаб.
+    """
+
+    def __init__(self, hub: "ScanEventHub", interval: float = SCAN_EVENTS_FALLBACK_INTERVAL):
+        self.hub = hub
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        # Опубликованные (скан, статус): окна соседних сверок перекрываются
+        self._published: Dict[Tuple[int, str], None] = {}
+        self.polls = 0
+
+    def start(self):
+        """Запуск в текущем цикле событий"""
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def _remember(self, event: Dict) -> bool:
+        key = (event["scan"]["id"], event["scan"]["status"])
+        if key in self._published:
+            return False
+        self._published[key] = None
+        if len(self._published) > SCAN_EVENTS_QUEUE_SIZE * 100:
+            self._published.pop(next(iter(self._published)))
+        return True
+
+    async def _run(self):
+        since = datetime.utcnow()
+        while True:
+            await asyncio.sleep(self.interval)
+            started = datetime.utcnow()
+            user_ids = self.hub.user_ids()
+            if not user_ids:
+                since = started
+                continue
+            try:
+                # Окно с запасом в интервал: коммит воркера может прийти позже processed_at
+                events = await asyncio.to_thread(
+                    _with_session, load_events_since, user_ids, since - timedelta(seconds=self.interval)
+                )
+            except Exception:
+                logger.exception("Failed to poll scan events")
+                continue
+            self.polls += 1
+            since = started
+            for event in events:
+                if self._remember(event):
+                    self.hub.publish(event)
+
+async def watch_scan(scan_id: int, user_id: int) -> AsyncIterator[Optional[Dict]]:
+    """
+    Текущее состояние скана, затем его изменения до завершения обработки.
+    None означает, что за интервал keep-alive событий не было.
+    """
+    async with event_hub.subscribe(user_id) as queue:
+        # Подписываемся до чтения из базы, чтобы не пропустить завершение между ними
+        current = await asyncio.to_thread(_with_session, load_scan_event, scan_id)
+        if current is None:
+            return
+        yield current
+
+        while not is_final(current):
+            try:
+                event = await asyncio.wait_for(queue.get(), SCAN_EVENTS_FALLBACK_INTERVAL)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event["scan"]["id"] != scan_id or event["scan"]["status"] == current["scan"]["status"]:
+                continue
+            current = event
+            yield current
+
+async def watch_user(user_id: int) -> AsyncIterator[Optional[Dict]]:
+    """
+    Завершения сканов пользователя.
+    None означает, что за интервал keep-alive событий не было.
+    """
+    # Сканы, о которых уже сообщили (событие могут прислать и пул, и сверка с базой)
+    delivered: Dict[int, None] = {}
+
+    def remember(scan_id: int) -> bool:
+        if scan_id in delivered:
+            return False
+        delivered[scan_id] = None
+        if len(delivered) > SCAN_EVENTS_QUEUE_SIZE * 10:
+            delivered.pop(next(iter(delivered)))
+        return True
+
+    async with event_hub.subscribe(user_id) as queue:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), SCAN_EVENTS_FALLBACK_INTERVAL)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if not is_final(event) or remember(event["scan"]["id"]):
+                yield event
+
+def format_sse(event: Dict) -> str:
+    """Кадр Server-Sent Events с состоянием скана"""
+    data = json.dumps(event["scan"], ensure_ascii=False)
+    return f"event: scan\ndata: {data}\n\n"
+
+# Хаб событий веб-процесса
+event_hub = ScanEventHub()
+# Сверка с базой данных веб-процесса (запускается, если воркеры работают отдельно)
+scan_event_poller = ScanEventPoller(event_hub)
@@ -0,0 +1,209 @@
+# backend/services/history_buffer.py
+import asyncio
+import logging
+import os
+import threading
+from collections import Counter, deque
+from typing import Deque, Dict, Optional
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from models import QueryHistory
+from services.counters import bump_counters
+
+# Отложенная запись истории запросов. Просмотры литературы не коммитят
+# каждую запись отдельно (в SQLite каждый коммит - fsync и блокировка записи),
+# а складывают ее в буфер в памяти. Фоновый поток записывает накопленное
+# одним многострочным INSERT раз в HISTORY_FLUSH_INTERVAL_MS или при
+# накоплении HISTORY_FLUSH_BATCH записей, а также при остановке приложения.
+# Записи о завершенных сканах попадают в буфер после коммита транзакции
+# скана (add_after_commit), при откате транзакции они отбрасываются.
+# В потоке цикла событий add() не ждет места в буфере даже в режиме block:
+# запись отбрасывается, как в режиме drop. Асинхронные обработчики, которым
+# нужно ожидание, вызывают add() через run_in_threadpool.
+
+logger = logging.getLogger(__name__)
+
+# Максимальная задержка записи в миллисекундах
+HISTORY_FLUSH_INTERVAL_MS = float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "200"))
+# Количество записей, при котором буфер записывается не дожидаясь интервала
+HISTORY_FLUSH_BATCH = int(os.getenv("HISTORY_FLUSH_BATCH", "100"))
+# Максимальное количество записей в буфере
+HISTORY_BUFFER_MAX = int(os.getenv("HISTORY_BUFFER_MAX", "10000"))
+# Поведение при переполнении: drop - отбросить запись, block - ждать места
+# (кроме вызовов из потока цикла событий)
+HISTORY_BUFFER_OVERFLOW = os.getenv("HISTORY_BUFFER_OVERFLOW", "drop")
+# Максимальное ожидание места в режиме block (секунды), затем запись отбрасывается
+HISTORY_BUFFER_BLOCK_TIMEOUT = float(os.getenv("HISTORY_BUFFER_BLOCK_TIMEOUT", "1"))
+
+class HistoryBuffer:
+    """Буфер записей истории запросов с фоновой пакетной записью"""
+
+    def __init__(
+        self,
+        flush_interval_ms: float = HISTORY_FLUSH_INTERVAL_MS,
+        flush_batch: int = HISTORY_FLUSH_BATCH,
+        max_size: int = HISTORY_BUFFER_MAX,
+        overflow: str = HISTORY_BUFFER_OVERFLOW
+    ):
+        if overflow not in ("drop", "block"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_batch = flush_batch
+        self.max_size = max_size
+        self.overflow = overflow
+
+        self._pending: Deque[Dict] = deque()
+        # Количество незаписанных записей пользователей (в буфере и в текущей записи)
+        self._pending_users: Counter = Counter()
+        self._condition = threading.Condition()
+        # Отдельная блокировка записи: flush() из запроса и фоновый поток не пишут одновременно
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        # Статистика
+        self._flushed = 0
+        self._flushes = 0
+        self._dropped = 0
+        self._errors = 0
+
+    def add(self, user_id: int, query_text: str, scan_id: Optional[int] = None) -> bool:
+        """Добавление записи в буфер. False, если запись отброшена из-за переполнения"""
+        row = {"user_id": user_id, "query_text": query_text, "scan_id": scan_id}
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("History buffer is closed")
+            if len(self._pending) >= self.max_size:
+                if self.overflow == "block" and not _on_event_loop():
+                    self._condition.wait_for(
+                        lambda: len(self._pending) < self.max_size,
+                        timeout=HISTORY_BUFFER_BLOCK_TIMEOUT
+                    )
+                if len(self._pending) >= self.max_size:
+                    self._dropped += 1
+                    if self._dropped == 1 or self._dropped % 1000 == 0:
+                        logger.warning("History buffer is full, dropped %s entries", self._dropped)
+                    return False
+
+            self._pending.append(row)
+            self._pending_users[user_id] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="history-buffer", daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.flush_batch:
+                self._condition.notify_all()
+        return True
+
+    def has_pending(self, user_id: int) -> bool:
+        """Есть ли у пользователя записи, еще не попавшие в базу данных"""
+        with self._condition:
+            return self._pending_users.get(user_id, 0) > 0
+
+    def _release(self, rows):
+        """Снятие записей со счетчика пользователей (под self._condition)"""
+        self._pending_users.subtract(row["user_id"] for row in rows)
+        for user_id in {row["user_id"] for row in rows}:
+            if self._pending_users[user_id] <= 0:
+                del self._pending_users[user_id]
+
+    def flush(self) -> int:
+        """Запись всего буфера в базу данных, возвращает количество записанных строк"""
+        with self._flush_lock:
+            with self._condition:
+                rows = list(self._pending)
+                self._pending.clear()
+                self._condition.notify_all()
+            if not rows:
+                return 0
+
+            try:
+                self._write(rows)
+            except Exception:
+                logger.exception("Failed to write %s history entries", len(rows))
+                with self._condition:
+                    self._errors += 1
+                    # Возвращаем записи в начало очереди, если есть место
+                    space = max(self.max_size - len(self._pending), 0)
+                    self._pending.extendleft(reversed(rows[:space]))
+                    self._dropped += len(rows) - min(space, len(rows))
+                    self._release(rows[space:])
+                return 0
+
+            with self._condition:
+                self._release(rows)
+                self._flushed += len(rows)
+                self._flushes += 1
+            return len(rows)
+
+    def _write(self, rows):
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            db.execute(insert(QueryHistory), rows)
+            # Счетчики меняются в той же транзакции, что и вставка
+            for user_id, count in Counter(row["user_id"] for row in rows).items():
+                bump_counters(db, user_id, history_entries=count)
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or len(self._pending) >= self.flush_batch,
+                    timeout=self.flush_interval
+                )
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self, timeout: float = 10):
+        """Остановка фонового потока с записью оставшихся записей"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "pending": len(self._pending),
+                "flushed": self._flushed,
+                "flushes": self._flushes,
+                "dropped": self._dropped,
+                "errors": self._errors,
+                "avg_batch": round(self._flushed / self._flushes, 2) if self._flushes else None
+            }
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+# Буфер истории веб-процесса
+history_buffer = HistoryBuffer()
+
+_AFTER_COMMIT_KEY = "history_after_commit"
+
+def add_after_commit(db: Session, user_id: int, query_text: str, scan_id: Optional[int] = None):
+    """Запись истории в буфер процесса после коммита текущей транзакции db"""
+    db.info.setdefault(_AFTER_COMMIT_KEY, []).append((user_id, query_text, scan_id))
+
+@event.listens_for(Session, "after_commit")
+def _buffer_committed_history(session):
+    for user_id, query_text, scan_id in session.info.pop(_AFTER_COMMIT_KEY, ()):
+        history_buffer.add(user_id, query_text, scan_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_uncommitted_history(session):
+    session.info.pop(_AFTER_COMMIT_KEY, None)
@@ -1,13 +1,18 @@
 # backend/services/image_analyzer.py
 import random
+import struct
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple, Union
 from PIL import Image
+import numpy as np
 import os
 
 # Симуляция медицинского анализа изображений
 # В реальном проекте здесь была бы интеграция с ML моделью
 
+# Версия анализатора: кэш результатов привязан к ней и сбрасывается при смене модели
+ANALYZER_VERSION = "stub-1"
+
 MEDICAL_CONDITIONS = [
     {
         "condition": "Укус слепня",
@@ -77,28 +82,98 @@ MEDICAL_CONDITIONS = [
     }
 ]
 
-def analyze_medical_image(image_path: str) -> Dict:
+# Ограничения на загружаемые изображения
+MIN_IMAGE_SIDE = 100
+MAX_IMAGE_SIDE = 4000  # Для экономии ресурсов
+SUPPORTED_FORMATS = ("JPEG", "PNG")
+# Размер входа модели (квадрат)
+MODEL_INPUT_SIZE = int(os.getenv("MODEL_INPUT_SIZE", "224"))
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+# Маркеры JPEG SOF (кроме DHT, JPG и DAC), содержащие размеры кадра
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def probe_image_header(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Определение формата и размеров изображения по заголовку без декодирования.
+    Возвращает (формат, ширина, высота), None если данных пока недостаточно.
+    Бросает ValueError, если это не JPEG/PNG.
+    """
+    if data.startswith(PNG_SIGNATURE[:len(data)]) and len(data) < len(PNG_SIGNATURE):
+        return None
+    if data.startswith(JPEG_SIGNATURE[:len(data)]) and len(data) < len(JPEG_SIGNATURE):
+        return None
+
+    if data.startswith(PNG_SIGNATURE):
+        # Первым чанком PNG всегда идет IHDR с шириной и высотой
+        if len(data) < 24:
+            return None
+        if data[12:16] != b"IHDR":
+            raise ValueError("Invalid PNG header")
+        width, height = struct.unpack(">II", data[16:24])
+        return "PNG", width, height
+
+    if data.startswith(JPEG_SIGNATURE):
+        pos = 2
+        while True:
+            # Пропускаем байты-заполнители 0xFF перед маркером
+            while pos < len(data) and data[pos] == 0xFF:
+                pos += 1
+            if pos >= len(data):
+                return None
+            marker = data[pos]
+            pos += 1
+            if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+                continue
+            if marker in (0xD9, 0xDA):
+                raise ValueError("JPEG frame header not found")
+            if pos + 2 > len(data):
+                return None
+            (length,) = struct.unpack(">H", data[pos:pos + 2])
+            if marker in JPEG_SOF_MARKERS:
+                if pos + 7 > len(data):
+                    return None
+                height, width = struct.unpack(">HH", data[pos + 3:pos + 7])
+                return "JPEG", width, height
+            pos += length
+            if pos < len(data) and data[pos] != 0xFF:
+                raise ValueError("Invalid JPEG marker")
+
+    raise ValueError("Unsupported image format")
+
+def check_image_dimensions(width: int, height: int) -> bool:
+    """Проверка размеров изображения"""
+    if width < MIN_IMAGE_SIDE or height < MIN_IMAGE_SIDE:
+        return False
+    if width > MAX_IMAGE_SIDE or height > MAX_IMAGE_SIDE:
+        return False
+    return True
+
+def analyze_medical_image(image: Union[str, Image.Image]) -> Dict:
     """
-    Анализ медицинского изображения
+    Анализ медицинского изображения (путь к файлу или уже открытое изображение)
     В реальном приложении здесь была бы ML модель
     """
     
     # Проверяем, что файл существует
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Image file not found: {image_path}")
+    if isinstance(image, str) and not os.path.exists(image):
+        raise FileNotFoundError(f"Image file not found: {image}")
     
     # Симуляция времени обработки
     time.sleep(random.uniform(1, 3))
     
     try:
-        # Загружаем изображение для проверки валидности
-        with Image.open(image_path) as img:
-            # Получаем размеры изображения для симуляции анализа
-            width, height = img.size
-            
-            # Симуляция анализа на основе размера изображения
-            # В реальности здесь была бы нейронная сеть
-            condition_index = (width + height) % len(MEDICAL_CONDITIONS)
+        # Получаем размеры изображения для симуляции анализа
+        if isinstance(image, str):
+            with Image.open(image) as img:
+                width, height = img.size
+        else:
+            width, height = image.size
+        
+        # Симуляция анализа на основе размера изображения
+        # В реальности здесь была бы нейронная сеть
+        condition_index = (width + height) % len(MEDICAL_CONDITIONS)
             
     except Exception as e:
         # Если не удалось открыть изображение, возвращаем случайный результат
@@ -118,30 +193,61 @@ def analyze_medical_image(image_path: str) -> Dict:
         "confidence": round(final_confidence, 2)
     }
 
+def stack_images(images: List[Image.Image], size: int = MODEL_INPUT_SIZE) -> np.ndarray:
+    """Приведение изображений к размеру входа модели и сборка в тензор (N, H, W, 3) uint8"""
+    return np.stack([
+        np.asarray(image.convert("RGB").resize((size, size), Image.BILINEAR))
+        for image in images
+    ])
+
+def analyze_medical_batch(images: List[Image.Image]) -> List[Dict]:
+    """
+    Анализ батча изображений одним векторизованным проходом
+    В реальном приложении здесь был бы один вызов ML модели на весь батч
+    """
+    if not images:
+        return []
+    
+    tensor = stack_images(images).astype(np.float32) / 255.0
+    sizes = np.array([image.size for image in images])
+    
+    # Симуляция времени обработки: один раз на батч, а не на каждое изображение
+    time.sleep(random.uniform(1, 3))
+    
+    # Симуляция анализа на основе размера изображения, как в analyze_medical_image
+    condition_indices = sizes.sum(axis=1) % len(MEDICAL_CONDITIONS)
+    base_confidence = np.array([MEDICAL_CONDITIONS[i]["confidence"] for i in condition_indices])
+    
+    # Небольшая случайность в уверенности с поправкой на яркость снимка
+    brightness = tensor.mean(axis=(1, 2, 3))
+    confidence_variation = np.random.uniform(-0.1, 0.1, len(images)) * (0.5 + brightness)
+    final_confidence = np.clip(base_confidence + confidence_variation, 0.5, 0.99)
+    
+    results = []
+    for condition_index, confidence in zip(condition_indices, final_confidence):
+        selected_condition = MEDICAL_CONDITIONS[int(condition_index)]
+        results.append({
+            "condition": selected_condition["condition"],
+            "description": selected_condition["description"],
+            "recommendations": selected_condition["recommendations"],
+            "confidence": round(float(confidence), 2)
+        })
+    return results
+
 def validate_medical_image(image_path: str) -> bool:
     """
     Проверка, подходит ли изображение для медицинского анализа
+    (по заголовку файла, без декодирования)
     """
     try:
-        with Image.open(image_path) as img:
-            # Проверяем минимальные требования к изображению
-            width, height = img.size
-            
-            # Минимальное разрешение
-            if width < 100 or height < 100:
-                return False
-            
-            # Максимальное разрешение (для экономии ресурсов)
-            if width > 4000 or height > 4000:
-                return False
-            
-            # Проверяем формат
-            if img.format not in ['JPEG', 'PNG', 'JPG']:
-                return False
-            
-            return True
-            
-    except Exception:
+        with open(image_path, "rb") as f:
+            header = f.read(256 * 1024)
+        probe = probe_image_header(header)
+        if probe is None:
+            return False
+        image_format, width, height = probe
+        return check_image_dimensions(width, height)
+    except (OSError, ValueError):
         return False
 
 def get_supported_conditions() -> List[str]:
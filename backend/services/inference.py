@@ -0,0 +1,200 @@
+# backend/services/inference.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from services.image_analyzer import (
+    ANALYZER_VERSION,
+    MEDICAL_CONDITIONS,
+    MODEL_INPUT_SIZE,
+    analyze_medical_batch,
+    analyze_medical_image,
+    stack_images,
+)
+from services.preprocessing import decode_for_model
+
+# Модели анализа изображений. Модель загружается один раз на процесс
+# (воркер, процесс пула анализатора или сервер анализа) при первом обращении.
+# По умолчанию используется заглушка, ONNX Runtime подключается через
+# ANALYZER_MODEL=onnx и требует установленного пакета onnxruntime.
+
+logger = logging.getLogger(__name__)
+
+# Модель: stub или onnx
+ANALYZER_MODEL = os.getenv("ANALYZER_MODEL", "stub")
+# Путь к файлу модели ONNX
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "models/skin_classifier.onnx")
+# JSON-файл со списком названий состояний в порядке выходов модели
+# (по умолчанию - порядок MEDICAL_CONDITIONS)
+ONNX_LABELS_PATH = os.getenv("ONNX_LABELS_PATH", "")
+# Потоки внутри одного оператора; при нескольких воркерах на машине
+# их сумма не должна превышать количество ядер
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "1"))
+# Потоки для параллельного выполнения независимых операторов
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", "1"))
+# Раскладка входного тензора: nchw или nhwc
+ONNX_INPUT_LAYOUT = os.getenv("ONNX_INPUT_LAYOUT", "nchw")
+# Количество прогревочных запусков при загрузке модели
+ONNX_WARMUP_RUNS = int(os.getenv("ONNX_WARMUP_RUNS", "3"))
+# Размер батча для прогрева (совпадает с типичным батчем, чтобы выделить память заранее)
+ONNX_WARMUP_BATCH = int(os.getenv("ONNX_WARMUP_BATCH", os.getenv("BATCH_MAX_SIZE", "8")))
+
+# Нормализация ImageNet
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+_CONDITIONS_BY_NAME = {condition["condition"]: condition for condition in MEDICAL_CONDITIONS}
+
+class StubModel:
+    """Заглушка анализа (используется по умолчанию и в тестах)"""
+
+    version = ANALYZER_VERSION
+
+    def predict(self, image) -> Dict:
+        return analyze_medical_image(image)
+
+    def predict_batch(self, images: List[Image.Image]) -> List[Dict]:
+        return analyze_medical_batch(images)
+
+def preprocess_batch(images: List[Image.Image], size: int = MODEL_INPUT_SIZE, layout: str = ONNX_INPUT_LAYOUT) -> np.ndarray:
+    """Векторизованная подготовка батча: ресайз, нормализация, раскладка"""
+    tensor = stack_images(images, size).astype(np.float32)
+    tensor *= 1.0 / 255.0
+    tensor -= IMAGENET_MEAN
+    tensor /= IMAGENET_STD
+    if layout == "nchw":
+        tensor = tensor.transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(tensor)
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class OnnxModel:
+    """Классификатор на ONNX Runtime (CPU)"""
+
+    def __init__(self, model_path: str = ONNX_MODEL_PATH):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("ANALYZER_MODEL=onnx requires the onnxruntime package")
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found: {model_path}")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        options.inter_op_num_threads = ONNX_INTER_OP_THREADS
+        options.execution_mode = (
+            ort.ExecutionMode.ORT_PARALLEL if ONNX_INTER_OP_THREADS > 1 else ort.ExecutionMode.ORT_SEQUENTIAL
+        )
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.version = onnx_model_version(model_path)
+        self.labels = self._load_labels()
+        self.warmup()
+
+    def _load_labels(self) -> List[str]:
+        if ONNX_LABELS_PATH:
+            with open(ONNX_LABELS_PATH, encoding="utf-8") as f:
+                return json.load(f)
+        return [condition["condition"] for condition in MEDICAL_CONDITIONS]
+
+    def warmup(self):
+        """Прогрев: первые запуски выделяют память и выбирают ядра операторов"""
+        shape = (ONNX_WARMUP_BATCH, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)
+        if ONNX_INPUT_LAYOUT != "nchw":
+            shape = (ONNX_WARMUP_BATCH, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, 3)
+        dummy = np.zeros(shape, dtype=np.float32)
+        started = time.perf_counter()
+        for _ in range(ONNX_WARMUP_RUNS):
+            self.session.run(None, {self.input_name: dummy})
+            self.session.run(None, {self.input_name: dummy[:1]})
+        logger.info(
+            "ONNX model %s warmed up in %.0f ms",
+            self.version, (time.perf_counter() - started) * 1000
+        )
+
+    def predict_batch(self, images: List[Image.Image]) -> List[Dict]:
+        if not images:
+            return []
+        tensor = preprocess_batch(images)
+        logits = self.session.run(None, {self.input_name: tensor})[0]
+        probabilities = _softmax(logits.reshape(len(images), -1))
+        best = probabilities.argmax(axis=1)
+
+        results = []
+        for index, confidence in zip(best, probabilities[np.arange(len(images)), best]):
+            label = self.labels[int(index)]
+            condition = _CONDITIONS_BY_NAME.get(label, {})
+            results.append({
+                "condition": label,
+                "description": condition.get("description"),
+                "recommendations": condition.get("recommendations", []),
+                "confidence": round(float(confidence), 2)
+            })
+        return results
+
+    def predict(self, image) -> Dict:
+        if isinstance(image, str):
+            image = decode_for_model(image)
+        return self.predict_batch([image])[0]
+
+_model = None
+_model_lock = threading.Lock()
+_version_cache: Dict[str, str] = {}
+
+def onnx_model_version(model_path: str = ONNX_MODEL_PATH) -> str:
+    """Версия ONNX модели по хэшу файла"""
+    if model_path not in _version_cache:
+        _version_cache[model_path] = f"onnx-{_file_sha256(model_path)[:12]}"
+    return _version_cache[model_path]
+
+def analyzer_version() -> str:
+    """Версия текущей модели без ее загрузки (для ключа кэша результатов)"""
+    if ANALYZER_MODEL == "onnx":
+        return onnx_model_version()
+    return ANALYZER_VERSION
+
+def get_model():
+    """Модель текущего процесса (загружается и прогревается один раз)"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if ANALYZER_MODEL == "onnx":
+                    _model = OnnxModel()
+                elif ANALYZER_MODEL == "stub":
+                    _model = StubModel()
+                else:
+                    raise ValueError(f"Unknown analyzer model: {ANALYZER_MODEL}")
+    return _model
+
+def predict_image(image) -> Dict:
+    """Анализ одного изображения моделью текущего процесса"""
+    return get_model().predict(image)
+
+def load_model() -> str:
+    """Загрузка модели в текущем процессе, возвращает ее версию"""
+    return get_model().version
+
+def predict_images(images: List[Image.Image]) -> List[Dict]:
+    """Анализ батча изображений моделью текущего процесса"""
+    return get_model().predict_batch(images)
@@ -0,0 +1,223 @@
+# backend/services/literature_import.py
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Literature
+from services.data_versions import LITERATURE, bump_version
+from services.literature_storage import content_columns
+from services.literature_tags import parse_tag_names, replace_tags_many
+
+# Потоковый импорт статей из каталога с файлами Markdown (*.md) и JSONL (*.jsonl).
+# Файлы читаются по одному, статьи записываются пачками по LITERATURE_IMPORT_BATCH:
+# на пачку - один запрос существующих статей по source_key, один INSERT
+# (executemany) для новых и один UPDATE по id для измененных. Статья находится
+# по source_key (путь к файлу относительно каталога импорта или поле source_key
+# в JSONL), а content_hash позволяет не трогать неизмененные статьи.
+# Массовые INSERT/UPDATE не проходят через обработчики ORM, поэтому сжатие
+# текста, теги и версия литературы обновляются здесь явно; полнотекстовый
+# индекс обновляют триггеры базы данных.
+#
+# Формат Markdown: необязательный заголовок между строками "---" со строками
+# "ключ: значение" (title, description, category, author, tags, is_active),
+# далее текст статьи. Без title в заголовке названием считается первая строка
+# "# ..." или имя файла. Строка JSONL - объект с теми же полями и content.
+
+logger = logging.getLogger(__name__)
+
+# Размер пачки статей на одну транзакцию
+LITERATURE_IMPORT_BATCH = int(os.getenv("LITERATURE_IMPORT_BATCH", "2000"))
+
+# Поля статьи, от которых зависит content_hash
+_HASHED_FIELDS = ("title", "description", "content", "category", "author", "tags", "is_active")
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    # Записи, которые не удалось разобрать (файл:строка - причина)
+    errors: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.read / self.elapsed if self.elapsed > 0 else 0.0
+
+def _parse_tags(value) -> List[str]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                value = value.strip("[]").split(",")
+        else:
+            value = value.split(",")
+    if not isinstance(value, list):
+        raise ValueError("tags должен быть списком или строкой через запятую")
+    return [str(tag).strip().strip("\"'") for tag in value if str(tag).strip().strip("\"'")]
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() not in ("false", "no", "0", "нет")
+    return bool(value) if value is not None else True
+
+def _article(source_key: str, data: Dict) -> Dict:
+    """Строка таблицы literature из полей статьи"""
+    title = (data.get("title") or "").strip()
+    if not title:
+        raise ValueError("нет названия статьи")
+    tags = _parse_tags(data.get("tags"))
+    article = {
+        "source_key": source_key[:300],
+        "title": title[:300],
+        "description": data.get("description") or None,
+        "content": data.get("content") or "",
+        "category": data.get("category") or None,
+        "author": data.get("author") or None,
+        "tags": json.dumps(tags, ensure_ascii=False) if tags else None,
+        "is_active": _parse_bool(data.get("is_active")),
+    }
+    hashed = json.dumps([article[name] for name in _HASHED_FIELDS], ensure_ascii=False)
+    article["content_hash"] = hashlib.sha256(hashed.encode("utf-8")).hexdigest()
+    return article
+
+def _read_markdown(path: Path, source_key: str) -> Dict:
+    text = path.read_text(encoding="utf-8")
+    meta: Dict[str, str] = {}
+    lines = text.splitlines()
+    if lines and lines[0].strip() == "---":
+        for number, line in enumerate(lines[1:], start=1):
+            if line.strip() == "---":
+                text = "\n".join(lines[number + 1:])
+                break
+            key, separator, value = line.partition(":")
+            if separator:
+                meta[key.strip().lower()] = value.strip()
+        else:
+            raise ValueError("не закрыт заголовок ---")
+
+    text = text.strip()
+    if not meta.get("title"):
+        heading = next((line for line in text.splitlines() if line.startswith("# ")), None)
+        meta["title"] = heading[2:].strip() if heading else path.stem
+    return _article(source_key, {**meta, "content": text})
+
+def iter_articles(root: str, stats: Optional[ImportStats] = None) -> Iterator[Dict]:
+    """
+    Статьи из файла или каталога (рекурсивно, в порядке путей) по одной.
+    Ошибки разбора не прерывают импорт и записываются в stats.errors.
+    """
+    stats = stats or ImportStats()
+    base = Path(root)
+    paths = [base] if base.is_file() else sorted(
+        path for path in base.rglob("*") if path.suffix.lower() in (".md", ".jsonl") and path.is_file()
+    )
+    for path in paths:
+        relative = path.name if path == base else path.relative_to(base).as_posix()
+        if path.suffix.lower() == ".md":
+            try:
+                yield _read_markdown(path, relative)
+            except (ValueError, UnicodeDecodeError) as e:
+                stats.errors.append(f"{relative} - {e}")
+            continue
+
+        with path.open(encoding="utf-8") as lines:
+            for number, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                    if not isinstance(data, dict):
+                        raise ValueError("строка должна быть объектом")
+                    yield _article(str(data.get("source_key") or f"{relative}:{number}"), data)
+                except (ValueError, UnicodeDecodeError) as e:
+                    stats.errors.append(f"{relative}:{number} - {e}")
+
+def _write_batch(db: Session, articles: List[Dict], stats: ImportStats):
+    # В пачке остается последняя версия статьи с повторяющимся source_key
+    articles = list({article["source_key"]: article for article in articles}.values())
+    existing = {
+        row.source_key: row
+        for row in db.execute(
+            select(Literature.id, Literature.source_key, Literature.content_hash)
+            .where(Literature.source_key.in_([article["source_key"] for article in articles]))
+        )
+    }
+
+    dialect = db.get_bind().dialect.name
+    new_rows, changed_rows = [], []
+    for article in articles:
+        row = existing.get(article["source_key"])
+        if row is not None and row.content_hash == article["content_hash"]:
+            stats.unchanged += 1
+            continue
+        values = {**article, **content_columns(article["content"], dialect)}
+        if row is None:
+            new_rows.append(values)
+        else:
+            changed_rows.append({**values, "id": row.id})
+    if not new_rows and not changed_rows:
+        return
+
+    tags_by_literature = {row["id"]: parse_tag_names(row["tags"]) for row in changed_rows}
+    if new_rows:
+        # executemany без RETURNING: id новых статей - одним запросом по source_key
+        db.connection().execute(insert(Literature.__table__), new_rows)
+        tags_by_key = {row["source_key"]: parse_tag_names(row["tags"]) for row in new_rows}
+        inserted = db.execute(
+            select(Literature.id, Literature.source_key).where(Literature.source_key.in_(list(tags_by_key)))
+        )
+        for literature_id, source_key in inserted:
+            tags_by_literature[literature_id] = tags_by_key[source_key]
+    if changed_rows:
+        db.execute(update(Literature), changed_rows)
+
+    replace_tags_many(db.connection(), tags_by_literature)
+    bump_version(db, LITERATURE)
+    db.commit()
+    stats.inserted += len(new_rows)
+    stats.updated += len(changed_rows)
+
+def import_articles(
+    db: Session,
+    articles: Iterable[Dict],
+    batch_size: int = LITERATURE_IMPORT_BATCH,
+    stats: Optional[ImportStats] = None
+) -> ImportStats:
+    """
+    Запись статей (строк из iter_articles) пачками с upsert по source_key.
+    Коммит выполняется после каждой пачки.
+    """
+    stats = stats or ImportStats()
+    started = time.perf_counter()
+    batch: List[Dict] = []
+    for article in articles:
+        batch.append(article)
+        stats.read += 1
+        if len(batch) >= batch_size:
+            _write_batch(db, batch, stats)
+            batch = []
+            logger.info("Imported %s articles (%.0f rows/s)", stats.read, stats.read / (time.perf_counter() - started))
+    if batch:
+        _write_batch(db, batch, stats)
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+def import_directory(db: Session, root: str, batch_size: int = LITERATURE_IMPORT_BATCH) -> ImportStats:
+    """Импорт всех статей из файла или каталога"""
+    stats = ImportStats()
+    return import_articles(db, iter_articles(root, stats), batch_size, stats)
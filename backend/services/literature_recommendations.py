@@ -0,0 +1,178 @@
+# backend/services/literature_recommendations.py
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from models import Literature, LiteratureTag, Tag
+from services.conditions import condition_catalog
+from services.data_versions import LITERATURE, data_versions
+from services.literature_search import fts_enabled, query_terms, rank_by_text
+
+# Рекомендации литературы к результату сканирования.
+# Для каждого состояния каталога заранее вычисляется список статей по
+# убыванию оценки: совпадение слов названия состояния с тегами статьи
+# (вес RELATED_TAG_WEIGHT), с ее категорией (RELATED_CATEGORY_WEIGHT) и
+# релевантность текста по BM25 (RELATED_TEXT_WEIGHT, в SQLite с FTS5; иначе -
+# совпадение в названии). Слова сравниваются по основе - началу слова без
+# окончания (укус слепня -> "укус", "слеп"), что покрывает формы слова.
+# Списки хранятся в памяти процесса и пересчитываются целиком, когда меняется
+# версия литературы (services/data_versions.py) или каталог состояний, поэтому
+# ответ сканирования не делает запросов к литературе.
+
+logger = logging.getLogger(__name__)
+
+# Количество статей в ответе сканирования
+RELATED_LITERATURE_LIMIT = int(os.getenv("RELATED_LITERATURE_LIMIT", "5"))
+
+# Веса составляющих оценки
+RELATED_TAG_WEIGHT = 2.0
+RELATED_CATEGORY_WEIGHT = 1.0
+RELATED_TEXT_WEIGHT = 1.0
+# Количество статей-кандидатов из полнотекстового поиска на одно состояние
+TEXT_CANDIDATES = 200
+# Основа слова: без STEM_SUFFIX последних букв, от MIN_STEM_LENGTH до MAX_STEM_LENGTH букв
+# (аллергическая -> "аллерг" совпадает с "аллергия")
+MIN_STEM_LENGTH = 4
+MAX_STEM_LENGTH = 6
+STEM_SUFFIX = 2
+
+def word_stems(text: str) -> List[str]:
+    """Основы слов текста без повторов (короткие слова - предлоги и союзы - пропускаются)"""
+    stems = []
+    for word in query_terms(text or ""):
+        if len(word) < MIN_STEM_LENGTH:
+            continue
+        stem = word[:max(MIN_STEM_LENGTH, min(MAX_STEM_LENGTH, len(word) - STEM_SUFFIX))]
+        if stem not in stems:
+            stems.append(stem)
+    return stems
+
+def _matched_share(stems: Sequence[str], text: Optional[str]) -> float:
+    """Доля основ, с которых начинается хотя бы одно слово text"""
+    words = query_terms(text or "")
+    if not stems or not words:
+        return 0.0
+    return sum(any(word.startswith(stem) for word in words) for stem in stems) / len(stems)
+
+def _active(query):
+    return query.where(Literature.is_active == True)
+
+def _text_scores(db: Session, stems: Sequence[str]) -> Dict[int, float]:
+    """Релевантность текста статей от 0 до 1 (лучшая статья - 1)"""
+    if fts_enabled(db):
+        rows = rank_by_text(db, stems, TEXT_CANDIDATES)
+        best = min((score for _, score in rows), default=0.0)
+        return {literature_id: score / best if best else 1.0 for literature_id, score in rows}
+
+    rows = db.execute(
+        _active(select(Literature.id))
+        .where(or_(*[Literature.title.ilike(f"%{stem}%") for stem in stems]))
+        .limit(TEXT_CANDIDATES)
+    ).scalars()
+    return {literature_id: 1.0 for literature_id in rows}
+
+class RelatedLiteratureIndex:
+    """Состояние -> статьи по убыванию оценки (в памяти процесса)"""
+
+    def __init__(self, limit: int = RELATED_LITERATURE_LIMIT):
+        self.limit = limit
+        self._related: Dict[str, List[Dict]] = {}
+        # (версия литературы, состояния), для которых вычислены списки
+        self._built_for: Optional[Tuple[int, Tuple[str, ...]]] = None
+        self._lock = threading.Lock()
+
+    def _rank(self, db: Session, name: str, tag_rows, category_rows) -> List[int]:
+        stems = word_stems(name)
+        if not stems:
+            return []
+        scores: Dict[int, float] = {}
+        tag_share = {tag_id: _matched_share(stems, tag) for tag_id, tag in tag_rows}
+        matched_tags = [tag_id for tag_id, share in tag_share.items() if share]
+        if matched_tags:
+            rows = db.execute(
+                _active(select(LiteratureTag.literature_id, LiteratureTag.tag_id))
+                .join(Literature, Literature.id == LiteratureTag.literature_id)
+                .where(LiteratureTag.tag_id.in_(matched_tags))
+            )
+            best_tag: Dict[int, float] = {}
+            for literature_id, tag_id in rows:
+                best_tag[literature_id] = max(best_tag.get(literature_id, 0.0), tag_share[tag_id])
+            for literature_id, share in best_tag.items():
+                scores[literature_id] = RELATED_TAG_WEIGHT * share
+
+        matched_categories = {
+            category: share for category, share in
+            ((category, _matched_share(stems, category)) for category in category_rows) if share
+        }
+        if matched_categories:
+            rows = db.execute(
+                _active(select(Literature.id, Literature.category))
+                .where(Literature.category.in_(list(matched_categories)))
+            )
+            for literature_id, category in rows:
+                score = RELATED_CATEGORY_WEIGHT * matched_categories[category]
+                scores[literature_id] = scores.get(literature_id, 0.0) + score
+
+        for literature_id, score in _text_scores(db, stems).items():
+            scores[literature_id] = scores.get(literature_id, 0.0) + RELATED_TEXT_WEIGHT * score
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [literature_id for literature_id, _ in ranked[:self.limit]]
+
+    def _build(self, db: Session, names: Iterable[str]) -> Dict[str, List[Dict]]:
+        names = list(names)
+        tag_rows = db.execute(select(Tag.id, Tag.name)).all()
+        category_rows = db.execute(
+            _active(select(Literature.category).distinct()).where(Literature.category.is_not(None))
+        ).scalars().all()
+        ranked = {name: self._rank(db, name, tag_rows, category_rows) for name in names}
+
+        ids = {literature_id for literature_ids in ranked.values() for literature_id in literature_ids}
+        items = {
+            row.id: {"id": row.id, "title": row.title, "category": row.category}
+            for row in db.execute(
+                select(Literature.id, Literature.title, Literature.category).where(Literature.id.in_(ids))
+            )
+        } if ids else {}
+        return {
+            name: [items[literature_id] for literature_id in literature_ids if literature_id in items]
+            for name, literature_ids in ranked.items()
+        }
+
+    def refresh(self, db: Session, names: Iterable[str]):
+        """Пересчет списков для состояний names, если литература или состояния изменились"""
+        names = tuple(sorted(set(names)))
+        built_for = (data_versions.current(db, LITERATURE), names)
+        if built_for == self._built_for:
+            return
+        with self._lock:
+            if built_for == self._built_for:
+                return
+            started = time.perf_counter()
+            self._related = self._build(db, names)
+            self._built_for = built_for
+        logger.info(
+            "Related literature built for %s conditions in %.1f ms",
+            len(names), (time.perf_counter() - started) * 1000
+        )
+
+    def related(self, db: Session, name: Optional[str]) -> List[Dict]:
+        """Статьи к состоянию name: id, title, category"""
+        if not name:
+            return []
+        self.refresh(db, condition_catalog.names(db))
+        related = self._related.get(name)
+        if related is None:
+            # Состояние вне каталога (старые сканы) - вычисляется при первом обращении
+            with self._lock:
+                related = self._build(db, [name])[name]
+                self._related[name] = related
+        return related
+
+# Рекомендации литературы процесса
+related_literature = RelatedLiteratureIndex()
@@ -0,0 +1,261 @@
+# backend/services/literature_search.py
+import html
+import logging
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import column, func, literal_column, or_, table, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Query, Session, undefer_group
+
+from models import Literature
+from services.literature_storage import content_expression, literature_content
+
+# Полнотекстовый поиск по литературе.
+# В SQLite используется виртуальная таблица FTS5 literature_fts с копией
+# title, description и content (rowid = literature.id), которую поддерживают
+# триггеры на таблице literature (сжатый текст распаковывается функцией
+# hs_inflate, см. literature_storage). Результаты ранжируются по BM25, а фрагмент
+# с подсветкой строит snippet(). Токенизатор unicode61 приводит кириллицу
+# к нижнему регистру, диакритика не удаляется (иначе "й" совпадает с "и");
+# "ё" заменяется на "е" в копии текста и в запросе. Слова запроса ищутся по
+# префиксу, что частично заменяет морфологию (глаз -> глаза, глазной).
+# Текст фрагмента экранируется для HTML, разметкой остаются только SNIPPET_OPEN
+# и SNIPPET_CLOSE вокруг найденных слов.
+# Для других баз данных и SQLite без FTS5 остается поиск через ILIKE.
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "literature_fts"
+FTS_COLUMNS = ("title", "description", "content")
+# Вес совпадения в заголовке, описании и тексте для bm25()
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+# Разметка найденных слов во фрагменте
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+# Границы найденных слов до экранирования (символы из области для частного использования)
+_MATCH_OPEN = "\ue000"
+_MATCH_CLOSE = "\ue001"
+SNIPPET_ELLIPSIS = "…"
+# Длина фрагмента в словах (snippet) и в символах (поиск через ILIKE)
+SNIPPET_TOKENS = 24
+SNIPPET_CHARS = 200
+
+_TOKENIZE = "unicode61 remove_diacritics 0"
+
+_CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, description, content, "
+    f"tokenize = '{_TOKENIZE}', prefix = '2 3')"
+)
+
+_COPY_COLUMNS = "title, description, content"
+
+def _fold_yo(expression: str) -> str:
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+def _copy_values(row: str) -> str:
+    return ", ".join(_fold_yo(expression) for expression in (
+        f"{row}.title", f"{row}.description", f"coalesce({row}.content, hs_inflate({row}.content_zlib))"
+    ))
+
+_TRIGGERS = {
+    "literature_fts_insert": f"""
+        CREATE TRIGGER literature_fts_insert AFTER INSERT ON literature BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {_COPY_COLUMNS})
+            VALUES (new.id, {_copy_values("new")});
+        END
+    """,
+    "literature_fts_delete": f"""
+        CREATE TRIGGER literature_fts_delete AFTER DELETE ON literature BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+    """,
+    "literature_fts_update": f"""
+        CREATE TRIGGER literature_fts_update
+        AFTER UPDATE OF title, description, content, content_zlib ON literature BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, {_COPY_COLUMNS})
+            VALUES (new.id, {_copy_values("new")});
+        END
+    """,
+}
+
+_TOKEN_RE = re.compile(r"\w+")
+
+_fts_table = table(FTS_TABLE, column("rowid"))
+
+# Наличие индекса FTS5 в базе данных процесса (None - еще не проверялось)
+_fts_ready: Optional[bool] = None
+
+def ensure_search_index(engine) -> bool:
+    """
+    Создание таблицы FTS5 и триггеров (только SQLite).
+    Триггеры пересоздаются при каждом запуске. Таблица, созданная с другим
+    токенизатором, удаляется; индекс заполняется заново, если количество строк
+    в нем расходится с таблицей literature.
+    """
+    global _fts_ready
+    if engine.dialect.name != "sqlite":
+        _fts_ready = False
+        return False
+
+    try:
+        with engine.begin() as conn:
+            existing = conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+            ).scalar()
+            if existing is not None and _TOKENIZE not in existing:
+                logger.info("Recreating literature search index with tokenizer '%s'", _TOKENIZE)
+                conn.exec_driver_sql(f"DROP TABLE {FTS_TABLE}")
+            conn.exec_driver_sql(_CREATE_TABLE)
+            for name, statement in _TRIGGERS.items():
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+                conn.exec_driver_sql(statement)
+
+            indexed = conn.exec_driver_sql(f"SELECT count(*) FROM {FTS_TABLE}").scalar()
+            total = conn.exec_driver_sql("SELECT count(*) FROM literature").scalar()
+            if indexed != total:
+                logger.info("Rebuilding literature search index (%s of %s rows indexed)", indexed, total)
+                conn.exec_driver_sql(f"DELETE FROM {FTS_TABLE}")
+                conn.exec_driver_sql(
+                    f"INSERT INTO {FTS_TABLE}(rowid, {_COPY_COLUMNS}) "
+                    f"SELECT id, {_copy_values('literature')} FROM literature"
+                )
+    except OperationalError as e:
+        # SQLite собран без FTS5
+        logger.warning("Full-text search is unavailable, falling back to ILIKE: %s", e)
+        _fts_ready = False
+        return False
+
+    _fts_ready = True
+    return True
+
+def fts_enabled(db: Session) -> bool:
+    """Можно ли использовать FTS5 в этой базе данных"""
+    global _fts_ready
+    if _fts_ready is None:
+        _fts_ready = db.get_bind().dialect.name == "sqlite" and db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE}
+        ).first() is not None
+    return _fts_ready
+
+def query_terms(search: str) -> List[str]:
+    """Слова поискового запроса"""
+    return [term.lower() for term in _TOKEN_RE.findall(search)]
+
+def build_match_query(
+    terms: Sequence[str],
+    columns: Optional[Sequence[str]] = None,
+    any_term: bool = False
+) -> str:
+    """
+    Выражение MATCH: все слова (или любое из них при any_term) по префиксу,
+    опционально только в columns.
+    Слова берутся в кавычки, поэтому операторы FTS5 из запроса не интерпретируются.
+    """
+    expression = (" OR " if any_term else " ").join(f'"{term.replace("ё", "е")}"*' for term in terms)
+    if columns:
+        expression = "{" + " ".join(columns) + "}: (" + expression + ")"
+    return expression
+
+def _fts():
+    return literal_column(FTS_TABLE)
+
+def _rank():
+    return func.bm25(_fts(), *FTS_WEIGHTS)
+
+def _fts_query(query: Query, terms: Sequence[str], columns: Optional[Sequence[str]]) -> Query:
+    return (
+        query.join(_fts_table, _fts_table.c.rowid == Literature.id)
+        .filter(_fts().op("MATCH")(build_match_query(terms, columns)))
+        .order_by(_rank())
+    )
+
+def rank_by_text(db: Session, terms: Sequence[str], limit: int) -> List[Tuple[int, float]]:
+    """
+    Самые релевантные активные статьи, содержащие любое из слов (только FTS5):
+    (id, оценка bm25), оценка отрицательная - чем меньше, тем релевантнее.
+    """
+    rank = _rank()
+    return [tuple(row) for row in db.query(Literature.id, rank)
+        .join(_fts_table, _fts_table.c.rowid == Literature.id)
+        .filter(Literature.is_active == True, _fts().op("MATCH")(build_match_query(terms, any_term=True)))
+        .order_by(rank)
+        .limit(limit)
+        .all()]
+
+def _ilike_filter(db: Session, terms: Sequence[str], columns: Sequence[str]):
+    """Каждое слово должно встретиться хотя бы в одной из колонок"""
+    expressions = [getattr(Literature, column) for column in columns]
+    if "content" in columns and db.get_bind().dialect.name == "sqlite":
+        # Сжатый текст в SQLite
+        expressions[list(columns).index("content")] = content_expression()
+    return [
+        or_(*[expression.ilike(f"%{term}%") for expression in expressions])
+        for term in terms
+    ]
+
+def apply_text_search(db: Session, query: Query, search: str, columns: Sequence[str] = FTS_COLUMNS) -> Query:
+    """
+    Фильтр запроса к Literature по словам search в columns.
+    С FTS5 результаты упорядочены по релевантности; порядок для равных
+    значений вызывающий код добавляет сам.
+    """
+    terms = query_terms(search)
+    if not terms:
+        return query.filter(False)
+    if fts_enabled(db):
+        return _fts_query(query, terms, columns)
+    return query.filter(*_ilike_filter(db, terms, columns))
+
+def _render_snippet(fragment: Optional[str]) -> Optional[str]:
+    """
+    Фрагмент в одну строку (текст статей содержит разметку с отступами),
+    экранированный для HTML, с SNIPPET_OPEN/SNIPPET_CLOSE вокруг найденных слов
+    """
+    if not fragment:
+        return fragment
+    fragment = html.escape(" ".join(fragment.split()), quote=False)
+    return fragment.replace(_MATCH_OPEN, SNIPPET_OPEN).replace(_MATCH_CLOSE, SNIPPET_CLOSE)
+
+def _plain_snippet(item: Literature, terms: Sequence[str]) -> Optional[str]:
+    """Фрагмент вокруг первого найденного слова для поиска через ILIKE"""
+    for source in (item.description, literature_content(item)):
+        if not source:
+            continue
+        lowered = source.lower()
+        positions = [position for position in (lowered.find(term) for term in terms) if position >= 0]
+        if not positions:
+            continue
+
+        start = max(min(positions) - SNIPPET_CHARS // 4, 0)
+        fragment = source[start:start + SNIPPET_CHARS]
+        pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+        fragment = pattern.sub(lambda match: f"{_MATCH_OPEN}{match.group(0)}{_MATCH_CLOSE}", fragment)
+        prefix = SNIPPET_ELLIPSIS if start > 0 else ""
+        suffix = SNIPPET_ELLIPSIS if start + SNIPPET_CHARS < len(source) else ""
+        return f"{prefix}{fragment.strip()}{suffix}"
+
+    description = item.description
+    if description and len(description) > SNIPPET_CHARS:
+        return description[:SNIPPET_CHARS] + "..."
+    return description
+
+def search_with_snippets(db: Session, search: str, limit: int) -> List[Tuple[Literature, Optional[str]]]:
+    """Активные статьи по запросу (самые релевантные первыми) с фрагментом текста"""
+    terms = query_terms(search)
+    if not terms:
+        return []
+
+    query = db.query(Literature).filter(Literature.is_active == True)
+    if fts_enabled(db):
+        snippet = func.snippet(_fts(), -1, _MATCH_OPEN, _MATCH_CLOSE, SNIPPET_ELLIPSIS, SNIPPET_TOKENS)
+        rows = _fts_query(query.add_columns(snippet), terms, FTS_COLUMNS).order_by(Literature.id).limit(limit).all()
+        return [(item, _render_snippet(fragment)) for item, fragment in rows]
+
+    items = query.filter(*_ilike_filter(db, terms, FTS_COLUMNS)).options(
+        undefer_group("content")
+    ).order_by(Literature.title).limit(limit).all()
+    return [(item, _render_snippet(_plain_snippet(item, terms))) for item in items]
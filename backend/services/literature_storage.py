@@ -0,0 +1,99 @@
+# backend/services/literature_storage.py
+import logging
+import os
+import zlib
+from typing import Dict, Optional
+
+from sqlalchemy import LargeBinary, cast, event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from database import inflate_content
+from models import Literature
+# Обработчики сессии: версия литературы и теги обновляются при записи статей
+import services.data_versions  # noqa: F401
+import services.literature_tags  # noqa: F401
+
+# Хранение текста статей. Колонки content и content_zlib отложены
+# (deferred) и загружаются только при открытии статьи. В SQLite тексты
+# от LITERATURE_COMPRESS_MIN_BYTES сохраняются сжатыми zlib в content_zlib,
+# content при этом NULL. PostgreSQL сжимает большие значения сам (TOAST),
+# поэтому там текст хранится как есть.
+# Для триггеров полнотекстового индекса в каждое соединение SQLite
+# добавляется функция hs_inflate(content_zlib) (database.py): запись в таблицу
+# literature вне Python-кода проекта (например, из консоли sqlite3) без нее не работает.
+
+logger = logging.getLogger(__name__)
+
+# Минимальный размер текста статьи для сжатия (байты UTF-8)
+LITERATURE_COMPRESS_MIN_BYTES = int(os.getenv("LITERATURE_COMPRESS_MIN_BYTES", "2048"))
+# Уровень сжатия zlib (1-9)
+LITERATURE_COMPRESS_LEVEL = int(os.getenv("LITERATURE_COMPRESS_LEVEL", "6"))
+
+def compress_content(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), LITERATURE_COMPRESS_LEVEL)
+
+def literature_content(literature: Literature) -> Optional[str]:
+    """Текст статьи независимо от способа хранения"""
+    if literature.content_zlib is not None:
+        return inflate_content(literature.content_zlib)
+    return literature.content
+
+def content_expression():
+    """SQL-выражение с текстом статьи (только для SQLite, где есть hs_inflate)"""
+    return func.coalesce(Literature.content, func.hs_inflate(Literature.content_zlib))
+
+def _should_compress(text: Optional[str]) -> bool:
+    return text is not None and len(text.encode("utf-8")) >= LITERATURE_COMPRESS_MIN_BYTES
+
+def content_columns(text: Optional[str], dialect: str) -> Dict[str, Optional[object]]:
+    """Значения content и content_zlib для записи текста в обход ORM-объектов"""
+    if dialect == "sqlite" and _should_compress(text):
+        return {"content": None, "content_zlib": compress_content(text)}
+    return {"content": text, "content_zlib": None}
+
+def _store_content(target: Literature):
+    if target.content is not None:
+        for name, value in content_columns(target.content, "sqlite").items():
+            setattr(target, name, value)
+
+@event.listens_for(Literature, "before_insert")
+def _compress_before_insert(mapper, connection, target):
+    if connection.dialect.name == "sqlite":
+        _store_content(target)
+
+@event.listens_for(Literature, "before_update")
+def _compress_before_update(mapper, connection, target):
+    # Текст сохраненной статьи пересжимается, только если content был изменен
+    if connection.dialect.name == "sqlite" and inspect(target).attrs.content.history.has_changes():
+        _store_content(target)
+
+def compress_existing(db: Session, batch_size: int = 200) -> int:
+    """
+    Сжатие больших текстов, сохраненных до появления content_zlib (только SQLite).
+    Возвращает количество сжатых статей. Коммит выполняется после каждой пачки.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return 0
+
+    compressed = 0
+    while True:
+        rows = db.execute(
+            select(Literature.id, Literature.content)
+            .where(
+                Literature.content_zlib.is_(None),
+                func.length(cast(Literature.content, LargeBinary)) >= LITERATURE_COMPRESS_MIN_BYTES
+            )
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.execute(update(Literature), [
+            {"id": row.id, "content": None, "content_zlib": compress_content(row.content)}
+            for row in rows
+        ])
+        db.commit()
+        compressed += len(rows)
+
+    if compressed:
+        logger.info("Compressed %s literature articles", compressed)
+    return compressed
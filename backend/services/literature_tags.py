@@ -0,0 +1,201 @@
+# backend/services/literature_tags.py
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import delete, event, exists, func, inspect, insert, literal, or_, select, union_all, update
+from sqlalchemy.orm import Session
+
+from models import Literature, LiteratureTag, Tag
+
+# Нормализованные теги литературы.
+# Источник тегов для записи - по-прежнему JSON в Literature.tags: при
+# сохранении статьи через ORM теги в той же транзакции переносятся в таблицы
+# tags и literature_tags. Ответы API и фильтры читают только эти таблицы:
+# теги страницы загружаются одним запросом без разбора JSON для каждой строки.
+# Теги сравниваются без учета регистра (Tag.name - ключ в нижнем регистре),
+# а в ответах возвращается написание тега при первом сохранении (Tag.display_name).
+
+logger = logging.getLogger(__name__)
+
+def clean_tag(tag: str) -> str:
+    return " ".join(str(tag).split())
+
+def normalize_tag(tag: str) -> str:
+    return clean_tag(tag).lower()
+
+def _display_name():
+    # Теги, созданные до появления display_name
+    return func.coalesce(Tag.display_name, Tag.name)
+
+def parse_tag_names(tags_json: Optional[str]) -> List[str]:
+    """Уникальные без учета регистра теги из JSON в порядке следования"""
+    if not tags_json:
+        return []
+    try:
+        tags = json.loads(tags_json)
+    except json.JSONDecodeError:
+        return []
+    if not isinstance(tags, list):
+        return []
+    names = {}
+    for tag in tags:
+        name = clean_tag(tag)
+        if name:
+            names.setdefault(name.lower(), name)
+    return list(names.values())
+
+def _insert_missing_tags(connection, names: Dict[str, str]):
+    """Создание тегов (ключ -> написание); у существующих заполняется только пустой display_name"""
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        dialect_insert = insert
+
+    rows = [{"name": name, "display_name": display_name} for name, display_name in names.items()]
+    statement = dialect_insert(Tag)
+    if hasattr(statement, "on_conflict_do_update"):
+        # Тег мог уже создать параллельный запрос
+        statement = statement.on_conflict_do_update(
+            index_elements=[Tag.name],
+            set_={"display_name": func.coalesce(Tag.display_name, statement.excluded.display_name)}
+        )
+        connection.execute(statement, rows)
+        return
+
+    existing = dict(connection.execute(
+        select(Tag.name, Tag.display_name).where(Tag.name.in_(list(names)))
+    ).all())
+    missing = [row for row in rows if row["name"] not in existing]
+    if missing:
+        connection.execute(statement, missing)
+    for row in rows:
+        if row["name"] in existing and existing[row["name"]] is None:
+            connection.execute(
+                update(Tag).where(Tag.name == row["name"]).values(display_name=row["display_name"])
+            )
+
+def replace_literature_tags(connection, literature_id: int, names: Sequence[str]):
+    """Замена тегов статьи (в транзакции соединения)"""
+    replace_tags_many(connection, {literature_id: names})
+
+def replace_tags_many(connection, tags_by_literature: Dict[int, Sequence[str]]):
+    """Замена тегов нескольких статей несколькими запросами на всю пачку"""
+    if not tags_by_literature:
+        return
+    connection.execute(
+        delete(LiteratureTag).where(LiteratureTag.literature_id.in_(list(tags_by_literature)))
+    )
+    keys = {}
+    for names in tags_by_literature.values():
+        for name in names:
+            keys.setdefault(normalize_tag(name), clean_tag(name))
+    if not keys:
+        return
+
+    _insert_missing_tags(connection, dict(sorted(keys.items())))
+    tag_ids = dict(connection.execute(select(Tag.name, Tag.id).where(Tag.name.in_(list(keys)))).all())
+    connection.execute(insert(LiteratureTag), [
+        {"literature_id": literature_id, "tag_id": tag_ids[normalize_tag(name)], "position": position}
+        for literature_id, names in tags_by_literature.items()
+        for position, name in enumerate(names)
+    ])
+
+@event.listens_for(Session, "after_flush")
+def _sync_changed_tags(session, flush_context):
+    connection = None
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Literature):
+            continue
+        connection = connection or session.connection()
+        if obj in session.deleted:
+            connection.execute(delete(LiteratureTag).where(LiteratureTag.literature_id == obj.id))
+        elif obj in session.new or inspect(obj).attrs.tags.history.has_changes():
+            replace_literature_tags(connection, obj.id, parse_tag_names(obj.tags))
+
+def sync_literature_tags(db: Session) -> int:
+    """
+    Перенос тегов статей, сохраненных до появления literature_tags или в обход ORM,
+    и заполнение display_name у тегов, созданных до его появления.
+    Возвращает количество обработанных статей. Коммит выполняется здесь.
+    """
+    has_tags = exists().where(LiteratureTag.literature_id == Literature.id)
+    has_unnamed_tags = exists().where(
+        LiteratureTag.literature_id == Literature.id,
+        LiteratureTag.tag_id == Tag.id,
+        Tag.display_name.is_(None)
+    )
+    rows = db.execute(
+        select(Literature.id, Literature.tags).where(
+            Literature.tags.is_not(None),
+            Literature.tags != "",
+            Literature.tags != "[]",
+            or_(~has_tags, has_unnamed_tags)
+        )
+    ).all()
+
+    synced = 0
+    connection = db.connection()
+    for row in rows:
+        names = parse_tag_names(row.tags)
+        if names:
+            replace_literature_tags(connection, row.id, names)
+            synced += 1
+    db.commit()
+    if synced:
+        logger.info("Synced tags for %s literature articles", synced)
+    return synced
+
+def load_tag_lists(db: Session, literature_ids: Iterable[int]) -> Dict[int, List[str]]:
+    """Теги статей одним запросом: id статьи -> написания тегов по порядку"""
+    literature_ids = list(literature_ids)
+    tags: Dict[int, List[str]] = defaultdict(list)
+    if not literature_ids:
+        return tags
+    rows = db.execute(
+        select(LiteratureTag.literature_id, _display_name())
+        .join(Tag, Tag.id == LiteratureTag.tag_id)
+        .where(LiteratureTag.literature_id.in_(literature_ids))
+        .order_by(LiteratureTag.literature_id, LiteratureTag.position)
+    )
+    for literature_id, name in rows:
+        tags[literature_id].append(name)
+    return tags
+
+def tag_filter(tag: str):
+    """Условие для запроса к Literature: у статьи есть тег"""
+    return Literature.id.in_(
+        select(LiteratureTag.literature_id)
+        .join(Tag, Tag.id == LiteratureTag.tag_id)
+        .where(Tag.name == normalize_tag(tag))
+    )
+
+def facet_counts(db: Session, literature_ids) -> Dict[str, List[Dict]]:
+    """
+    Количество статей по тегам и категориям среди literature_ids
+    (подзапрос с колонкой id) одним запросом, от больших к меньшим.
+    """
+    ids = select(literature_ids.c.id)
+    tag_counts = (
+        select(literal("tag").label("facet"), _display_name().label("value"), func.count().label("count"))
+        .select_from(LiteratureTag)
+        .join(Tag, Tag.id == LiteratureTag.tag_id)
+        .where(LiteratureTag.literature_id.in_(ids))
+        .group_by(Tag.id, Tag.name, Tag.display_name)
+    )
+    category_counts = (
+        select(literal("category").label("facet"), Literature.category.label("value"), func.count().label("count"))
+        .where(Literature.id.in_(ids))
+        .group_by(Literature.category)
+    )
+
+    facets: Dict[str, List[Dict]] = {"tags": [], "categories": []}
+    for facet, value, count in db.execute(union_all(tag_counts, category_counts)):
+        facets["tags" if facet == "tag" else "categories"].append({"name": value, "count": count})
+    for values in facets.values():
+        values.sort(key=lambda item: (-item["count"], item["name"] or ""))
+    return facets
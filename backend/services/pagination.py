@@ -0,0 +1,69 @@
+# backend/services/pagination.py
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import String, literal, tuple_
+from sqlalchemy.orm import Query
+
+# Постраничная выдача по ключу (created_at, id) вместо OFFSET.
+# Следующая страница начинается строго после последней строки предыдущей,
+# поэтому запрос - один проход по составному индексу (user_id, created_at, id)
+# независимо от глубины страницы. Курсор непрозрачен для клиента.
+
+# В SQLite server_default=func.now() сохраняет время в формате CURRENT_TIMESTAMP
+# (без микросекунд), а SQLAlchemy передает datetime с ".000000", и при
+# сравнении строк значения не совпадают. Курсор передаем в формате хранения.
+SQLITE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Курсор следующей страницы по последней строке текущей"""
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Разбор курсора, бросает ValueError для некорректного значения"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def _cursor_timestamp(query: Query, value: datetime):
+    if query.session.get_bind().dialect.name == "sqlite" and not value.microsecond:
+        return literal(value.strftime(SQLITE_TIMESTAMP_FORMAT), String)
+    return value
+
+def keyset_page(
+    query: Query,
+    created_column,
+    id_column,
+    limit: int,
+    cursor: Optional[str] = None,
+    offset: int = 0
+) -> Tuple[List, Optional[str]]:
+    """
+    Страница строк от новых к старым после cursor.
+    offset поддерживается для старых клиентов и используется только без курсора.
+    Возвращает строки и курсор следующей страницы (None, если страница последняя).
+    limit должен быть не меньше 1 (обработчики проверяют его через Query(ge=1)).
+    """
+    query = query.order_by(created_column.desc(), id_column.desc())
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(created_column, id_column) < tuple_(_cursor_timestamp(query, created_at), row_id)
+        )
+    elif offset:
+        query = query.offset(offset)
+
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
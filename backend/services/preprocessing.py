@@ -0,0 +1,90 @@
+# backend/services/preprocessing.py
+import warnings
+from typing import Tuple
+
+from PIL import Image
+
+from services.image_analyzer import (
+    MAX_IMAGE_SIDE,
+    MODEL_INPUT_SIZE,
+    SUPPORTED_FORMATS,
+    check_image_dimensions,
+    probe_image_header,
+)
+
+# Декодирование изображений сразу в размере входа модели.
+# Для JPEG draft() выбирает масштаб IDCT 1/2, 1/4 или 1/8, и декодер
+# не строит полноразмерный растр. Затем reduce() уменьшает изображение
+# в целое число раз усреднением блоков, и остается дешевый финальный
+# ресайз. Перед декодированием размеры проверяются по заголовку файла,
+# чтобы "бомба" с огромными размерами при маленьком файле не дошла до декодера.
+
+# Сколько байт читать для проверки заголовка
+HEADER_READ_SIZE = 256 * 1024
+
+# Встроенная защита Pillow от decompression bomb: предупреждение выше
+# MAX_IMAGE_PIXELS и ошибка выше удвоенного значения. Ограничиваем ее
+# нашим максимальным размером изображения.
+MAX_IMAGE_PIXELS = MAX_IMAGE_SIDE * MAX_IMAGE_SIDE
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Режимы, которые reduce() обрабатывает без конвертации (палитровые сначала переводятся в RGB)
+REDUCIBLE_MODES = ("RGB", "RGBA", "L", "LA")
+
+class ImageRejected(ValueError):
+    """Изображение не прошло проверки перед декодированием"""
+
+def check_image_file(image_path: str) -> Tuple[str, int, int]:
+    """Проверка формата и размеров по заголовку файла, возвращает (формат, ширина, высота)"""
+    with open(image_path, "rb") as f:
+        header = f.read(HEADER_READ_SIZE)
+    try:
+        probe = probe_image_header(header)
+    except ValueError as e:
+        raise ImageRejected(str(e))
+    if probe is None:
+        raise ImageRejected("Image header is truncated")
+    image_format, width, height = probe
+    if not check_image_dimensions(width, height):
+        raise ImageRejected(f"Image dimensions {width}x{height} are out of bounds")
+    return probe
+
+def _reduce_factor(size: Tuple[int, int], target: int) -> int:
+    """Наибольший целый коэффициент, после которого меньшая сторона не меньше target"""
+    return max(1, min(size) // target)
+
+def decode_for_model(image_path: str, size: int = MODEL_INPUT_SIZE) -> Image.Image:
+    """
+    Декодирование изображения в RGB так, чтобы меньшая сторона была
+    в пределах [size, 2 * size) с сохранением пропорций.
+    Приведение к квадрату входа модели делает stack_images.
+    """
+    image_format, width, height = check_image_file(image_path)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+        try:
+            with Image.open(image_path, formats=SUPPORTED_FORMATS) as img:
+                if img.size != (width, height):
+                    raise ImageRejected("Image size does not match its header")
+
+                # Декодер JPEG сразу уменьшает изображение в 2, 4 или 8 раз
+                # (draft выбирает масштаб, при котором стороны не меньше запрошенных)
+                scale = size / min(width, height)
+                img.draft("RGB", (max(size, int(width * scale)), max(size, int(height * scale))))
+                img.load()
+
+                # Уменьшаем до конвертации, чтобы не копировать полноразмерный растр
+                factor = _reduce_factor(img.size, size)
+                if factor > 1 and img.mode in REDUCIBLE_MODES:
+                    image = img.reduce(factor)
+                    factor = 1
+                else:
+                    image = img
+                image = image.convert("RGB")
+        except (Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+            raise ImageRejected(str(e))
+
+    if factor > 1:
+        image = image.reduce(factor)
+    return image
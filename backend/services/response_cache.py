@@ -0,0 +1,150 @@
+# backend/services/response_cache.py
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+# Кэш готовых JSON-ответов в памяти процесса.
+# Ключ - нормализованные параметры запроса, запись действительна для одной
+# версии данных (services/data_versions.py): после изменения данных версия
+# меняется, и старые записи больше не используются. Ответ хранится
+# сериализованным вместе с ETag, клиент с совпадающим If-None-Match получает 304.
+# Одновременные запросы одного ключа ждут одно построение ответа (single-flight),
+# само построение выполняется в потоке, чтобы не блокировать цикл событий.
+# Построение - отдельная задача: отмена запроса, который его начал (клиент
+# отключился), не отменяет его для остальных ожидающих. Поэтому build не
+# использует сессию запроса (get_db закроет ее при отмене), а получает
+# собственную сессию, открытую кэшем.
+
+# Максимальное количество ответов в кэше
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+@dataclass(frozen=True)
+class CachedResponse:
+    version: int
+    # Тело ответа (None - объект не найден)
+    body: Optional[bytes]
+    etag: Optional[str]
+    # Данные для обработчика, не попадающие в ответ (например, название статьи)
+    extra: Any = None
+
+def make_etag(version: int, body: bytes) -> str:
+    return f'"{version}-{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+class ResponseCache:
+    """LRU-кэш ответов с версиями и single-flight"""
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        session_factory: Optional[Callable[[], Session]] = None
+    ):
+        self.max_entries = max_entries
+        # Фабрика сессий для build (по умолчанию SessionLocal)
+        self._session_factory = session_factory
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._inflight: Dict[Tuple[Hashable, int], asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: Hashable, version: int) -> Optional[CachedResponse]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None or cached.version != version:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached
+
+    def _put(self, key: Hashable, cached: CachedResponse):
+        with self._lock:
+            self._entries[key] = cached
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get_or_build(
+        self,
+        key: Hashable,
+        version: int,
+        build: Callable[[Session], Tuple[Optional[bytes], Any]]
+    ) -> CachedResponse:
+        """
+        Ответ из кэша или построенный build(db) -> (тело, extra).
+        build выполняется в потоке и только один раз на ключ и версию,
+        db - отдельная сессия, которая закрывается после построения.
+        """
+        cached = self._get(key, version)
+        if cached is not None:
+            return cached
+
+        flight = (key, version)
+        task = self._inflight.get(flight)
+        if task is None:
+            with self._lock:
+                self.misses += 1
+            task = asyncio.create_task(self._build(key, version, build))
+            self._inflight[flight] = task
+            task.add_done_callback(lambda done: self._finish(flight, done))
+        return await asyncio.shield(task)
+
+    async def _build(
+        self,
+        key: Hashable,
+        version: int,
+        build: Callable[[Session], Tuple[Optional[bytes], Any]]
+    ) -> CachedResponse:
+        body, extra = await asyncio.to_thread(self._run_build, build)
+        cached = CachedResponse(
+            version=version,
+            body=body,
+            etag=make_etag(version, body) if body is not None else None,
+            extra=extra
+        )
+        self._put(key, cached)
+        return cached
+
+    def _run_build(self, build: Callable[[Session], Tuple[Optional[bytes], Any]]):
+        session_factory = self._session_factory
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+
+        db = session_factory()
+        try:
+            return build(db)
+        finally:
+            db.close()
+
+    def _finish(self, flight: Tuple[Hashable, int], task: asyncio.Task):
+        if self._inflight.get(flight) is task:
+            del self._inflight[flight]
+        # Ошибку получит каждый ожидающий; без ожидающих она не должна попадать в лог
+        if not task.cancelled():
+            task.exception()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+def cached_json_response(request: Request, cached: CachedResponse) -> Response:
+    """JSON-ответ из кэша или 304, если у клиента та же версия"""
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and cached.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+# Кэш ответов процесса
+response_cache = ResponseCache()
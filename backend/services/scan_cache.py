@@ -0,0 +1,147 @@
+# backend/services/scan_cache.py
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from PIL import Image
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import ScanResultCache
+from services.inference import analyzer_version
+
+# Кэш результатов анализа по содержимому изображения.
+# Ключ - SHA-256 файла (считается при потоковом приеме загрузки) и версия
+# анализатора. Дополнительно можно включить перцептивный хэш: он считается
+# в воркере по уже декодированному изображению и находит повторные загрузки
+# того же снимка после пересжатия.
+
+# Включение поиска по перцептивному хэшу
+SCAN_CACHE_PHASH = os.getenv("SCAN_CACHE_PHASH", "0") == "1"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "phash_hits": 0}
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+def compute_phash(image: Image.Image) -> str:
+    """Перцептивный хэш (dHash, 64 бита) в виде hex-строки"""
+    small = image.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:016x}"
+
+def _entry_to_result(entry: ScanResultCache) -> Dict:
+    recommendations = []
+    if entry.recommendations:
+        try:
+            recommendations = json.loads(entry.recommendations)
+        except json.JSONDecodeError:
+            recommendations = []
+    return {
+        "condition": entry.condition_detected,
+        "description": entry.description,
+        "confidence": entry.confidence,
+        "recommendations": recommendations
+    }
+
+def _register_hit(db: Session, entry: ScanResultCache):
+    db.execute(
+        update(ScanResultCache)
+        .where(ScanResultCache.id == entry.id)
+        .values(hits=ScanResultCache.hits + 1, last_hit_at=datetime.utcnow())
+    )
+
+def lookup_by_hash(db: Session, sha256: str) -> Optional[Dict]:
+    """Поиск результата по SHA-256 изображения"""
+    entry = db.query(ScanResultCache).filter(
+        ScanResultCache.sha256 == sha256,
+        ScanResultCache.analyzer_version == analyzer_version()
+    ).first()
+    if entry is None:
+        _count("misses")
+        return None
+    _count("hits")
+    _register_hit(db, entry)
+    return _entry_to_result(entry)
+
+def lookup_many_by_hash(db: Session, sha256s: List[str]) -> Dict[str, Dict]:
+    """Поиск результатов для нескольких изображений одним запросом"""
+    entries = db.query(ScanResultCache).filter(
+        ScanResultCache.sha256.in_(set(sha256s)),
+        ScanResultCache.analyzer_version == analyzer_version()
+    ).all()
+    found = {entry.sha256: entry for entry in entries}
+    for sha256 in sha256s:
+        _count("hits" if sha256 in found else "misses")
+    if entries:
+        db.execute(
+            update(ScanResultCache)
+            .where(ScanResultCache.id.in_([entry.id for entry in entries]))
+            .values(hits=ScanResultCache.hits + 1, last_hit_at=datetime.utcnow())
+        )
+    return {sha256: _entry_to_result(entry) for sha256, entry in found.items()}
+
+def lookup_by_phash(db: Session, phash: str) -> Optional[Dict]:
+    """Поиск результата по перцептивному хэшу изображения"""
+    entry = db.query(ScanResultCache).filter(
+        ScanResultCache.phash == phash,
+        ScanResultCache.analyzer_version == analyzer_version()
+    ).first()
+    if entry is None:
+        return None
+    _count("phash_hits")
+    _register_hit(db, entry)
+    return _entry_to_result(entry)
+
+def store_result(db: Session, sha256: str, phash: Optional[str], image_path: str, analysis_result: Dict):
+    """Сохранение результата анализа в кэш"""
+    exists = db.query(ScanResultCache.id).filter(
+        ScanResultCache.sha256 == sha256,
+        ScanResultCache.analyzer_version == analyzer_version()
+    ).first()
+    if exists:
+        return
+
+    entry = ScanResultCache(
+        sha256=sha256,
+        phash=phash,
+        analyzer_version=analyzer_version(),
+        image_path=image_path,
+        condition_detected=analysis_result["condition"],
+        description=analysis_result["description"],
+        confidence=analysis_result["confidence"],
+        recommendations=json.dumps(analysis_result["recommendations"], ensure_ascii=False),
+        hits=0
+    )
+    # Одинаковые изображения могут обрабатываться параллельно - дубликат просто пропускаем
+    db.add(entry)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
+def cache_stats(db: Session) -> Dict:
+    """Статистика кэша: счетчики текущего процесса и итоги по таблице"""
+    entries, total_hits = db.query(
+        func.count(ScanResultCache.id),
+        func.coalesce(func.sum(ScanResultCache.hits), 0)
+    ).filter(ScanResultCache.analyzer_version == analyzer_version()).one()
+    with _stats_lock:
+        process_stats = dict(_stats)
+    return {
+        "analyzer_version": analyzer_version(),
+        "entries": entries,
+        "total_hits": total_hits,
+        "process": process_stats
+    }
@@ -0,0 +1,516 @@
+# backend/services/scan_queue.py
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Scan, ScanJob, ScanJobStatus, ScanStatus, ScanResultCache
+from services.analyzers import ImageAnalyzer, create_analyzer
+from services.conditions import condition_catalog
+from services.counters import bump_counters
+from services.events import event_hub, scan_event
+from services.history_buffer import add_after_commit, history_buffer
+from services.preprocessing import ImageRejected, decode_for_model
+from services.scan_cache import SCAN_CACHE_PHASH, compute_phash, lookup_by_phash, store_result
+from services.upload_ingest import UPLOAD_DIR
+
+# Очередь сканирований хранится в таблице scan_jobs, поэтому переживает
+# перезапуск процесса. Задачи разбирает пул отдельных процессов-воркеров,
+# веб-процесс только ставит задачи в очередь.
+
+logger = logging.getLogger(__name__)
+
+# Количество процессов-воркеров, запускаемых вместе с приложением (0 - не запускать)
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "2"))
+# Максимальное количество задач в очереди, после которого загрузка отвечает 429
+SCAN_QUEUE_MAX_PENDING = int(os.getenv("SCAN_QUEUE_MAX_PENDING", "100"))
+# Значение заголовка Retry-After (в секундах) при переполненной очереди
+SCAN_QUEUE_RETRY_AFTER = int(os.getenv("SCAN_QUEUE_RETRY_AFTER", "10"))
+# Максимальное количество попыток обработки одного скана
+SCAN_JOB_MAX_ATTEMPTS = int(os.getenv("SCAN_JOB_MAX_ATTEMPTS", "3"))
+# Базовая задержка перед повторной попыткой (удваивается с каждой попыткой)
+SCAN_JOB_RETRY_DELAY = float(os.getenv("SCAN_JOB_RETRY_DELAY", "5"))
+# Через сколько секунд задача в статусе running считается зависшей
+SCAN_JOB_TIMEOUT = int(os.getenv("SCAN_JOB_TIMEOUT", "300"))
+# Количество задач, одновременно обрабатываемых одним воркером
+# (с ANALYZER_BACKEND=batch - не меньше BATCH_MAX_SIZE, см. worker_slots)
+SCAN_WORKER_CONCURRENCY = int(os.getenv("SCAN_WORKER_CONCURRENCY", "1"))
+# Пауза между опросами пустой очереди
+SCAN_QUEUE_POLL_INTERVAL = float(os.getenv("SCAN_QUEUE_POLL_INTERVAL", "0.5"))
+# Как часто воркеры отправляют статистику анализатора (секунды)
+SCAN_STATS_INTERVAL = float(os.getenv("SCAN_STATS_INTERVAL", "5"))
+# Загруженный файл без скана, задачи и записи кэша удаляется, если не использовался столько секунд
+UPLOAD_ORPHAN_MIN_AGE = float(os.getenv("UPLOAD_ORPHAN_MIN_AGE", "3600"))
+# Как часто воркеры ищут такие файлы (секунды)
+UPLOAD_SWEEP_INTERVAL = float(os.getenv("UPLOAD_SWEEP_INTERVAL", "3600"))
+
+PENDING_STATUSES = (ScanJobStatus.QUEUED, ScanJobStatus.RUNNING)
+
+# Отправка события о смене статуса скана в веб-процесс
+Notify = Callable[[Dict], None]
+
+class QueueFullError(Exception):
+    """Очередь сканирований переполнена"""
+
+    def __init__(self, retry_after: int = SCAN_QUEUE_RETRY_AFTER):
+        super().__init__("Scan queue is full")
+        self.retry_after = retry_after
+
+def queue_depth(db: Session) -> int:
+    """Количество задач, ожидающих или находящихся в обработке"""
+    return db.query(ScanJob).filter(ScanJob.status.in_(PENDING_STATUSES)).count()
+
+def check_queue_capacity(db: Session, incoming: int = 1):
+    """Проверка, что в очереди есть место для новых задач"""
+    if queue_depth(db) + incoming > SCAN_QUEUE_MAX_PENDING:
+        raise QueueFullError()
+
+def enqueue_scan(db: Session, scan_id: int, image_path: str, image_sha256: Optional[str] = None) -> ScanJob:
+    """
+    Постановка скана в очередь.
+    Коммит выполняет вызывающий код, чтобы скан и задача сохранялись атомарно.
+    """
+    job = ScanJob(
+        scan_id=scan_id,
+        image_path=image_path,
+        image_sha256=image_sha256,
+        status=ScanJobStatus.QUEUED,
+        attempts=0,
+        available_at=datetime.utcnow()
+    )
+    db.add(job)
+    return job
+
+def enqueue_scans(db: Session, scans: List[Tuple[int, str, Optional[str]]]):
+    """
+    Постановка нескольких сканов в очередь одним INSERT.
+    scans - список (scan_id, image_path, image_sha256). Коммит выполняет вызывающий код.
+    """
+    if not scans:
+        return
+    now = datetime.utcnow()
+    db.execute(insert(ScanJob), [
+        {
+            "scan_id": scan_id,
+            "image_path": image_path,
+            "image_sha256": image_sha256,
+            "status": ScanJobStatus.QUEUED,
+            "attempts": 0,
+            "available_at": now
+        }
+        for scan_id, image_path, image_sha256 in scans
+    ])
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[ScanJob]:
+    """Захват следующей готовой к обработке задачи"""
+    for _ in range(5):
+        candidate = db.query(ScanJob.id).filter(
+            ScanJob.status == ScanJobStatus.QUEUED,
+            ScanJob.available_at <= datetime.utcnow()
+        ).order_by(ScanJob.available_at, ScanJob.id).first()
+        if candidate is None:
+            return None
+
+        # Условный UPDATE гарантирует, что задачу получит только один воркер
+        result = db.execute(
+            update(ScanJob)
+            .where(ScanJob.id == candidate.id, ScanJob.status == ScanJobStatus.QUEUED)
+            .values(
+                status=ScanJobStatus.RUNNING,
+                locked_at=datetime.utcnow(),
+                locked_by=worker_id,
+                attempts=ScanJob.attempts + 1
+            )
+        )
+        db.commit()
+        if result.rowcount == 1:
+            return db.query(ScanJob).filter(ScanJob.id == candidate.id).first()
+    return None
+
+def save_scan_result(db: Session, scan_id: int, analysis_result: Dict) -> Optional[Scan]:
+    """Сохранение результата анализа скана"""
+    scan = db.query(Scan).filter(Scan.id == scan_id).first()
+    if not scan:
+        return None
+
+    newly_completed = scan.status != ScanStatus.COMPLETED
+    scan.status = ScanStatus.COMPLETED
+    scan.condition_detected = analysis_result["condition"]
+    scan.confidence = analysis_result["confidence"]
+    scan.processed_at = datetime.utcnow()
+
+    # Текст состояния из каталога не копируется в скан, сохраняется ссылка на версию
+    entry = condition_catalog.latest(db, analysis_result["condition"])
+    if entry is not None and entry.description == analysis_result["description"] \
+            and list(entry.recommendations) == list(analysis_result["recommendations"]):
+        scan.condition_id = entry.id
+        scan.description = None
+        scan.recommendations = None
+    else:
+        scan.condition_id = None
+        scan.description = analysis_result["description"]
+        scan.recommendations = json.dumps(analysis_result["recommendations"], ensure_ascii=False)
+
+    # Запись в историю запросов - через буфер после коммита (счетчик истории
+    # увеличивается при записи буфера)
+    add_after_commit(db, scan.user_id, analysis_result["condition"], scan.id)
+    bump_counters(db, scan.user_id, completed_scans=int(newly_completed))
+    return scan
+
+def mark_scan_failed(db: Session, scan_id: int) -> Optional[Scan]:
+    """Пометка скана как неудачного"""
+    scan = db.query(Scan).filter(Scan.id == scan_id).first()
+    if scan:
+        scan.status = ScanStatus.FAILED
+        scan.processed_at = datetime.utcnow()
+    return scan
+
+def complete_job(db: Session, job_id: int, analysis_result: Dict, phash: Optional[str] = None) -> Optional[Dict]:
+    """
+    Сохранение результата, завершение задачи и запись в кэш результатов.
+    Возвращает событие о завершении скана.
+    """
+    job = db.query(ScanJob).filter(ScanJob.id == job_id).first()
+    scan = save_scan_result(db, job.scan_id, analysis_result)
+    job.status = ScanJobStatus.DONE
+    job.last_error = None
+    db.commit()
+    event = scan_event(db, scan) if scan else None
+
+    if job.image_sha256:
+        store_result(db, job.image_sha256, phash, job.image_path, analysis_result)
+    return event
+
+def _lookup_phash(db: Session, phash: str) -> Optional[Dict]:
+    result = lookup_by_phash(db, phash)
+    db.commit()
+    return result
+
+def fail_job(db: Session, job_id: int, error: str, retry: bool = True) -> Optional[Dict]:
+    """
+    Возврат задачи в очередь с задержкой или окончательная ошибка.
+    Возвращает событие, если скан окончательно завершился ошибкой.
+    """
+    job = db.query(ScanJob).filter(ScanJob.id == job_id).first()
+    job.last_error = error[:1000]
+    scan = None
+    if retry and job.attempts < SCAN_JOB_MAX_ATTEMPTS:
+        delay = SCAN_JOB_RETRY_DELAY * (2 ** (job.attempts - 1))
+        job.status = ScanJobStatus.QUEUED
+        job.available_at = datetime.utcnow() + timedelta(seconds=delay)
+    else:
+        job.status = ScanJobStatus.FAILED
+        scan = mark_scan_failed(db, job.scan_id)
+    job.locked_at = None
+    job.locked_by = None
+    db.commit()
+    return scan_event(db, scan) if scan else None
+
+def _with_session(func, *args):
+    """Выполнение функции с отдельной сессией базы данных"""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return func(db, *args)
+    finally:
+        db.close()
+
+def _claim_job_info(db: Session, worker_id: str) -> Optional[Tuple[int, str]]:
+    job = claim_next_job(db, worker_id)
+    if job is None:
+        return None
+    return job.id, job.image_path
+
+async def run_job(analyzer: ImageAnalyzer, job_id: int, image_path: str, notify: Optional[Notify] = None):
+    """Выполнение задачи с повтором при ошибке"""
+    event = None
+    try:
+        # Изображение декодируется один раз, сразу в размере входа модели
+        image = await asyncio.to_thread(decode_for_model, image_path)
+
+        # Пересжатая копия уже проанализированного снимка берется из кэша
+        phash = None
+        analysis_result = None
+        if SCAN_CACHE_PHASH:
+            phash = compute_phash(image)
+            analysis_result = await asyncio.to_thread(_with_session, _lookup_phash, phash)
+
+        if analysis_result is None:
+            analysis_result = await analyzer.analyze(image)
+        event = await asyncio.to_thread(_with_session, complete_job, job_id, analysis_result, phash)
+    except ImageRejected as e:
+        # Повторная попытка не поможет: файл не изменится
+        logger.warning("Scan job %s rejected image: %s", job_id, e)
+        event = await asyncio.to_thread(_with_session, fail_job, job_id, str(e), False)
+    except Exception as e:
+        logger.exception("Scan job %s failed", job_id)
+        event = await asyncio.to_thread(_with_session, fail_job, job_id, str(e))
+
+    if event is not None and notify is not None:
+        try:
+            notify(event)
+        except Exception:
+            logger.exception("Failed to send scan event")
+
+def requeue_stale_jobs(db: Session, notify: Optional[Notify] = None) -> int:
+    """
+    Возврат в очередь задач, зависших после падения воркера.
+    О сканах, помеченных неудачными, сообщается через notify.
+    """
+    now = datetime.utcnow()
+    requeued = 0
+    failed_scans = []
+
+    stale_jobs = db.query(ScanJob).filter(
+        ScanJob.status == ScanJobStatus.RUNNING,
+        ScanJob.locked_at < now - timedelta(seconds=SCAN_JOB_TIMEOUT)
+    ).all()
+    for job in stale_jobs:
+        job.locked_at = None
+        job.locked_by = None
+        if job.attempts < SCAN_JOB_MAX_ATTEMPTS:
+            job.status = ScanJobStatus.QUEUED
+            job.available_at = now
+            requeued += 1
+        else:
+            job.status = ScanJobStatus.FAILED
+            job.last_error = "Job timed out"
+            scan = mark_scan_failed(db, job.scan_id)
+            if scan is not None:
+                failed_scans.append(scan)
+
+    db.commit()
+    if notify is not None:
+        for scan in failed_scans:
+            try:
+                notify(scan_event(db, scan))
+            except Exception:
+                logger.exception("Failed to send scan event")
+    return requeued
+
+def requeue_orphan_scans(db: Session) -> int:
+    """Постановка в очередь сканов в статусе processing, у которых нет активной задачи"""
+    pending_scan_ids = select(ScanJob.scan_id).where(ScanJob.status.in_(PENDING_STATUSES))
+    orphan_scans = db.query(Scan).filter(
+        Scan.status == ScanStatus.PROCESSING,
+        ~Scan.id.in_(pending_scan_ids)
+    ).all()
+    for scan in orphan_scans:
+        enqueue_scan(db, scan.id, scan.image_path)
+
+    db.commit()
+    return len(orphan_scans)
+
+def remove_orphan_uploads(db: Session, directory: str = UPLOAD_DIR, min_age: float = UPLOAD_ORPHAN_MIN_AGE) -> int:
+    """
+    Удаление загруженных файлов, на которые не ссылается ни скан, ни задача,
+    ни запись кэша результатов (отклоненные загрузки, 429). Файлы хранятся
+    по хэшу содержимого и общие для одинаковых загрузок, поэтому запрос их
+    не удаляет; min_age защищает файлы, которые принимаются прямо сейчас.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - min_age
+    candidates = []
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                candidates.append(os.path.join(directory, entry.name))
+        except FileNotFoundError:
+            continue
+
+    removed = 0
+    for start in range(0, len(candidates), 500):
+        chunk = candidates[start:start + 500]
+        referenced = set()
+        for column in (Scan.image_path, ScanJob.image_path, ScanResultCache.image_path):
+            referenced.update(db.scalars(select(column).where(column.in_(chunk))))
+        for path in chunk:
+            if path in referenced:
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+async def _worker_slot(worker_id: str, analyzer: ImageAnalyzer, stop_event, notify: Optional[Notify] = None):
+    """Цикл обработки задач одного слота воркера"""
+    while stop_event is None or not stop_event.is_set():
+        try:
+            job_info = await asyncio.to_thread(_with_session, _claim_job_info, worker_id)
+        except Exception:
+            logger.exception("Scan worker %s failed to claim a job", worker_id)
+            job_info = None
+
+        if job_info is not None:
+            job_id, image_path = job_info
+            try:
+                await run_job(analyzer, job_id, image_path, notify)
+            except Exception:
+                # Например, ошибка базы данных в fail_job: задачу вернет в очередь
+                # requeue_stale_jobs, остальные слоты и этот слот продолжают работу
+                logger.exception("Scan worker %s failed to finish job %s", worker_id, job_id)
+                await asyncio.sleep(SCAN_QUEUE_POLL_INTERVAL)
+        else:
+            await asyncio.sleep(SCAN_QUEUE_POLL_INTERVAL)
+
+async def _stale_jobs_watchdog(stop_event, notify: Optional[Notify] = None):
+    """Периодическое восстановление зависших задач и удаление файлов без сканов"""
+    interval = max(SCAN_JOB_TIMEOUT // 2, 1)
+    next_sweep = time.monotonic()
+    while stop_event is None or not stop_event.is_set():
+        try:
+            await asyncio.to_thread(_with_session, requeue_stale_jobs, notify)
+        except Exception:
+            logger.exception("Failed to requeue stale scan jobs")
+        if time.monotonic() >= next_sweep:
+            next_sweep = time.monotonic() + UPLOAD_SWEEP_INTERVAL
+            try:
+                removed = await asyncio.to_thread(_with_session, remove_orphan_uploads)
+                if removed:
+                    logger.info("Removed %s orphan uploads", removed)
+            except Exception:
+                logger.exception("Failed to remove orphan uploads")
+        for _ in range(int(interval / SCAN_QUEUE_POLL_INTERVAL) or 1):
+            if stop_event is not None and stop_event.is_set():
+                return
+            await asyncio.sleep(SCAN_QUEUE_POLL_INTERVAL)
+
+async def _stats_reporter(worker_id: str, analyzer: ImageAnalyzer, stats_queue, stop_event):
+    """Периодическая отправка статистики анализатора в родительский процесс"""
+    if stats_queue is None or not hasattr(analyzer, "stats"):
+        return
+    while stop_event is None or not stop_event.is_set():
+        await asyncio.sleep(SCAN_STATS_INTERVAL)
+        try:
+            stats_queue.put_nowait((worker_id, analyzer.stats()))
+        except Exception:
+            logger.exception("Failed to report analyzer stats")
+
+def worker_slots(analyzer: ImageAnalyzer) -> int:
+    """Количество слотов воркера (задач, обрабатываемых одновременно)"""
+    # Батч собирается только из одновременных задач: при одном слоте
+    # каждый батч - одно изображение плюс ожидание добора
+    return max(SCAN_WORKER_CONCURRENCY, getattr(analyzer, "max_batch_size", 1))
+
+async def _worker_loop(worker_id: str, stop_event, stats_queue=None, events_queue=None):
+    analyzer = create_analyzer()
+    notify = events_queue.put_nowait if events_queue is not None else None
+    # Модель загружается и прогревается до того, как воркер начнет брать задачи
+    await analyzer.warmup()
+    try:
+        await asyncio.gather(
+            _stale_jobs_watchdog(stop_event, notify),
+            _stats_reporter(worker_id, analyzer, stats_queue, stop_event),
+            *[
+                _worker_slot(f"{worker_id}/{slot}", analyzer, stop_event, notify)
+                for slot in range(worker_slots(analyzer))
+            ]
+        )
+    finally:
+        await analyzer.aclose()
+        # Запись истории о завершенных сканах, оставшейся в буфере воркера
+        await asyncio.to_thread(history_buffer.close)
+
+def worker_main(worker_id: str, stop_event=None, stats_queue=None, events_queue=None):
+    """Точка входа процесса-воркера"""
+    # Ctrl+C обрабатывает родительский процесс, воркер останавливается через stop_event
+    if stop_event is not None:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    asyncio.run(_worker_loop(worker_id, stop_event, stats_queue, events_queue))
+
+class ScanWorkerPool:
+    """Пул процессов, разбирающих очередь сканирований"""
+
+    def __init__(self, size: int = SCAN_WORKERS):
+        self.size = size
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop_event = None
+        self._stats_queue = None
+        self._events_queue = None
+        self._events_thread = None
+        self._worker_stats: Dict[str, Dict] = {}
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self):
+        """Запуск воркеров"""
+        from database import SessionLocal
+
+        # Восстановление после падения: только здесь, чтобы воркеры
+        # не поставили один и тот же скан в очередь дважды
+        db = SessionLocal()
+        try:
+            requeued = requeue_stale_jobs(db) + requeue_orphan_scans(db)
+            if requeued:
+                logger.info("Requeued %s stale scans", requeued)
+        finally:
+            db.close()
+
+        self._stop_event = self._ctx.Event()
+        self._stats_queue = self._ctx.Queue()
+        self._events_queue = self._ctx.Queue()
+        self._events_thread = threading.Thread(target=self._forward_events, name="scan-events", daemon=True)
+        self._events_thread.start()
+        for i in range(self.size):
+            worker_id = f"{os.getpid()}-{i}"
+            process = self._ctx.Process(
+                target=worker_main,
+                args=(worker_id, self._stop_event, self._stats_queue, self._events_queue),
+                name=f"scan-worker-{i}",
+                # Не daemon: воркеру может понадобиться собственный пул процессов анализатора
+                daemon=False
+            )
+            process.start()
+            self._processes.append(process)
+
+    def stop(self, timeout: float = 10):
+        """Остановка воркеров с ожиданием текущих задач"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        if self._events_thread is not None:
+            self._events_thread.join(timeout)
+            self._events_thread = None
+
+    def _forward_events(self):
+        """Пересылка событий от воркеров в хаб событий веб-процесса"""
+        while not self._stop_event.is_set() or not self._events_queue.empty():
+            try:
+                event = self._events_queue.get(timeout=SCAN_QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            event_hub.publish(event)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Последняя статистика анализатора от каждого воркера"""
+        if self._stats_queue is not None:
+            while True:
+                try:
+                    worker_id, worker_stats = self._stats_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._worker_stats[worker_id] = worker_stats
+        return dict(self._worker_stats)
+
+# Пул воркеров веб-приложения
+worker_pool = ScanWorkerPool()
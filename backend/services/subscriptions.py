@@ -0,0 +1,174 @@
+# backend/services/subscriptions.py
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Subscription, SubscriptionStatus, SubscriptionType
+from services.entitlements import bump_entitlement_epoch
+
+# Окончание и автопродление подписок.
+# Фоновый поток раз в SUBSCRIPTION_SCHEDULER_INTERVAL секунд переводит
+# подписки с прошедшей датой окончания в статус expired, поэтому частичные
+# индексы по действующим подпискам (status = 'ACTIVE') содержат только
+# действующие строки, а поиск подписки пользователя - точечный запрос.
+# Подписки с auto_renew (кроме пробных) продлеваются на один период: старая
+# строка становится expired, новая начинается с max(дата окончания, now).
+# После простоя планировщика пропущенные периоды не продлеваются: новая
+# подписка заканчивается позже now и в том же вызове не обрабатывается.
+# Подписки обрабатываются пачками по SUBSCRIPTION_BATCH_SIZE: один
+# условный UPDATE ... RETURNING на пачку, поэтому несколько процессов
+# не продлят одну подписку дважды.
+
+logger = logging.getLogger(__name__)
+
+# Интервал проверки подписок в секундах (0 - не запускать в этом процессе)
+SUBSCRIPTION_SCHEDULER_INTERVAL = float(os.getenv("SUBSCRIPTION_SCHEDULER_INTERVAL", "300"))
+# Количество подписок в одной транзакции
+SUBSCRIPTION_BATCH_SIZE = int(os.getenv("SUBSCRIPTION_BATCH_SIZE", "500"))
+
+def calculate_end_date(subscription_type: SubscriptionType, start_date: datetime) -> datetime:
+    """Вычисление даты окончания подписки"""
+    if subscription_type == SubscriptionType.TRIAL:
+        return start_date + timedelta(days=7)
+    elif subscription_type == SubscriptionType.EXPRESS:
+        return start_date + timedelta(days=30)
+    elif subscription_type == SubscriptionType.QUARTER:
+        return start_date + timedelta(days=90)
+    elif subscription_type == SubscriptionType.ANNUAL:
+        return start_date + timedelta(days=365)
+    else:
+        raise ValueError("Invalid subscription type")
+
+def renewal_start(end_date: datetime, now: datetime) -> datetime:
+    """Начало продленной подписки: окончание старой, но не раньше now"""
+    if end_date.tzinfo is not None and now.tzinfo is None:
+        # PostgreSQL возвращает дату с часовым поясом, now - наивное время UTC
+        end_date = end_date.astimezone(timezone.utc).replace(tzinfo=None)
+    return max(end_date, now)
+
+def _expire_batch(db: Session, now: datetime, renewable: bool, batch_size: int):
+    """Перевод пачки истекших подписок в expired; строки, измененные этим процессом"""
+    due = (
+        Subscription.status == SubscriptionStatus.ACTIVE,
+        Subscription.end_date <= now,
+    )
+    if renewable:
+        due += (Subscription.auto_renew == True, Subscription.subscription_type != SubscriptionType.TRIAL)
+    ids = select(Subscription.id).where(*due).order_by(Subscription.end_date).limit(batch_size)
+    # Повторная проверка статуса: подписку, измененную другим процессом, UPDATE пропустит
+    return db.execute(
+        update(Subscription)
+        .where(Subscription.id.in_(ids), Subscription.status == SubscriptionStatus.ACTIVE)
+        .values(status=SubscriptionStatus.EXPIRED)
+        .returning(Subscription.user_id, Subscription.subscription_type, Subscription.end_date),
+        execution_options={"synchronize_session": False}
+    ).all()
+
+def renew_due_subscriptions(db: Session, now: Optional[datetime] = None, batch_size: int = SUBSCRIPTION_BATCH_SIZE) -> int:
+    """Продление истекших подписок с auto_renew, возвращает количество продлений"""
+    now = now or datetime.utcnow()
+    renewed = 0
+    while True:
+        rows = _expire_batch(db, now, True, batch_size)
+        if not rows:
+            return renewed
+        starts = [
+            (user_id, subscription_type, renewal_start(end_date, now))
+            for user_id, subscription_type, end_date in rows
+        ]
+        db.execute(insert(Subscription), [
+            {
+                "user_id": user_id,
+                "subscription_type": subscription_type,
+                "status": SubscriptionStatus.ACTIVE,
+                "start_date": start_date,
+                "end_date": calculate_end_date(subscription_type, start_date),
+                "is_trial": False,
+                "auto_renew": True,
+            }
+            for user_id, subscription_type, start_date in starts
+        ])
+        # Дата окончания в claim токена изменилась
+        bump_entitlement_epoch(db, {user_id for user_id, _, _ in rows})
+        db.commit()
+        renewed += len(rows)
+
+def expire_due_subscriptions(db: Session, now: Optional[datetime] = None, batch_size: int = SUBSCRIPTION_BATCH_SIZE) -> int:
+    """Перевод истекших подписок в expired, возвращает количество подписок"""
+    now = now or datetime.utcnow()
+    expired = 0
+    while True:
+        rows = _expire_batch(db, now, False, batch_size)
+        # Эпоха прав не меняется: claim токена содержит дату окончания и уже неактивен
+        db.commit()
+        expired += len(rows)
+        if len(rows) < batch_size:
+            return expired
+
+def process_due_subscriptions(db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Продление, затем окончание истекших подписок"""
+    now = now or datetime.utcnow()
+    # Новая подписка заканчивается после now, поэтому каждая подписка продлевается один раз
+    renewed = renew_due_subscriptions(db, now)
+    return {"renewed": renewed, "expired": expire_due_subscriptions(db, now)}
+
+class SubscriptionScheduler:
+    """Фоновая периодическая обработка истекших подписок"""
+
+    def __init__(self, interval: float = SUBSCRIPTION_SCHEDULER_INTERVAL):
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.renewed = 0
+        self.expired = 0
+        self.errors = 0
+
+    def run_once(self) -> Dict[str, int]:
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            result = process_due_subscriptions(db)
+        finally:
+            db.close()
+        self.runs += 1
+        self.renewed += result["renewed"]
+        self.expired += result["expired"]
+        if result["renewed"] or result["expired"]:
+            logger.info("Subscriptions renewed: %s, expired: %s", result["renewed"], result["expired"])
+        return result
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                self.errors += 1
+                logger.exception("Failed to process due subscriptions")
+            if self._stop_event.wait(self.interval):
+                return
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="subscription-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> Dict:
+        return {"runs": self.runs, "renewed": self.renewed, "expired": self.expired, "errors": self.errors}
+
+# Планировщик подписок веб-процесса
+subscription_scheduler = SubscriptionScheduler()
@@ -0,0 +1,343 @@
+# backend/services/suggest_index.py
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Literature
+from services.data_versions import LITERATURE, data_versions
+from services.image_analyzer import MEDICAL_CONDITIONS
+
+# Подсказки с учетом опечаток по названиям литературы и состояний.
+# Индекс строится в памяти процесса: словарь слов, для каждой триграммы
+# слова - массив номеров слов, для каждого слова - массив номеров записей.
+# Слово запроса сравнивается со словами словаря по доле общих триграмм
+# (как pg_trgm), последнее слово дополнительно ищется по префиксу
+# (автодополнение во время ввода). Изменения литературы в этом процессе
+# применяются к индексу сразу после коммита. Любое изменение литературы
+# (в том числе из других процессов и массовые UPDATE/INSERT импорта) меняет
+# версию данных literature (services/data_versions.py); индекс, построенный
+# для другой версии, перестраивается в фоновом потоке, а запросы до конца
+# перестройки используют прежний индекс.
+
+logger = logging.getLogger(__name__)
+
+# Минимальная похожесть слова (доля общих триграмм от 0 до 1)
+SUGGEST_MIN_SIMILARITY = float(os.getenv("SUGGEST_MIN_SIMILARITY", "0.3"))
+# Минимальный интервал между фоновыми перестройками индекса (секунды)
+SUGGEST_REFRESH_INTERVAL = float(os.getenv("SUGGEST_REFRESH_INTERVAL", "60"))
+
+# Максимальное количество слов-продолжений для префикса
+MAX_PREFIX_MATCHES = 50
+# Оценка продолжения по префиксу: от PREFIX_SCORE до 1 в зависимости от доли набранных букв
+PREFIX_SCORE = 0.6
+
+_WORD_RE = re.compile(r"\w+")
+
+def normalize_words(text: str) -> List[str]:
+    """Слова текста в нижнем регистре, "ё" заменяется на "е", однобуквенные пропускаются"""
+    return [word for word in _WORD_RE.findall(text.lower().replace("ё", "е")) if len(word) > 1]
+
+def trigrams(word: str) -> set:
+    """Триграммы слова с отступами по краям, как в pg_trgm"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+@dataclass(frozen=True)
+class SuggestEntry:
+    kind: str  # literature или condition
+    id: Optional[int]
+    text: str
+
+    @property
+    def key(self) -> Tuple[str, object]:
+        return (self.kind, self.id if self.id is not None else self.text)
+
+class TrigramIndex:
+    """Триграммный индекс записей с добавлением и удалением отдельных записей"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Записи; удаленные заменяются на None до следующей перестройки
+        self._entries: List[Optional[SuggestEntry]] = []
+        self._extras: List[str] = []
+        self._entry_ids: Dict[Tuple[str, object], int] = {}
+        self._removed = 0
+        # Словарь: номер слова -> слово, количество его триграмм и записи с ним
+        self._words: List[str] = []
+        self._word_ids: Dict[str, int] = {}
+        self._word_trigrams = array("H")
+        self._word_entries: List[array] = []
+        # Триграмма -> номера слов (по возрастанию)
+        self._postings: Dict[str, array] = {}
+        # Слова по алфавиту для поиска по префиксу
+        self._sorted_words: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._entries) - self._removed
+
+    def build(self, entries: Iterable[Tuple[SuggestEntry, str]]):
+        """Построение индекса заново из пар (запись, дополнительный текст для поиска)"""
+        with self._lock:
+            self._reset()
+            for entry, extra in entries:
+                self._add(entry, extra)
+
+    def add(self, entry: SuggestEntry, extra: str = ""):
+        """Добавление записи (запись с тем же ключом заменяется)"""
+        with self._lock:
+            self._remove(entry.key)
+            self._add(entry, extra)
+
+    def remove(self, kind: str, key: object):
+        with self._lock:
+            self._remove((kind, key))
+            # Много удаленных записей: словарь перестраивается по оставшимся
+            if self._removed > 100 and self._removed * 4 > len(self._entries):
+                entries = [
+                    (entry, extra) for entry, extra in zip(self._entries, self._extras) if entry is not None
+                ]
+                self._reset()
+                for entry, extra in entries:
+                    self._add(entry, extra)
+
+    def _word_id(self, word: str) -> int:
+        word_id = self._word_ids.get(word)
+        if word_id is not None:
+            return word_id
+
+        word_id = len(self._words)
+        grams = trigrams(word)
+        self._words.append(word)
+        self._word_ids[word] = word_id
+        self._word_trigrams.append(len(grams))
+        self._word_entries.append(array("I"))
+        for gram in grams:
+            self._postings.setdefault(gram, array("I")).append(word_id)
+        bisect.insort(self._sorted_words, word)
+        return word_id
+
+    def _add(self, entry: SuggestEntry, extra: str):
+        entry_id = len(self._entries)
+        self._entries.append(entry)
+        self._extras.append(extra)
+        self._entry_ids[entry.key] = entry_id
+        for word in set(normalize_words(f"{entry.text} {extra}")):
+            self._word_entries[self._word_id(word)].append(entry_id)
+
+    def _remove(self, key: Tuple[str, object]):
+        entry_id = self._entry_ids.pop(key, None)
+        if entry_id is not None:
+            self._entries[entry_id] = None
+            self._extras[entry_id] = ""
+            self._removed += 1
+
+    def _match_word(self, term: str, prefix: bool, min_similarity: float) -> Dict[int, float]:
+        """Слова словаря, похожие на term: номер слова -> оценка"""
+        grams = trigrams(term)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for word_id in self._postings.get(gram, ()):
+                shared[word_id] = shared.get(word_id, 0) + 1
+
+        matches = {}
+        for word_id, common in shared.items():
+            similarity = common / (len(grams) + self._word_trigrams[word_id] - common)
+            if similarity >= min_similarity:
+                matches[word_id] = similarity
+
+        if prefix:
+            start = bisect.bisect_left(self._sorted_words, term)
+            for word in self._sorted_words[start:start + MAX_PREFIX_MATCHES]:
+                if not word.startswith(term):
+                    break
+                word_id = self._word_ids[word]
+                score = PREFIX_SCORE + (1 - PREFIX_SCORE) * len(term) / len(word)
+                if score > matches.get(word_id, 0):
+                    matches[word_id] = score
+        return matches
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        min_similarity: float = SUGGEST_MIN_SIMILARITY
+    ) -> List[Tuple[SuggestEntry, float]]:
+        """
+        Записи, похожие на query, от лучших к худшим.
+        Оценка записи - средняя по словам запроса оценка лучшего совпадающего слова.
+        """
+        terms = normalize_words(query)
+        if not terms:
+            return []
+        if len(terms) == 1:
+            return self._search_word(terms[0], limit, min_similarity)
+
+        with self._lock:
+            scores: Dict[int, List[float]] = {}
+            for position, term in enumerate(terms):
+                matches = self._match_word(term, position == len(terms) - 1, min_similarity)
+                for word_id, score in matches.items():
+                    for entry_id in self._word_entries[word_id]:
+                        entry_scores = scores.setdefault(entry_id, [0.0] * len(terms))
+                        if score > entry_scores[position]:
+                            entry_scores[position] = score
+
+            ranked = []
+            for entry_id, entry_scores in scores.items():
+                entry = self._entries[entry_id]
+                score = sum(entry_scores) / len(terms)
+                if entry is not None and score >= min_similarity:
+                    ranked.append((score, entry))
+
+        ranked.sort(key=lambda item: (-item[0], len(item[1].text)))
+        return [(entry, round(score, 3)) for score, entry in ranked[:limit]]
+
+    def _search_word(self, term: str, limit: int, min_similarity: float) -> List[Tuple[SuggestEntry, float]]:
+        """
+        Запрос из одного слова: оценка записи равна оценке ее лучшего слова,
+        поэтому слова перебираются от лучших к худшим и перебор останавливается,
+        как только набрано limit записей и оценка следующего слова ниже.
+        """
+        with self._lock:
+            matches = sorted(
+                self._match_word(term, True, min_similarity).items(),
+                key=lambda match: -match[1]
+            )
+            seen = set()
+            ranked = []
+            for word_id, score in matches:
+                if len(ranked) >= limit and score < ranked[-1][0]:
+                    break
+                for entry_id in self._word_entries[word_id]:
+                    entry = self._entries[entry_id]
+                    if entry is not None and entry_id not in seen:
+                        seen.add(entry_id)
+                        ranked.append((score, entry))
+
+        ranked.sort(key=lambda item: (-item[0], len(item[1].text)))
+        return [(entry, round(score, 3)) for score, entry in ranked[:limit]]
+
+def _literature_entry(literature_id: int, title: str, tags: Optional[str]) -> Tuple[SuggestEntry, str]:
+    extra = ""
+    if tags:
+        try:
+            extra = " ".join(json.loads(tags))
+        except (json.JSONDecodeError, TypeError):
+            pass
+    return SuggestEntry("literature", literature_id, title), extra
+
+class SuggestIndex:
+    """Индекс подсказок процесса с отслеживанием изменений литературы"""
+
+    def __init__(self):
+        self.index = TrigramIndex()
+        self._built = False
+        # Версия литературы, по которой построен индекс
+        self._version: Optional[int] = None
+        self._rebuild_started = 0.0
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def build(self, db: Session):
+        """Построение индекса по активной литературе и списку состояний"""
+        started = time.perf_counter()
+        # Версия читается до строк: изменение после нее даст следующую перестройку
+        version = data_versions.current(db, LITERATURE)
+        rows = db.query(Literature.id, Literature.title, Literature.tags).filter(
+            Literature.is_active == True
+        ).all()
+
+        entries = [_literature_entry(row.id, row.title or "", row.tags) for row in rows]
+        entries += [(SuggestEntry("condition", None, item["condition"]), "") for item in MEDICAL_CONDITIONS]
+        self.index.build(entries)
+
+        with self._lock:
+            self._built = True
+            self._version = version
+        logger.info(
+            "Suggest index built: %s entries in %.1f ms",
+            len(self.index), (time.perf_counter() - started) * 1000
+        )
+
+    def _rebuild(self):
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            self.build(db)
+        except Exception:
+            logger.exception("Failed to rebuild suggest index")
+        finally:
+            db.close()
+            with self._lock:
+                self._rebuild_thread = None
+
+    def ensure_fresh(self, db: Session):
+        """Построение индекса при первом обращении, фоновая перестройка при смене версии литературы"""
+        if not self._built:
+            self.build(db)
+            return
+
+        version = data_versions.current(db, LITERATURE)
+        with self._lock:
+            if (
+                version == self._version
+                or self._rebuild_thread is not None
+                or time.monotonic() - self._rebuild_started < SUGGEST_REFRESH_INTERVAL
+            ):
+                return
+            self._rebuild_started = time.monotonic()
+            self._rebuild_thread = threading.Thread(target=self._rebuild, name="suggest-index-rebuild", daemon=True)
+            self._rebuild_thread.start()
+
+    def apply(self, changes: List[Tuple[int, Optional[str], Optional[str], bool]]):
+        """Применение изменений литературы: (id, title, tags, активна ли статья)"""
+        if not self._built:
+            return
+        for literature_id, title, tags, active in changes:
+            if active:
+                self.index.add(*_literature_entry(literature_id, title or "", tags))
+            else:
+                self.index.remove("literature", literature_id)
+
+    def search(self, db: Session, query: str, limit: int = 10) -> List[Tuple[SuggestEntry, float]]:
+        self.ensure_fresh(db)
+        return self.index.search(query, limit)
+
+# Индекс подсказок процесса
+suggest_index = SuggestIndex()
+
+_CHANGES_KEY = "suggest_index_changes"
+
+@event.listens_for(Session, "after_flush")
+def _collect_literature_changes(session, flush_context):
+    changes = session.info.setdefault(_CHANGES_KEY, [])
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Literature):
+            changes.append((obj.id, obj.title, obj.tags, obj.is_active is not False))
+    for obj in session.deleted:
+        if isinstance(obj, Literature):
+            changes.append((obj.id, None, None, False))
+
+@event.listens_for(Session, "after_commit")
+def _apply_literature_changes(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if changes:
+        suggest_index.apply(changes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_literature_changes(session):
+    session.info.pop(_CHANGES_KEY, None)
@@ -0,0 +1,123 @@
+# backend/services/telegram_init_data.py
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl
+
+# Проверка подписи initData Telegram Web App.
+# Ключ подписи HMAC-SHA256("WebAppBotToken", bot_token) вычисляется один раз
+# на токен бота, хэш сравнивается за постоянное время. initData с auth_date
+# старше TELEGRAM_AUTH_MAX_AGE секунд отклоняется. Проверенные строки initData
+# запоминаются до окончания их срока (не больше TELEGRAM_INIT_DATA_CACHE_SIZE
+# строк): повторная отправка той же строки (перезагрузка Mini App, повторные
+# запросы входа) не разбирается и не хэшируется заново, а после окончания
+# срока отклоняется вместе со всеми остальными устаревшими initData.
+
+# Максимальный возраст auth_date (секунды, 0 - не проверять)
+TELEGRAM_AUTH_MAX_AGE = int(os.getenv("TELEGRAM_AUTH_MAX_AGE", "86400"))
+# Максимальное количество запомненных проверенных initData
+TELEGRAM_INIT_DATA_CACHE_SIZE = int(os.getenv("TELEGRAM_INIT_DATA_CACHE_SIZE", "10000"))
+# Допустимое опережение auth_date относительно часов сервера (секунды)
+AUTH_DATE_CLOCK_SKEW = 60
+
+class TelegramInitDataVerifier:
+    """Проверка initData одного бота"""
+
+    def __init__(
+        self,
+        bot_token: str,
+        max_age: int = TELEGRAM_AUTH_MAX_AGE,
+        cache_size: int = TELEGRAM_INIT_DATA_CACHE_SIZE
+    ):
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self._secret_key = hmac.new(b"WebAppBotToken", bot_token.encode(), hashlib.sha256).digest()
+        # initData -> (срок действия по time.time(), результат проверки)
+        self._seen: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, auth_date: Optional[int], now: float) -> bool:
+        if self.max_age <= 0:
+            return True
+        return auth_date is not None and now - self.max_age <= auth_date <= now + AUTH_DATE_CLOCK_SKEW
+
+    def _check(self, init_data: str) -> Optional[Dict[str, Any]]:
+        try:
+            params = dict(parse_qsl(init_data))
+        except Exception:
+            return None
+
+        hash_val = params.pop("hash", None)
+        if not hash_val:
+            return None
+
+        data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(params.items()))
+        calculated_hash = hmac.new(self._secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(calculated_hash, hash_val):
+            return None
+
+        user_str = params.get("user")
+        if not user_str:
+            return None
+        try:
+            user_data = json.loads(user_str)
+        except json.JSONDecodeError:
+            return None
+        return {
+            "user": user_data,
+            "auth_date": params.get("auth_date"),
+            "hash": hash_val
+        }
+
+    def verify(self, init_data: str) -> Optional[Dict[str, Any]]:
+        """Данные пользователя из initData или None (неверная подпись или устаревший auth_date)"""
+        now = time.time()
+        with self._lock:
+            entry = self._seen.get(init_data)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._seen.move_to_end(init_data)
+                    self.hits += 1
+                    return entry[1]
+                del self._seen[init_data]
+            self.misses += 1
+
+        result = self._check(init_data)
+        if result is None:
+            return None
+        try:
+            auth_date = int(result["auth_date"])
+        except (TypeError, ValueError):
+            auth_date = None
+        if not self._fresh(auth_date, now):
+            return None
+
+        expires = auth_date + self.max_age if self.max_age > 0 else float("inf")
+        with self._lock:
+            self._seen[init_data] = (expires, result)
+            self._seen.move_to_end(init_data)
+            while len(self._seen) > self.cache_size:
+                self._seen.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._seen), "hits": self.hits, "misses": self.misses}
+
+_verifiers: Dict[str, TelegramInitDataVerifier] = {}
+_verifiers_lock = threading.Lock()
+
+def telegram_verifier(bot_token: str) -> TelegramInitDataVerifier:
+    """Проверка initData для токена бота (один объект на токен в процессе)"""
+    verifier = _verifiers.get(bot_token)
+    if verifier is None:
+        with _verifiers_lock:
+            verifier = _verifiers.setdefault(bot_token, TelegramInitDataVerifier(bot_token))
+    return verifier
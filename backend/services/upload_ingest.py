@@ -0,0 +1,234 @@
+# backend/services/upload_ingest.py
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional
+
+from fastapi import Request, status
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from services.image_analyzer import probe_image_header, check_image_dimensions, SUPPORTED_FORMATS
+
+# Потоковый прием загрузок: тело запроса читается по частям и сразу пишется
+# на диск. Формат и размеры проверяются по заголовку изображения,
+# поэтому при загрузке изображение не декодируется ни разу.
+# Попутно считается SHA-256: файл сохраняется под именем хэша,
+# и повторная загрузка того же изображения не создает вторую копию.
+
+# Каталог загруженных изображений (относительно рабочего каталога приложения)
+UPLOAD_DIR = "uploads/images"
+# Максимальный размер одного изображения в байтах
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Сколько байт от начала файла можно прочитать в поисках размеров изображения
+HEADER_PROBE_LIMIT = 256 * 1024
+# Запас на заголовки multipart при проверке Content-Length
+MULTIPART_OVERHEAD = 16 * 1024
+
+FILE_EXTENSIONS = {"JPEG": "jpg", "PNG": "png"}
+
+class UploadRejected(Exception):
+    """Загрузка отклонена"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+@dataclass
+class IngestedImage:
+    """Принятое и сохраненное изображение"""
+    path: str
+    filename: Optional[str]
+    format: str
+    width: int
+    height: int
+    size: int
+    sha256: str
+    created: bool  # False, если такой файл уже был сохранен раньше
+
+class _ImageSink:
+    """Прием одного файла: проверка заголовка, подсчет байт и запись на диск"""
+
+    def __init__(self, dest_dir: str, filename: Optional[str], max_bytes: int):
+        self.dest_dir = dest_dir
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.path: Optional[str] = None
+        self.probe = None
+        self._header = bytearray()
+        self._file: Optional[BinaryIO] = None
+        self._hash = hashlib.sha256()
+        self._temp_path: Optional[str] = None
+        self.created = False
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Image file is too large")
+        self._hash.update(data)
+
+        if self._file is not None:
+            self._file.write(data)
+            return
+
+        self._header.extend(data)
+        try:
+            self.probe = probe_image_header(bytes(self._header))
+        except ValueError:
+            raise UploadRejected(status.HTTP_400_BAD_REQUEST, "File must be a JPEG or PNG image")
+
+        if self.probe is None:
+            if len(self._header) > HEADER_PROBE_LIMIT:
+                raise UploadRejected(status.HTTP_400_BAD_REQUEST, "Image header is too large")
+            return
+
+        image_format, width, height = self.probe
+        if image_format not in SUPPORTED_FORMATS or not check_image_dimensions(width, height):
+            raise UploadRejected(
+                status.HTTP_400_BAD_REQUEST,
+                "Invalid image format or resolution. Please upload a valid medical image."
+            )
+
+        self._temp_path = os.path.join(self.dest_dir, f"{uuid.uuid4()}.part")
+        self._file = open(self._temp_path, "wb")
+        self._file.write(self._header)
+        self._header = bytearray()
+
+    def finish(self) -> IngestedImage:
+        self.close()
+        if self.probe is None:
+            raise UploadRejected(status.HTTP_400_BAD_REQUEST, "File must be a JPEG or PNG image")
+        image_format, width, height = self.probe
+
+        # Сохраняем файл под именем хэша содержимого
+        sha256 = self._hash.hexdigest()
+        self.path = os.path.join(self.dest_dir, f"{sha256}.{FILE_EXTENSIONS[image_format]}")
+        created = not os.path.exists(self.path)
+        if created:
+            os.replace(self._temp_path, self.path)
+        else:
+            os.remove(self._temp_path)
+            # Файл снова используется: очистка (remove_orphan_uploads) не удалит его до записи скана
+            os.utime(self.path)
+        self._temp_path = None
+        self.created = created
+
+        return IngestedImage(
+            path=self.path,
+            filename=self.filename,
+            format=image_format,
+            width=width,
+            height=height,
+            size=self.size,
+            sha256=sha256,
+            created=created
+        )
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        self.close()
+        if self._temp_path and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+        # Сохраненный файл не удаляется: тот же файл (по хэшу) мог уже принять
+        # другой запрос. Файлы без сканов удаляет remove_orphan_uploads
+
+async def ingest_images(
+    request: Request,
+    dest_dir: str,
+    field_name: str = "file",
+    max_files: int = 1,
+    max_bytes: int = MAX_UPLOAD_BYTES
+) -> List[IngestedImage]:
+    """
+    Потоковый прием изображений из multipart-запроса.
+    Бросает UploadRejected, если запрос или одно из изображений не прошли проверку.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadRejected(status.HTTP_400_BAD_REQUEST, "Request must be multipart/form-data")
+
+    # Отклоняем заведомо слишком большие запросы до чтения тела
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_files * (max_bytes + MULTIPART_OVERHEAD):
+            raise UploadRejected(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Request body is too large")
+
+    sinks: List[_ImageSink] = []
+    ingested: List[IngestedImage] = []
+    current: Optional[_ImageSink] = None
+    header_field = bytearray()
+    header_value = bytearray()
+    part_headers = {}
+    events = []
+
+    # Коллбеки парсера только накапливают события, обработка идет после каждого чанка
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        part_headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("headers", dict(part_headers)))
+        part_headers.clear()
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", b""))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event, payload in events:
+                if event == "headers":
+                    _, disposition = parse_options_header(payload.get(b"content-disposition", b""))
+                    name = disposition.get(b"name", b"").decode("utf-8", "replace")
+                    filename = disposition.get(b"filename")
+                    if name == field_name and filename is not None:
+                        if len(sinks) >= max_files:
+                            raise UploadRejected(status.HTTP_400_BAD_REQUEST, f"Too many files, maximum is {max_files}")
+                        current = _ImageSink(dest_dir, filename.decode("utf-8", "replace"), max_bytes)
+                        sinks.append(current)
+                elif event == "data" and current is not None:
+                    current.write(payload)
+                elif event == "end" and current is not None:
+                    ingested.append(current.finish())
+                    current = None
+            events.clear()
+        parser.finalize()
+        if current is not None:
+            raise UploadRejected(status.HTTP_400_BAD_REQUEST, "Incomplete multipart request")
+    except UploadRejected:
+        for sink in sinks:
+            sink.discard()
+        raise
+    except Exception:
+        for sink in sinks:
+            sink.discard()
+        raise UploadRejected(status.HTTP_400_BAD_REQUEST, "Malformed multipart request")
+
+    if not ingested:
+        raise UploadRejected(status.HTTP_400_BAD_REQUEST, f"Field '{field_name}' with an image file is required")
+    return ingested
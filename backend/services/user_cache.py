@@ -0,0 +1,107 @@
+# backend/services/user_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from models import User
+
+# Кэш аутентифицированных пользователей в памяти процесса.
+# Запрос с токеном получает не объект ORM, а неизменяемый снимок строки
+# users, отвязанный от сессии: его можно хранить между запросами и
+# передавать в потоки. Снимок живет не дольше USER_CACHE_TTL секунд, при
+# изменении или удалении пользователя через ORM в этом процессе он
+# удаляется после коммита; изменения из других процессов видны по истечении TTL.
+
+# Время жизни снимка пользователя (секунды)
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+# Максимальное количество пользователей в кэше
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    telegram_id: int
+    first_name: Optional[str]
+    last_name: Optional[str]
+    username: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    entitlement_epoch: int = 0
+
+_SNAPSHOT_COLUMNS = (
+    User.id, User.telegram_id, User.first_name, User.last_name,
+    User.username, User.created_at, User.updated_at,
+    func.coalesce(User.entitlement_epoch, 0)
+)
+
+class UserCache:
+    """LRU-кэш снимков пользователей с ограничением времени жизни"""
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, user_id: int) -> Optional[UserSnapshot]:
+        """Снимок пользователя из кэша или из базы данных (None - пользователя нет)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        row = db.execute(select(*_SNAPSHOT_COLUMNS).where(User.id == user_id)).first()
+        if row is None:
+            return None
+        snapshot = UserSnapshot(*row)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+# Кэш пользователей процесса
+user_cache = UserCache()
+
+_CHANGED_KEY = "changed_user_ids"
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            session.info.setdefault(_CHANGED_KEY, set()).add(obj.id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop(_CHANGED_KEY, ()):
+        user_cache.invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop(_CHANGED_KEY, None)
@@ -2,6 +2,12 @@
 import requests
 import json
 import time
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 
 BASE_URL = "http://localhost:8000"
 
@@ -27,6 +33,10 @@ def test_auth():
     auth_data = {
         "initData": "user=%7B%22id%22%3A12345%2C%22first_name%22%3A%22Test%22%2C%22username%22%3A%22testuser%22%7D"
     }
+    # Сервер с BOT_TOKEN принимает только подписанные initData
+    bot_token = os.getenv("BOT_TOKEN")
+    if bot_token:
+        auth_data["initData"] = make_init_data({"id": 12345, "first_name": "Test", "username": "testuser"}, bot_token)
     response = requests.post(f"{BASE_URL}/api/auth/", json=auth_data)
     assert response.status_code == 200
     data = response.json()
@@ -34,6 +44,45 @@ def test_auth():
     print("✅ Authentication passed")
     return data["access_token"]
 
+def make_init_data(user, bot_token):
+    """initData Telegram Web App, подписанный токеном бота"""
+    params = {"user": json.dumps(user, ensure_ascii=False), "auth_date": str(int(time.time()))}
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(params.items()))
+    secret_key = hmac.new(b"WebAppBotToken", bot_token.encode(), hashlib.sha256).digest()
+    params["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(params)
+
+def test_concurrent_first_logins(users=50, logins_per_user=4):
+    """
+    Тест одновременных первых входов: каждый новый пользователь входит параллельно несколько раз.
+    Создает users новых пользователей; нужен BOT_TOKEN сервера (initData подписывается).
+    """
+    bot_token = os.getenv("BOT_TOKEN")
+    assert bot_token, "Для теста одновременных входов задайте BOT_TOKEN, как у сервера"
+    print(f"🔍 Тестирование {users * logins_per_user} одновременных первых входов...")
+    base_id = int(time.time() * 1000)
+    telegram_ids = [base_id + i for i in range(users)] * logins_per_user
+    start = threading.Barrier(len(telegram_ids))
+
+    def login(telegram_id):
+        init_data = make_init_data({"id": telegram_id, "first_name": f"Load {telegram_id}"}, bot_token)
+        start.wait()
+        return telegram_id, requests.post(f"{BASE_URL}/api/auth/", json={"initData": init_data}, timeout=60)
+
+    with ThreadPoolExecutor(max_workers=len(telegram_ids)) as executor:
+        results = list(executor.map(login, telegram_ids))
+
+    failed = [response.status_code for _, response in results if response.status_code != 200]
+    assert not failed, f"Ошибки входа: {failed}"
+    user_ids = {}
+    for telegram_id, response in results:
+        user = response.json()["user"]
+        assert user["telegram_id"] == telegram_id
+        # Все входы одного пользователя получают одну и ту же запись
+        assert user_ids.setdefault(telegram_id, user["id"]) == user["id"]
+    assert len(set(user_ids.values())) == users
+    print("✅ Concurrent first logins passed")
+
 def test_subscription_plans():
     """Тест получения планов подписки"""
     print("🔍 Тестирование планов подписки...")
@@ -81,8 +130,8 @@ def test_with_auth(token):
     assert response.status_code == 200
     print("✅ History passed")
 
-def run_tests():
-    """Запуск всех тестов"""
+def run_tests(concurrent_logins=False):
+    """Запуск всех тестов (concurrent_logins - с нагрузочным тестом входов)"""
     print("🚀 Запуск тестов HealthScan API...\n")
     print("🌐 Фронтенд: https://moroz-froze-healtscan-project-cce0.twc1.net")
     print("🔧 Backend API: http://localhost:8000")
@@ -97,6 +146,8 @@ def run_tests():
         
         # Тест аутентификации
         token = test_auth()
+        if concurrent_logins:
+            test_concurrent_first_logins()
         
         # Тесты с аутентификацией
         test_with_auth(token)
@@ -117,4 +168,5 @@ def run_tests():
         print(f"❌ Неожиданная ошибка: {e}")
 
 if __name__ == "__main__":
-    run_tests()
+    import sys
+    run_tests(concurrent_logins="--concurrent-logins" in sys.argv)
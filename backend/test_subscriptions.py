@@ -0,0 +1,82 @@
+# backend/test_subscriptions.py
+# Проверка продления подписок (services/subscriptions.py) на базе SQLite в памяти.
+#
+# Запуск из каталога backend:
+#     python test_subscriptions.py
+# или
+#     python -m pytest test_subscriptions.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base, Subscription, SubscriptionStatus, SubscriptionType, User
+from services.subscriptions import process_due_subscriptions
+
+def make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+def add_subscription(db, end_date: datetime, auto_renew: bool = True) -> User:
+    user = User(telegram_id=1000 + db.query(User).count(), first_name="Test")
+    db.add(user)
+    db.flush()
+    db.add(Subscription(
+        user_id=user.id,
+        subscription_type=SubscriptionType.EXPRESS,
+        status=SubscriptionStatus.ACTIVE,
+        start_date=end_date - timedelta(days=30),
+        end_date=end_date,
+        auto_renew=auto_renew
+    ))
+    db.commit()
+    return user
+
+def test_long_expired_subscription_is_renewed_once():
+    db = make_session()
+    now = datetime(2026, 10, 1, 12, 0)
+    user = add_subscription(db, now - timedelta(days=200))
+
+    assert process_due_subscriptions(db, now) == {"renewed": 1, "expired": 0}
+
+    active = db.query(Subscription).filter(
+        Subscription.user_id == user.id,
+        Subscription.status == SubscriptionStatus.ACTIVE
+    ).all()
+    assert len(active) == 1
+    assert active[0].start_date == now
+    assert active[0].end_date == now + timedelta(days=30)
+    assert db.query(Subscription).filter(Subscription.user_id == user.id).count() == 2
+
+    # Повторный запуск ничего не меняет
+    assert process_due_subscriptions(db, now) == {"renewed": 0, "expired": 0}
+
+def test_subscription_is_not_renewed_before_end_date():
+    db = make_session()
+    now = datetime(2026, 10, 1, 12, 0)
+    add_subscription(db, now + timedelta(minutes=5))
+
+    assert process_due_subscriptions(db, now) == {"renewed": 0, "expired": 0}
+
+    # Продление после окончания: новый период начинается с момента продления
+    later = now + timedelta(minutes=10)
+    assert process_due_subscriptions(db, later) == {"renewed": 1, "expired": 0}
+    renewed = db.query(Subscription).filter(Subscription.status == SubscriptionStatus.ACTIVE).one()
+    assert renewed.start_date == later
+    assert renewed.end_date == later + timedelta(days=30)
+
+def test_subscription_without_auto_renew_expires():
+    db = make_session()
+    now = datetime(2026, 10, 1, 12, 0)
+    add_subscription(db, now - timedelta(days=200), auto_renew=False)
+
+    assert process_due_subscriptions(db, now) == {"renewed": 0, "expired": 1}
+    assert db.query(Subscription).filter(Subscription.status == SubscriptionStatus.ACTIVE).count() == 0
+
+if __name__ == "__main__":
+    test_long_expired_subscription_is_renewed_once()
+    test_subscription_is_not_renewed_before_end_date()
+    test_subscription_without_auto_renew_expires()
+    print("✅ Все проверки продления подписок пройдены")
@@ -32,6 +32,12 @@ class ApiClient {
 
     try {
       const response = await fetch(url, config);
+
+      // Сервер присылает токен с обновленным claim о подписке
+      const refreshedToken = response.headers.get('X-Access-Token');
+      if (refreshedToken) {
+        this.setToken(refreshedToken);
+      }
       
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({ message: 'Network error' }));